@@ -34,12 +34,39 @@ import decimal as dc
 import logging
 log = logging.getLogger(__name__)
 
-from itertools import cycle
+from functools import lru_cache
+
+@lru_cache(maxsize=32)
+def get_keystream(key, record_size, length):
+	""" Return the XOR keystream for a buffer of fixed-size records as an int.
+	The key cycle restarts at every record.
+	@param key: XOR key.
+	@param record_size: Size (in bytes) of each record.
+	@param length: Length (in bytes) of the buffer.
+	"""
+	s_record_key = (key * (record_size // len(key) + 1))[:record_size]
+	s_keystream = s_record_key * (length // record_size) + s_record_key[:length % record_size]
+	return int.from_bytes(s_keystream, 'little')
+
+def xor_crypt_records(data, key, record_size):
+	""" XOR encrypt/decrypt a buffer of fixed-size records in one go. The key cycle
+	restarts at every record, exactly as when each record is encrypted on its own.
+	@param data: Binary byte buffer.
+	@param key: XOR key.
+	@param record_size: Size (in bytes) of each record.
+	"""
+	length = len(data)
+	if length == 0:
+		return b''
+	keystream = get_keystream(bytes(key), record_size, length)
+	return (int.from_bytes(data, 'little') ^ keystream).to_bytes(length, 'little')
 
 def xor_crypt(data, key):
-	# For python 2, should use itertools.izip instead of zip
-	# zip returns a list in python2, but returns iterator in py3.
-	return b''.join([st.pack('B', x^y) for (x,y) in zip(data, cycle(key))])
+	""" XOR encrypt/decrypt a buffer, cycling the key from its first byte.
+	@param data: Binary byte buffer.
+	@param key: XOR key.
+	"""
+	return xor_crypt_records(data, key, len(data))
 
 class BinaryStruct(object):
 	""" Base class for all packed binary structures. e.g. ODF Headers, data, FIFO headers etc.
@@ -110,47 +137,113 @@ class BinaryStruct(object):
 		{'pad5' : 'L'},
 	]
 
+	d_codec_cache = {}
+
+	@classmethod
+	def get_padding_fields(cls, padding):
+		""" Return the padding field specifiers for the given no. of padding bytes.
+		@param padding: No. of bytes to append as padding. (None if zero)
+		"""
+		if padding is None:
+			return []
+		if padding == 6:
+			return cls._ld_append_6
+		elif padding == 16:
+			return cls._ld_append_16
+		elif padding == 24:
+			return cls._ld_append_24
+		elif padding == 28:
+			return cls._ld_append_28
+		elif padding == 32:
+			return cls._ld_append_32
+		elif padding == 36:
+			return cls._ld_append_36
+		raise ODFInvalidPadding()
+
+	@classmethod
+	def get_codec(cls, ld_fields=None, padding=None):
+		""" Return the compiled codec for a field layout as a tuple
+		(ld_fields incl. padding, list of field names, st.Struct).
+		Codecs are compiled once per layout and shared by all instances.
+		@param ld_fields: Field specifiers. (default: cls.ld_fields)
+		@param padding: No. of bytes to append as padding. (default: None if zero)
+		"""
+		if ld_fields is None:
+			ld_fields = cls.ld_fields
+		t_layout = (cls.s_endian, padding, tuple(tuple(d_field.items())[0] for d_field in ld_fields))
+		codec = BinaryStruct.d_codec_cache.get(t_layout)
+		if codec is None:
+			ld_fields = ld_fields + cls.get_padding_fields(padding)
+			ls_fields = [list(d_field.keys())[0] for d_field in ld_fields]
+			s_struct_fmt = cls.s_endian + ''.join([list(d_field.values())[0] for d_field in ld_fields])
+			codec = (ld_fields, ls_fields, st.Struct(s_struct_fmt))
+			BinaryStruct.d_codec_cache[t_layout] = codec
+		return codec
+
+	@classmethod
+	def get_struct(cls, ld_fields=None, padding=None):
+		""" Return the compiled st.Struct for a field layout.
+		@param ld_fields: Field specifiers. (default: cls.ld_fields)
+		@param padding: No. of bytes to append as padding. (default: None if zero)
+		"""
+		return cls.get_codec(ld_fields, padding)[2]
+
+	@classmethod
+	def unpack_records(cls, s_buf, ld_fields=None, padding=None, key=None, b_decimal=True):
+		""" Decode all records packed back-to-back in a binary buffer.
+		Returns a list of value tuples, in field order.
+		@param s_buf: Binary byte buffer, a multiple of the record size long.
+		@param ld_fields: Field specifiers. (default: cls.ld_fields)
+		@param padding: No. of bytes to append as padding. (default: None if zero)
+		@param key: XOR key, applied to each record separately. (default: None)
+		@param b_decimal: Convert floats to Decimals, as parse_bin_buf does. (default: True)
+		"""
+		st_struct = cls.get_struct(ld_fields, padding)
+		size = st_struct.size
+		if len(s_buf) % size != 0:
+			raise ODFException("Buffer of %d bytes is not a multiple of record size %d" % (len(s_buf), size))
+		if key is not None:
+			s_buf = xor_crypt_records(s_buf, key, size)
+		l_records = st_struct.iter_unpack(s_buf)
+		if not b_decimal:
+			return list(l_records)
+		return [tuple([dc.Decimal(str(x)) if type(x) is float else x for x in t_rec]) for t_rec in l_records]
+
+	@classmethod
+	def pack_records(cls, l_records, ld_fields=None, padding=None, key=None):
+		""" Encode a sequence of value tuples (in field order) back-to-back into one buffer.
+		@param l_records: Sequence of value tuples.
+		@param ld_fields: Field specifiers. (default: cls.ld_fields)
+		@param padding: No. of bytes to append as padding. (default: None if zero)
+		@param key: XOR key, applied to each record separately. (default: None)
+		"""
+		st_struct = cls.get_struct(ld_fields, padding)
+		size = st_struct.size
+		l_records = list(l_records)
+		buf = bytearray(size * len(l_records))
+		offset = 0
+		for t_rec in l_records:
+			st_struct.pack_into(buf, offset, *t_rec)
+			offset += size
+		buf = bytes(buf)
+		if key is not None:
+			buf = xor_crypt_records(buf, key, size)
+		return buf
+
 	def __init__(self, d_fields=None, padding=None):
 		""" Constructor for BinaryStruct base class.
 		@param padding: No. of bytes to append as padding. (default: None if zero)
 		"""
-		s_struct_fmt = self.s_endian
-		self.d_fields = {}
-
-		# Append the padding specifier to self.ld_fields
-		if padding is not None:
-			if padding == 6:
-				self.ld_fields = self.ld_fields + self._ld_append_6
-			elif padding == 16:
-				self.ld_fields = self.ld_fields + self._ld_append_16
-			elif padding == 24:
-				self.ld_fields = self.ld_fields + self._ld_append_24
-			elif padding == 28:
-				self.ld_fields = self.ld_fields + self._ld_append_28
-			elif padding == 32:
-				self.ld_fields = self.ld_fields + self._ld_append_32
-			elif padding == 36:
-				self.ld_fields = self.ld_fields + self._ld_append_36
-			else:
-				raise ODFInvalidPadding()
-
-		# Prepare the format string for binary decoing/encoding
-		# and create a dict object with some initial values for all fields
-		
-		for d_field in self.ld_fields:
-			s_width = list(d_field.values())[0]
-			s_field_name = list(d_field.keys())[0]
-			s_struct_fmt = s_struct_fmt + s_width
-			self.d_fields[s_field_name] = 0
+		# Look up the compiled codec for this layout (incl. padding), and create
+		# a dict object with some initial values for all fields
+		(self.ld_fields, self.ls_fields, self.st_struct) = self.get_codec(self.ld_fields, padding)
+		self.s_struct_fmt = self.st_struct.format
+		self.d_fields = dict.fromkeys(self.ls_fields, 0)
 
 		if d_fields is not None:
 			for k, v in d_fields.items():
 				self.d_fields[k] = v
 
-		# Compile the format string for packing/unpacking binary data
-		self.st_struct = st.Struct(s_struct_fmt)
-		self.s_struct_fmt = s_struct_fmt
-
 	def __str__(self):
 		""" Return the string representation of this type.
 		"""
@@ -159,16 +252,12 @@ class BinaryStruct(object):
 	def get_size(self):
 		""" Calculate and return the size (in bytes) of this binary structure.
 		"""
-		size = 0
-		for d_field in self.ld_fields:
-			size += self.d_size[list(d_field.values())[0]]
-		return size
+		return self.st_struct.size
 
 	def get_field_names(self):
 		""" Return a list of names of all binary fields in the order in which they appear.
 		"""
-		ls_fields = [ list(d_field.keys())[0] for d_field in self.ld_fields]
-		return ls_fields
+		return list(self.ls_fields)
 
 	def get_field(self, s_field):
 		""" Return the value for the speicifed field.
@@ -308,20 +397,10 @@ class BinaryStruct(object):
 	def to_bin(self, key=None):
 		""" Pack all values into a binary buffer, and return it.
 		"""
-		l_values = list([])
-		for d_field in self.ld_fields:
-			#print "Key : " + d_field.keys()[0]
-			#print "d_fields keys: " + ', '.join(self.d_fields.keys())
-			s_field_name = list(d_field.keys())[0]
-			l_values.append(self.d_fields[s_field_name])
-		#print(l_values)
-		#for val in l_values:
-		#	print(type(val))
-		#print(self.s_struct_fmt)
-		#print(*l_values)
+		l_values = [self.d_fields[s_field_name] for s_field_name in self.ls_fields]
 		buf = b''
 		try:
-			buf = st.pack(self.s_struct_fmt, *l_values)
+			buf = self.st_struct.pack(*l_values)
 		except:
 			for value in l_values:
 				log.debug(type(value))
@@ -27,13 +27,21 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
 from odfexcept import *
-from binary import BinaryStruct
+from binary import BinaryStruct, xor_crypt_records
 import decimal as dc
+import math
+import os
 import re
+import time
+from array import array
+from collections import OrderedDict
 
 import logging
 log = logging.getLogger(__name__)
 
+# Largest value a ShortChunk field ('H') can hold.
+MAX_SHORT_VALUE = 65535
+
 class ChunkHeader(BinaryStruct):
 	ld_fields = [
 			# {'<field_name>' : 'x/c/...' },
@@ -222,18 +230,58 @@ class ChunkArray(object):
 			#log.debug(self.to_csv())
 			raise
 
+	def get_header(self):
+		return self.d_chunk_arr[self.chunk_size+1]
+
 	def get_header_field(self, s_hdr_field_name):
-		val = self.d_chunk_arr[self.chunk_size+1][s_hdr_field_name]
+		val = self.get_header()[s_hdr_field_name]
 		#log.debug(val)
 		return val
 
 	def set_header_field(self, s_hdr_field_name, value):
-		self.d_chunk_arr[self.chunk_size+1][s_hdr_field_name] = value
+		self.get_header()[s_hdr_field_name] = value
 
 	def set_header(self, d_chunk_header):
 		#log.debug(d_chunk_header)
 		self.d_chunk_arr[self.chunk_size+1] = d_chunk_header
 
+	def get_column(self, s_field_name):
+		""" Return s_field_name of records 1..chunk_size as a list.
+		"""
+		return [self.get_field(recno, s_field_name) for recno in range(1, self.chunk_size+1)]
+
+	def fill_price_range(self, start, stop, value):
+		""" Set OPEN, HIGH, LOW & CLOSE of the records at indices start..stop-1
+		(recnos start+1..stop) to value.
+		"""
+		for recno in range(start+1, stop+1):
+			for s_field in ['OPEN', 'HIGH', 'LOW', 'CLOSE']:
+				self.set_field(recno, s_field, value)
+
+	def fill_empty_records(self):
+		""" Back-fill the records before the first positive OPEN with that OPEN,
+		then forward-fill the records after the last positive CLOSE with that CLOSE.
+		If there is no positive OPEN, records 1..chunk_size-1 are zeroed. 
+		"""
+		if self.chunk_size < 1:
+			return
+		l_open = self.get_column('OPEN')
+		first = next((i for (i, f_open) in enumerate(l_open) if f_open > 0), None)
+		if first is None:
+			(first, first_open) = (self.chunk_size - 1, 0)
+		else:
+			first_open = l_open[first]
+		self.fill_price_range(0, first, first_open)
+
+		# The back-fill may have set some CLOSEs, so look them up afresh.
+		l_close = self.get_column('CLOSE')
+		last = next((i for i in range(self.chunk_size-1, -1, -1) if l_close[i] > 0), None)
+		if last is None:
+			(last, last_close) = (0, 0)
+		else:
+			last_close = l_close[last]
+		self.fill_price_range(last+1, self.chunk_size, last_close)
+
 	def highest_volume(self):
 		highest_volume = 0
 		for i in range(self.chunk_size):
@@ -259,27 +307,52 @@ class ChunkArray(object):
 		'''
 		return lowest_low
 
-	def to_bin_short(self, key=None):
-		buf = b''
-		null_chunk_rec = ShortChunk()
+	def iter_records(self, chunk_class):
+		""" Iterate over records 1..chunk_size as tuples in the field order
+		of chunk_class. Missing records come out as null records.
+		@param chunk_class: ShortChunk or Chunk.
+		"""
+		ls_fields = chunk_class.get_codec()[1]
+		t_null = (0,) * len(ls_fields)
 		for recno in range(1, self.chunk_size+1):
 			if recno in self.d_chunk_arr:
 				d_fields = self.d_chunk_arr[recno]
-				chunk_rec = ShortChunk(d_fields=d_fields)
-				try:
-					buf = buf + chunk_rec.to_bin(key)
-				except:
-					log.error(chunk_rec.d_fields)
-					log.error(self.get_name())
-					log.error(self.to_csv())
-					raise
+				yield tuple([d_fields.get(s_field, 0) for s_field in ls_fields])
 			else:
-				buf = buf + null_chunk_rec.to_bin(key)
-		d_hdr_fields = self.d_chunk_arr[self.chunk_size + 1]
-		chunk_hdr_rec = ShortChunkHeader(d_fields=d_hdr_fields)
-		buf += chunk_hdr_rec.to_bin(key)
+				yield t_null
 
-		return buf
+	def set_records(self, l_records, chunk_class):
+		""" Store records 1..chunk_size from a sequence of tuples in the
+		field order of chunk_class.
+		@param chunk_class: ShortChunk or Chunk.
+		"""
+		ls_fields = chunk_class.get_codec()[1]
+		for i, t_rec in enumerate(l_records):
+			self.d_chunk_arr[i+1] = dict(zip(ls_fields, t_rec))
+
+	def pack_records(self, chunk_class, key=None):
+		""" Pack records 1..chunk_size into one buffer with the bulk codec of
+		chunk_class. Missing records are packed as null records.
+		@param chunk_class: ShortChunk or Chunk.
+		@param key: XOR key. (default: None)
+		"""
+		return chunk_class.pack_records(self.iter_records(chunk_class), key=key)
+
+	def read_records(self, s_buf, chunk_class, key=None):
+		""" Decode records 1..chunk_size from a binary buffer in one go.
+		@param s_buf: Binary byte buffer holding exactly chunk_size records.
+		@param chunk_class: ShortChunk or Chunk.
+		@param key: XOR key. (default: None)
+		"""
+		self.set_records(chunk_class.unpack_records(s_buf, key=key), chunk_class)
+
+	def to_bin_short(self, key=None):
+		try:
+			return encode_short_chunk_file(self.iter_records(ShortChunk), self.get_header(), key)
+		except:
+			log.error(self.get_name())
+			log.error(self.to_csv())
+			raise
 	
 	def to_csv(self):
 		buf = ''
@@ -290,8 +363,7 @@ class ChunkArray(object):
 				chunk_rec = ShortChunk(d_fields=d_fields)
 				buf = buf + str(chunk_rec) + '\n'
 
-		d_hdr_fields = self.d_chunk_arr[self.chunk_size + 1]
-		chunk_hdr_rec = ShortChunkHeader(d_fields=d_hdr_fields)
+		chunk_hdr_rec = ShortChunkHeader(d_fields=self.get_header())
 		buf += str(chunk_hdr_rec) + '\n'
 		return buf
 	
@@ -311,59 +383,150 @@ class ChunkArray(object):
 
 	def to_bin_long(self, key=None):
 
-		buf = b''
-		null_chunk_rec = Chunk()
-		for recno in range(1, self.chunk_size+1):
-			if recno in self.d_chunk_arr:
-				d_fields = self.d_chunk_arr[recno]
-				chunk_rec = Chunk(d_fields=d_fields)
-				buf += chunk_rec.to_bin(key)
-			else:
-				buf = buf + null_chunk_rec.to_bin(key)
+		buf = self.pack_records(Chunk, key)
 
-		d_hdr_fields = self.d_chunk_arr[self.chunk_size + 1]
-		chunk_hdr_rec = ChunkHeader(d_fields=d_hdr_fields)
+		chunk_hdr_rec = ChunkHeader(d_fields=self.get_header())
 		buf += chunk_hdr_rec.to_bin(key)
 
 		return buf
 
 	def read_bin_long(self, fp_bin, key=None):
-		chunk_size = self.chunk_size
-		for i in range(chunk_size):
-			chunk = Chunk()
-			chunk.read_bin_stream(fp_bin, key)
-			# Check if record size is correct (40 bytes)
-			if not (chunk.get_size() == self.long_chunk_size):
-				raise ODFException("Failed Chunk Integrity Test.")
-
-			self.d_chunk_arr[i+1] = chunk.to_dict()
+		# Check if record size is correct (40 bytes)
+		if not (Chunk.get_struct().size == self.long_chunk_size):
+			raise ODFException("Failed Chunk Integrity Test.")
+		read_size = self.chunk_size * self.long_chunk_size
+		s_buf = fp_bin.read(read_size)
+		if len(s_buf) < read_size:
+			raise ODFEOF()
+		self.read_records(s_buf, Chunk, key)
+
 		chunk_hdr_rec = ChunkHeader()
 		chunk_hdr_rec.read_bin_stream(fp_bin, key)
-		self.d_chunk_arr[self.chunk_size+1] = chunk_hdr_rec.to_dict()	
+		self.set_header(chunk_hdr_rec.to_dict())
 		
-		if 'VOLUME_TICK' not in self.d_chunk_arr[self.chunk_size+1]:
+		if 'VOLUME_TICK' not in self.get_header():
 			raise ODFException("Failed integrity test.")	
 
 	def read_bin_short(self, fp_bin, key):
-		chunk_size = self.chunk_size
-		for i in range(chunk_size):
-			chunk = ShortChunk()
-			chunk.read_bin_stream(fp_bin, key)
-			# Check if record size is correct (10 bytes)
-			if not (chunk.get_size() == self.short_chunk_size):
-				raise ODFException("Failed ShortChunk Integrity Test.")
+		# Check if record size is correct (10 bytes)
+		if not (ShortChunk.get_struct().size == self.short_chunk_size):
+			raise ODFException("Failed ShortChunk Integrity Test.")
+		if not (ShortChunkHeader.get_struct().size == self.short_chunk_size):
+			raise ODFException("Failed ShortChunk Integrity Test.")
 
-			self.d_chunk_arr[i+1] = chunk.to_dict()
+		self.read_buf_short(fp_bin.read((self.chunk_size + 1) * self.short_chunk_size), key)
 
-		chunk_hdr_rec = ShortChunkHeader()
-		chunk_hdr_rec.read_bin_stream(fp_bin, key)
-		self.d_chunk_arr[self.chunk_size+1] = chunk_hdr_rec.to_dict()		
-		if 'VOLUME_TICK' not in self.d_chunk_arr[self.chunk_size+1]:
+	def read_buf_short(self, s_buf, key):
+		""" Load records & header from the contents of a short chunk file.
+		"""
+		(l_records, d_header) = decode_short_chunk_file(s_buf, self.chunk_size, key)
+		self.set_records(l_records, ShortChunk)
+		self.set_header(d_header)
+		if 'VOLUME_TICK' not in self.get_header():
 			raise ODFException("Failed integrity test.")	
 
 	def length(self):
 		return len(self.d_chunk_arr)
 
+class DenseChunkArray(ChunkArray):
+	""" ChunkArray that keeps OPEN/HIGH/LOW/CLOSE/VOLUME of records
+	1..chunk_size in one array per field instead of a dict per record.
+	The header lives in its own dict. Records that were never set are 0.
+	"""
+
+	ls_fields = ['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME']
+
+	def __init__(self, s_chunk_file_name=None, chunk_size=0, debug_id=0, typecode='d'):
+		""" 
+		@param typecode: array typecode of the columns, 'd' for long chunks,
+						an integer typecode (e.g. 'q') for short chunks.
+		"""
+		super(DenseChunkArray, self).__init__(s_chunk_file_name, chunk_size, debug_id)
+		self.typecode = typecode
+		self.d_columns = {}
+		for s_field in self.ls_fields:
+			self.d_columns[s_field] = array(typecode, [0]) * chunk_size
+		self.d_header = None
+
+	def get_column(self, s_field_name):
+		""" Return the array holding s_field_name of records 1..chunk_size.
+		"""
+		return self.d_columns[s_field_name]
+
+	def set_column(self, s_field_name, values):
+		""" Replace s_field_name of records 1..chunk_size in one go.
+		@param values: Iterable of exactly chunk_size values.
+		"""
+		column = array(self.typecode, values)
+		if len(column) != self.chunk_size:
+			raise ODFException("Column %s has %d values, expected %d" % 
+							(s_field_name, len(column), self.chunk_size))
+		self.d_columns[s_field_name] = column
+
+	def set_field(self, recno, s_field_name, value):
+		if recno < 1 or recno > self.chunk_size:
+			raise IndexError("recno %d out of range" % recno)
+		self.d_columns[s_field_name][recno-1] = value
+
+	def get_field(self, recno, s_field_name):
+		try:
+			if recno < 1 or recno > self.chunk_size:
+				raise IndexError("recno %d out of range" % recno)
+			return self.d_columns[s_field_name][recno-1]
+		except:
+			log.error(self.get_name())
+			log.error(self.s_file)
+			log.error(self.debug_id)
+			log.error(recno)
+			log.error(s_field_name)
+			raise
+
+	def fill_price_range(self, start, stop, value):
+		if stop <= start:
+			return
+		column = array(self.typecode, [value]) * (stop - start)
+		for s_field in ['OPEN', 'HIGH', 'LOW', 'CLOSE']:
+			self.d_columns[s_field][start:stop] = column
+
+	def get_header(self):
+		return self.d_header
+
+	def set_header(self, d_chunk_header):
+		self.d_header = d_chunk_header
+
+	def highest_volume(self):
+		highest_volume = max(self.d_columns['VOLUME'], default=0)
+		if highest_volume > 0:
+			return highest_volume
+		return 0
+
+	def lowest_low(self):
+		return min([low for low in self.d_columns['LOW'] if 0 < low < 999999999], default=0)
+
+	def iter_records(self, chunk_class):
+		""" Iterate over records 1..chunk_size as tuples in the field
+		order of chunk_class.
+		"""
+		return zip(*[self.d_columns[s_field] for s_field in chunk_class.get_codec()[1]])
+
+	def set_records(self, l_records, chunk_class):
+		ls_fields = chunk_class.get_codec()[1]
+		if len(l_records) != self.chunk_size:
+			raise ODFEOF()
+		for s_field, t_column in zip(ls_fields, zip(*l_records)):
+			self.set_column(s_field, t_column)
+
+	def to_csv(self):
+		buf = ''.join(["%d,%d,%d,%d,%d\n" % t_rec for t_rec in self.iter_records(ShortChunk)])
+		chunk_hdr_rec = ShortChunkHeader(d_fields=self.get_header())
+		buf += str(chunk_hdr_rec) + '\n'
+		return buf
+
+	def length(self):
+		if self.d_header is None:
+			return self.chunk_size
+		return self.chunk_size + 1
+
 class ChunkArrayList(object):
 
 	def __init__(self):
@@ -385,21 +548,199 @@ class ChunkArrayList(object):
 	def length(self):
 		return len(self.l_chunk_list)
 
-def read_short_chunk_array(s_chunk_file_path, s_chunk_file_name, chunk_size, key=None):
+def quantise_records(l_records, tick, volume_tick):
+	""" Convert long chunk records (prices, volume) into short chunk records
+	(no. of ticks, no. of volume ticks), rounding down.
+	Raises ODFException if a value does not fit in a ShortChunk field.
+	@param l_records: Sequence of (OPEN, HIGH, LOW, CLOSE, VOLUME) tuples.
+	@param tick: Price tick.
+	@param volume_tick: Volume tick.
+	"""
+	f_tick = float(tick)
+	floor = math.floor
+	l_short = [(floor(f_open / f_tick), floor(f_high / f_tick), floor(f_low / f_tick), 
+				floor(f_close / f_tick), floor(f_volume / volume_tick))
+				for (f_open, f_high, f_low, f_close, f_volume) in l_records]
+	if l_short:
+		max_value = max(map(max, l_short))
+		min_value = min(map(min, l_short))
+		if max_value > MAX_SHORT_VALUE or min_value < 0:
+			raise ODFException("Chunk value out of range [0, %d]: min=%d, max=%d (tick=%s, volume_tick=%s)" % 
+							(MAX_SHORT_VALUE, min_value, max_value, tick, volume_tick))
+	return l_short
+
+def dequantise_records(l_records, tick, volume_tick):
+	""" Convert short chunk records (no. of ticks, no. of volume ticks)
+	back into long chunk records (prices, volume).
+	@param l_records: Sequence of (OPEN, HIGH, LOW, CLOSE, VOLUME) tuples.
+	@param tick: Price tick.
+	@param volume_tick: Volume tick.
+	"""
+	f_tick = float(tick)
+	return [(h_open * f_tick, h_high * f_tick, h_low * f_tick, h_close * f_tick, h_volume * volume_tick)
+			for (h_open, h_high, h_low, h_close, h_volume) in l_records]
+
+def encode_short_chunk_file(l_records, d_header, key=None):
+	""" Encode the contents of a short chunk (.fce) file: the ShortChunk
+	records followed by the ShortChunkHeader. Records and header are all
+	10 bytes long, so the whole buffer is encrypted in one call.
+	@param l_records: Sequence of (OPEN, HIGH, LOW, CLOSE, VOLUME) tuples.
+	@param d_header: ShortChunkHeader fields.
+	@param key: XOR key. (default: None)
+	"""
+	buf = ShortChunk.pack_records(l_records)
+	buf += ShortChunkHeader(d_fields=d_header).to_bin()
+	if key is not None:
+		buf = xor_crypt_records(buf, key, ShortChunk.get_struct().size)
+	return buf
+
+def decode_short_chunk_file(s_buf, chunk_size, key=None):
+	""" Decode the contents of a short chunk (.fce) file, decrypting it in one call.
+	Returns (list of (OPEN, HIGH, LOW, CLOSE, VOLUME) tuples, header dict).
+	@param s_buf: Binary byte buffer holding chunk_size records and the header.
+	@param chunk_size: No. of records in the chunk.
+	@param key: XOR key. (default: None)
+	"""
+	record_size = ShortChunk.get_struct().size
+	header_offset = chunk_size * record_size
+	if len(s_buf) < header_offset + ShortChunkHeader.get_struct().size:
+		raise ODFEOF()
+	if key is not None:
+		s_buf = xor_crypt_records(s_buf, key, record_size)
+	l_records = ShortChunk.unpack_records(s_buf[:header_offset], b_decimal=False)
+	ls_hdr_fields = ShortChunkHeader.get_codec()[1]
+	t_hdr = ShortChunkHeader.get_struct().unpack_from(s_buf, header_offset)
+	return (l_records, dict(zip(ls_hdr_fields, t_hdr)))
+
+def read_short_chunk_array(s_chunk_file_path, s_chunk_file_name, chunk_size, key=None, b_dense=False):
 
 	#log.debug(s_chunk_file_name)
 	fp_chunk = open(s_chunk_file_path, "rb")
 
-	chunk_array = ChunkArray(s_chunk_file_name, chunk_size, debug_id=1)
-
-	chunk_array.read_bin_short(fp_chunk, key)
+	s_buf = fp_chunk.read()
 
 	fp_chunk.close()
 	
+	return read_short_chunk_buf(s_buf, s_chunk_file_name, chunk_size, key, b_dense)
+
+def read_short_chunk_buf(s_buf, s_chunk_file_name, chunk_size, key=None, b_dense=False):
+	""" Same as read_short_chunk_array, from the contents of the chunk file.
+	"""
+	if b_dense:
+		chunk_array = DenseChunkArray(s_chunk_file_name, chunk_size, debug_id=1, typecode='q')
+	else:
+		chunk_array = ChunkArray(s_chunk_file_name, chunk_size, debug_id=1)
+
+	chunk_array.read_buf_short(s_buf, key)
+
 	chunk_array.s_file = s_chunk_file_name
 	
 	return chunk_array
 
+class ChunkCache(object):
+	""" LRU cache of short chunk file contents (encrypted, as stored), by local path.
+
+	Each entry remembers the stamp (inode, mtime, size) of the local file when it was
+	read or written, and is only used while the file still has that stamp, so changes
+	made behind the cache's back (other processes, clear_state) are picked up.
+	Chunk files all have the same size, and a rewrite soon after the entry was made
+	may keep the mtime on filesystems with coarse timestamps. Such entries are checked
+	against the file contents, until the file is older than the mtime resolution.
+	An entry is clean when the local file and the remote store are known to hold the
+	same contents: this process has just written both, or just downloaded the file.
+	Writing clean contents again can be skipped.
+	"""
+
+	def __init__(self, max_entries=0):
+		""" Constructor
+		@param max_entries: Max. no. of chunk files to hold. 0 disables the cache. (default: 0)
+		"""
+		self.max_entries = max_entries
+		# s_path -> [stamp, s_buf, b_clean, b_racy]
+		self.d_entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+		self.skipped_writes = 0
+
+	# Coarsest mtime resolution allowed for (FAT: 2 seconds).
+	MTIME_RESOLUTION_NS = 2 * 10**9
+
+	def get_stamp(self, s_path):
+		try:
+			st_chunk = os.stat(s_path)
+		except OSError:
+			return None
+		return (st_chunk.st_ino, st_chunk.st_mtime_ns, st_chunk.st_size)
+
+	def is_racy(self, stamp):
+		""" Could the file be rewritten, or have been since stamp was taken,
+		without its mtime changing? 
+		"""
+		return stamp is not None and time.time_ns() - stamp[1] < self.MTIME_RESOLUTION_NS
+
+	def read_file(self, s_path):
+		try:
+			fp_chunk = open(s_path, "rb")
+		except (IOError, OSError):
+			return None
+		try:
+			return fp_chunk.read()
+		finally:
+			fp_chunk.close()
+
+	def get_entry(self, s_path):
+		entry = self.d_entries.get(s_path)
+		if entry is None:
+			return None
+		if entry[0] != self.get_stamp(s_path):
+			del self.d_entries[s_path]
+			return None
+		if entry[3]:
+			# Taken before reading: writes after this get a new mtime.
+			b_racy = self.is_racy(entry[0])
+			if self.read_file(s_path) != entry[1]:
+				del self.d_entries[s_path]
+				return None
+			entry[3] = b_racy
+		self.d_entries.move_to_end(s_path)
+		return entry
+
+	def get(self, s_path):
+		""" Return the cached contents of the chunk file at s_path, or None.
+		"""
+		entry = self.get_entry(s_path)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.hits += 1
+		return entry[1]
+
+	def put(self, s_path, s_buf, b_clean=False):
+		""" Record that the chunk file at s_path holds s_buf.
+		@param b_clean: s_buf has just been written locally and to the remote store,
+		or downloaded from the remote store.
+		"""
+		if self.max_entries <= 0:
+			return
+		stamp = self.get_stamp(s_path)
+		self.d_entries[s_path] = [stamp, s_buf, b_clean, self.is_racy(stamp)]
+		self.d_entries.move_to_end(s_path)
+		while len(self.d_entries) > self.max_entries:
+			self.d_entries.popitem(last=False)
+
+	def is_dirty(self, s_path, s_buf):
+		""" Does s_buf need writing to s_path? False only if the entry for s_path
+		is clean with exactly s_buf, and the file has not changed since.
+		"""
+		entry = self.get_entry(s_path)
+		if entry is not None and entry[2] and entry[1] == s_buf:
+			self.skipped_writes += 1
+			return False
+		return True
+
+	def clear(self):
+		self.d_entries.clear()
+
 def make_chunk_file_name(L_no, fce_jsunnoon, chunk_no, s_odf_basename):
 	
 	#log.debug(s_odf_basename)
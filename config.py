@@ -26,6 +26,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 '''
 import decimal as dc
+import copy
 
 import logging
 log = logging.getLogger(__name__)
@@ -119,7 +120,12 @@ class Config(object):
 			self.b_test_mode = bool(d_settings["TEST_MODE"])
 
 			self.b_do_csv_chunk = bool(d_settings["DO_CSV_CHUNK"])
+			self.b_odf_array_store = bool(d_settings["ODF_ARRAY_STORE"])
+			self.b_fixed_point = bool(d_settings["FIXED_POINT_PRICES"])
+			self.b_incremental_odf = bool(d_settings["INCREMENTAL_ODF"])
+			self.b_dense_chunk_array = bool(d_settings["DENSE_CHUNK_ARRAY"])
 			self.chunk_size = int(d_settings["CHUNK_SIZE"])
+			self.chunk_cache_size = int(d_settings["CHUNK_CACHE_SIZE"])
 			
 			self.first_jsunnoon = int(d_settings["FIRST_JSUNNOON"])
 		
@@ -165,6 +171,14 @@ class Config(object):
 		except:
 			raise
 
+	def clone(self):
+		""" Return a per-ODF copy of this config, without re-reading the settings file.
+		The ODF-specific values (tick, ohlc_divider, highest_recno, ...) set on the
+		copy do not leak back. The parsed settings themselves are shared, and must
+		be treated as read-only.
+		"""
+		return copy.copy(self)
+
 	def  get_dd_data_root(self):
 		if self.b_test_mode:
 			return self.s_local_dd_data_root
@@ -17,14 +17,18 @@ class FCEContext(object):
                 s3_store,
                 s_app_dir,
                 s_exchange, 
-                s_odf_dd):
+                s_odf_dd,
+                base_config=None):
         
         super(FCEContext, self).__init__()
 
-        # Store a copy of the config        
-        self.config = config.Config()
-        
-        self.config.read_settings(s_settings_file)
+        # Store a copy of the config. Cloning an already parsed config saves
+        # re-reading the settings file for every ODF.
+        if base_config is not None:
+            self.config = base_config.clone()
+        else:
+            self.config = config.Config()
+            self.config.read_settings(s_settings_file)
         
         self.dd_store = dd_store
         
@@ -42,11 +46,11 @@ class FCEContext(object):
         
         self.s_symbol = dd_store.get_odf_symbol(self.s_odf_basename)
         
+        self.init_fifo_paths(self.s_exchange_basename, self.s_odf_basename)
+        
         self.odf_obj = self.load_odf(self.config, self.s_exchange_basename, self.s_odf_dd)
         
         self.init_fce_paths(self.s3_store, self.s_app_dir, self.s_exchange_basename, self.s_symbol, self.s_odf_basename)
-
-        self.init_fifo_paths(self.s_exchange_basename, self.s_odf_basename)
     
     def load_public_from_odf(self, odf_obj, config):
     
@@ -88,13 +92,59 @@ class FCEContext(object):
         
         ''' Load the odf object
         '''
-        odf_obj = self.dd_store.open_odf(s_exchange_basename, s_odf_dd)
+        odf_obj = None
+        if config.b_incremental_odf:
+            odf_obj = self.load_odf_tail(config, s_exchange_basename, s_odf_dd)
+        if odf_obj is None:
+            odf_obj = self.dd_store.open_odf(s_exchange_basename, s_odf_dd)
         '''
         Load public variables from odf_obj
         '''
         self.load_public_from_odf(odf_obj, config)
         return odf_obj
         
+    def load_odf_tail(self, config, s_exchange_basename, s_odf_dd):
+        
+        ''' Load only the ODF headers and the records from LAST_FCED_RECNO onwards.
+        Returns None when the whole ODF is needed: when the ODF-specific headers
+        still have to be derived from it, or when the FIFO has to be (re)built.
+        '''
+        d_headers = self.dd_store.read_odf_headers(s_odf_dd)
+        if d_headers is None:
+            return None
+
+        for storloc in [config.tick_storloc, 
+                        config.ohlc_divider_storloc, 
+                        config.last_fced_recno_storloc, 
+                        config.highest_recno_storloc, 
+                        config.highest_recno_close_storloc, 
+                        config.prev_highest_recno_close_storloc]:
+            if d_headers[storloc] == 0:
+                return None
+
+        # Same age limit as Odf2Fce.refresh_fifo
+        if not self.dd_store.fifo_exists(self.s_fifo_dd, self.s_fifo_basename) or \
+            self.dd_store.is_fifo_older_than(self.s_fifo_dd, self.s_fifo_basename, 25):
+            return None
+
+        return self.dd_store.open_odf_tail(s_exchange_basename, s_odf_dd, 
+                                           int(d_headers[config.last_fced_recno_storloc]))
+
+    def reload_odf(self):
+
+        ''' Replace a partially loaded ODF by the whole ODF.
+        '''
+        self.odf_obj.close()
+        self.odf_obj = self.dd_store.open_odf(self.s_exchange_basename, self.s_odf_dd)
+        return self.odf_obj
+
+    def close(self):
+
+        ''' Release the ODF. A memory-mapped ODF must not outlive its processing:
+        the file may be rewritten under the mapping afterwards.
+        '''
+        self.odf_obj.close()
+
     def init_fifo_paths(self, s_exchange_basename, s_odf_basename):
         ''' Make FIFO name for this ODF from the ODF's basename
         '''
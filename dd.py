@@ -31,11 +31,14 @@ import os.path
 import decimal as dc
 import time
 import re
+import random
 import threading
 import queue
+from concurrent import futures
 import glob
 import datetime as dt
 import shutil
+from collections import OrderedDict
 
 import boto.dynamodb
 from boto.dynamodb.item import Item
@@ -85,9 +88,38 @@ class AbstractDDStore(object):
 	def open_odf(self, s_exchange, s_odf_dd):
 		pass
 
+	def read_odf_headers(self, s_odf_dd):
+		""" Return the ODF's header values by storloc, without loading the ODF,
+		or None if the store cannot do this.
+		"""
+		return None
+
+	def open_odf_tail(self, s_exchange, s_odf_dd, from_recno):
+		""" Open the ODF loading only headers and records from from_recno onwards.
+		Stores that cannot do this load the whole ODF.
+		"""
+		return self.open_odf(s_exchange, s_odf_dd)
+
 	def save_odf(self, s_odf_dd, s_odf_basename, odf_obj):
 		pass
 
+	def shutdown(self):
+		""" Release any threads or connections held by the store.
+		"""
+		pass
+
+	def get_odf_stamp(self, s_exchange, s_odf_dd):
+		""" Return a value that changes whenever the ODF changes, or None if the
+		store cannot tell (the ODF is then always treated as changed).
+		"""
+		return None
+
+	def pop_saved_odf_stamp(self, s_odf_dd):
+		""" Return, and forget, the ODF's stamp as of right after this store last
+		saved it. None if the store has not saved the ODF since the last call.
+		"""
+		return None
+
 	def get_fifo_dir(self, s_exchange, s_odf_basename):
 		pass
 
@@ -121,39 +153,55 @@ class IOWorker(threading.Thread):
 		Hands off task to the actual worker method.
 
 		This method expects each input queue entry to have the folowing structure:
-		[ <fn_work_method>, [<l_work_method_args>]]
+		[ <fn_work_method>, [<l_work_method_args>], <future>]
 		fn_work_method: method object, the worker method that actually does all the work.
 		l_work_method_args: Liost of arguments to pass to fn_work_method
+		future: concurrent.futures.Future that receives the result or exception.
+		A None entry tells the worker to exit.
 		"""
 		while True:
 			l_param = self.queue.get()
-			fn_work_method = l_param[0]
-			l_work_method_args = l_param[1]
-			try:
-				fn_work_method(*l_work_method_args)
-			except:
-				log.exception("Failed task")
-				pass
+			if l_param is None:
+				self.queue.task_done()
+				break
+			fn_work_method, l_work_method_args, future = l_param
+			if future.set_running_or_notify_cancel():
+				try:
+					future.set_result(fn_work_method(*l_work_method_args))
+				except BaseException as e:
+					log.exception("Failed task")
+					future.set_exception(e)
 			self.queue.task_done()
 
 class IOScheduler(object):
 	""" Scheduler class for multi-threaded I/O
+
+	The worker threads are long lived: start them once, queue any number of
+	requests, and shut the scheduler down when done. The queue is bounded, so
+	queue_request blocks while max_queue_size requests are waiting.
 	"""
-	def __init__(self, num_threads=4):
+	def __init__(self, num_threads=4, max_queue_size=0):
 		""" Constructor
 		@param num_threads: No. of threads to create. (default: 4)
+		@param max_queue_size: Max. no. of queued requests (default: 0=unbounded)
 		"""
 		self.num_threads = num_threads
-		self.queue = queue.Queue()
+		self.queue = queue.Queue(max_queue_size)
+		self.l_workers = []
+		self.lock = threading.Lock()
 		super(IOScheduler, self).__init__()
 
 	def start_workers(self):
-		""" Start the worker threads in daemon mode.
+		""" Start the worker threads in daemon mode, if not already running.
 		"""
-		for i in range(self.num_threads):
-			t = IOWorker(self.queue)
-			t.setDaemon(True)
-			t.start()
+		with self.lock:
+			if self.l_workers:
+				return
+			for i in range(self.num_threads):
+				t = IOWorker(self.queue)
+				t.daemon = True
+				t.start()
+				self.l_workers.append(t)
 
 	def wait_for_workers(self):
 		""" Wait for all threaded tasks to complete.
@@ -167,10 +215,103 @@ class IOScheduler(object):
 		@param l_work_method_args: List fo arguments to pass to worker method object
 		@param b_block: Block while waiting to ut items on queue (defauilt: True)
 		@param timeout: Timeout value if blocking call. (default:None=indefinite)
+		@return: concurrent.futures.Future for the request.
 		"""
-		l_req_obj = [fn_work_method, l_work_method_args]
+		future = futures.Future()
+		l_req_obj = [fn_work_method, l_work_method_args, future]
 		self.queue.put(l_req_obj, b_block, timeout)
-    
+		return future
+
+	def shutdown(self, b_wait=True):
+		""" Stop the worker threads once the requests already queued are done.
+		@param b_wait: Wait for the worker threads to exit (default: True)
+		"""
+		with self.lock:
+			l_workers = self.l_workers
+			self.l_workers = []
+		for t in l_workers:
+			self.queue.put(None)
+		if b_wait:
+			for t in l_workers:
+				t.join()
+
+class TokenBucket(object):
+	""" Thread-safe token bucket used to pace DynamoDB writes.
+
+	Tokens are write units. They refill continuously at 'rate' per second up to
+	'capacity'. A request takes its tokens straight away and, if that leaves the
+	bucket in debt, sleeps until the debt is paid back. So batches larger than
+	the capacity are paced correctly, and callers are served in arrival order.
+	The current rate adapts to throttling: it is halved every time DynamoDB
+	hands back unprocessed items, and climbs back one unit per successful
+	request until it reaches max_rate.
+	"""
+	MIN_RATE = 1.0
+
+	def __init__(self, rate, capacity=None, fn_clock=time.time, fn_sleep=time.sleep):
+		""" Constructor
+		@param rate: Provisioned rate, in tokens per second.
+		@param capacity: Max. tokens held by the bucket (default: one second worth)
+		@param fn_clock: Clock function returning seconds (default: time.time)
+		@param fn_sleep: Sleep function (default: time.sleep)
+		"""
+		self.fn_clock = fn_clock
+		self.fn_sleep = fn_sleep
+		self.lock = threading.Lock()
+		self.max_rate = max(float(rate), self.MIN_RATE)
+		self.rate = self.max_rate
+		if capacity is None:
+			capacity = self.max_rate
+		self.capacity = float(capacity)
+		self.tokens = self.capacity
+		self.last_refill = self.fn_clock()
+
+	def refill(self):
+		""" Add the tokens accrued since the last refill. Caller holds the lock.
+		"""
+		now = self.fn_clock()
+		elapsed = now - self.last_refill
+		if elapsed > 0:
+			self.tokens = min(self.capacity, self.tokens + (elapsed * self.rate))
+		self.last_refill = now
+
+	def set_max_rate(self, rate):
+		""" Change the provisioned rate, e.g. after a throughput update.
+		@param rate: New provisioned rate, in tokens per second.
+		"""
+		with self.lock:
+			self.refill()
+			self.max_rate = max(float(rate), self.MIN_RATE)
+			self.rate = min(self.rate, self.max_rate)
+			self.capacity = self.max_rate
+			self.tokens = min(self.tokens, self.capacity)
+
+	def acquire(self, tokens=1):
+		""" Take the given number of tokens, blocking until they have been refilled.
+		@param tokens: No. of tokens to take.
+		"""
+		with self.lock:
+			self.refill()
+			self.tokens -= tokens
+			wait = -self.tokens / self.rate
+		if wait > 0:
+			self.fn_sleep(wait)
+
+	def throttled(self):
+		""" Called when DynamoDB throttled a request. Halves the current rate.
+		"""
+		with self.lock:
+			self.refill()
+			self.rate = max(self.rate / 2, self.MIN_RATE)
+
+	def succeeded(self):
+		""" Called after a request went through. Raises the current rate by one.
+		"""
+		with self.lock:
+			self.refill()
+			self.rate = min(self.rate + 1, self.max_rate)
+
+
 
 class DDStore(AbstractDDStore):
 	""" DynamoDB data store class. Methods to create/get and write to DD tables.
@@ -181,9 +322,14 @@ class DDStore(AbstractDDStore):
 	TABLE_WAIT_MAX_RETRIES = 20
 	TABLE_UPDATE_MAX_RETRIES = 200
 	TABLE_READ_THROUGHPUT = 10
+	TABLE_CACHE_TTL = 60 # Seconds before a cached table handle's status is checked again
+	TABLE_LIST_TTL = 60 # Seconds before the cached list of table names is fetched again
 	TABLE_WRITE_THROUGHPUT = 5
 	TABLE_WRITE_THROUGHPUT_OPT = 10
-	SINGLE_THREADED_WRITE_THROUGHPUT = 70 # 70 wps is empirically determined min throughput.
+	WRITE_BACKOFF_BASE = 0.05 # Seconds to wait after the first throttled batch write
+	WRITE_BACKOFF_MAX = 20
+	WRITE_MAX_RETRIES = 15
+	WRITE_QUEUE_SIZE_PER_THREAD = 2 # Queued write requests per IO thread before callers block
 
 	def __init__(self, 
 				s_aws_access_key_id,
@@ -204,9 +350,28 @@ class DDStore(AbstractDDStore):
 		self.d_write_tp_toggle = { self.write_units: self.write_units_opt, 
 									self.write_units_opt: self.write_units }
 
-		self.connection = self.get_connection(s_aws_access_key_id=self.s_aws_access_key_id,
-												s_aws_secret_access_key=self.s_aws_secret_access_key,
-												s_region_name=self.s_region_name)
+		# One write token bucket per table, shared by all writer threads.
+		self.d_write_buckets = {}
+		self.write_buckets_lock = threading.Lock()
+		self.fn_clock = time.time
+		self.fn_sleep = time.sleep
+
+		# IO worker pool shared by all writes through this store, started on first use.
+		self.iosched = None
+		self.iosched_lock = threading.Lock()
+
+		# Table handles by name, with the time their status was last checked.
+		self.d_tables = {}
+		self.ls_tables = None
+		self.tables_listed_at = 0
+		self.tables_lock = threading.Lock()
+
+		# Per-thread connections, see get_thread_connection()
+		self.thread_local = threading.local()
+		self.num_connections = 0
+		self.connections_lock = threading.Lock()
+
+		self.connection = self.get_thread_connection()
 
 
 	def get_connection(self, 
@@ -223,6 +388,23 @@ class DDStore(AbstractDDStore):
 											aws_secret_access_key=s_aws_secret_access_key)
 		return connection
 
+	def get_thread_connection(self):
+		""" Return the calling thread's own connection, creating it on first use.
+
+		boto connections must not be shared between threads, so each IO worker
+		keeps one connection for its lifetime, reused across tables and ODFs.
+		self.connection is the connection of the thread that created the store.
+		"""
+		connection = getattr(self.thread_local, 'connection', None)
+		if connection is None:
+			connection = self.get_connection(s_aws_access_key_id=self.s_aws_access_key_id,
+											s_aws_secret_access_key=self.s_aws_secret_access_key,
+											s_region_name=self.s_region_name)
+			self.thread_local.connection = connection
+			with self.connections_lock:
+				self.num_connections += 1
+		return connection
+
 	def wait_for_table(self, dd_table):
 		""" Gets a handle to a DynamoDB table.
 		@param s_table_name: Table name.
@@ -257,13 +439,89 @@ class DDStore(AbstractDDStore):
 													write_units=self.write_units_opt)
 		self.wait_for_table(dd_table)
 
+		with self.tables_lock:
+			if self.ls_tables is not None and s_table_name not in self.ls_tables:
+				self.ls_tables.append(s_table_name)
+
 		return dd_table
 
+	def list_table_names(self, b_refresh=False):
+		""" Return the names of all tables, cached for TABLE_LIST_TTL seconds.
+		@param b_refresh: Fetch the list even if the cached one is still fresh.
+		"""
+		with self.tables_lock:
+			now = self.fn_clock()
+			if (b_refresh or self.ls_tables is None or 
+					now - self.tables_listed_at >= self.TABLE_LIST_TTL):
+				self.ls_tables = list(self.connection.list_tables())
+				self.tables_listed_at = now
+			return list(self.ls_tables)
+
+	def get_cached_table(self, s_table_name):
+		""" Return the cached handle to the named table, or None.
+
+		A handle whose status was checked more than TABLE_CACHE_TTL seconds ago
+		is refreshed first, and dropped from the cache if no longer ACTIVE.
+		@param s_table_name: Name of the table
+		"""
+		with self.tables_lock:
+			t_cached = self.d_tables.get(s_table_name, None)
+		if t_cached is None:
+			return None
+
+		dd_table, checked_at = t_cached
+		now = self.fn_clock()
+		if now - checked_at < self.TABLE_CACHE_TTL:
+			return dd_table
+
+		try:
+			dd_table.refresh()
+			b_active = (dd_table.status == "ACTIVE")
+		except Exception:
+			log.debug("Failed to refresh table %s" % s_table_name)
+			b_active = False
+
+		with self.tables_lock:
+			if b_active:
+				self.d_tables[s_table_name] = (dd_table, now)
+				return dd_table
+			self.d_tables.pop(s_table_name, None)
+		return None
+
 	def get_table(self, s_table_name, 
 					s_hash_key_name, hash_key_proto_value, 
 					s_range_key_name, range_key_proto_value,
 					read_units=None, write_units=None):
 		""" Return a handle to the named table, with the given schema. Create if it doesn't exist.
+		Handles to ACTIVE tables are cached by name, see get_cached_table().
+		@param s_table_name: Name of the Table to get/create
+		@param hash_key_name: Name of the table hash key
+		@param hash_key_proto_value: Data type of the hash key (str or int)
+		@param range_key_name: Name of the range key
+		@param range_key_proto_value: Data type of the range key (str, int)
+		@param read_units: Read throughput
+		@param write_units: Write throughput
+		"""
+		dd_table = self.get_cached_table(s_table_name)
+		if dd_table is not None:
+			return dd_table
+
+		dd_table = self.open_table(s_table_name,
+									s_hash_key_name, hash_key_proto_value,
+									s_range_key_name, range_key_proto_value,
+									read_units, write_units)
+
+		if dd_table is not None and dd_table.status == "ACTIVE":
+			with self.tables_lock:
+				self.d_tables[s_table_name] = (dd_table, self.fn_clock())
+
+		return dd_table
+
+	def open_table(self, s_table_name, 
+					s_hash_key_name, hash_key_proto_value, 
+					s_range_key_name, range_key_proto_value,
+					read_units=None, write_units=None):
+		""" Return a handle to the named table, with the given schema. Create if it doesn't exist.
 		@param s_table_name: Name of the Table to get/create
 		@param hash_key_name: Name of the table hash key
 		@param hash_key_proto_value: Data type of the hash key (str or int)
@@ -285,7 +543,10 @@ class DDStore(AbstractDDStore):
 													range_key_proto_value=range_key_proto_value)
 		dd_table = None
 
-		ls_tables = self.connection.list_tables()
+		ls_tables = self.list_table_names()
+		if s_table_name not in ls_tables:
+			# The table may have been created since the list was cached.
+			ls_tables = self.list_table_names(b_refresh=True)
 
 		if s_table_name in ls_tables:
 			dd_table = self.connection.table_from_schema(name=s_table_name,
@@ -354,8 +615,55 @@ class DDStore(AbstractDDStore):
 
 			time.sleep(self.TABLE_UPDATE_WAIT)
 
+		if status:
+			self.get_write_bucket(dd_table)
+
 		return status
 
+	def get_write_bucket(self, dd_table):
+		""" Return the write token bucket for the given table, creating it if needed.
+
+		The bucket rate follows the table's current provisioned write_units.
+		@param dd_table: Table to get the write token bucket for.
+		"""
+		with self.write_buckets_lock:
+			bucket = self.d_write_buckets.get(dd_table.name, None)
+			if bucket is None:
+				bucket = TokenBucket(dd_table.write_units, 
+										fn_clock=self.fn_clock, fn_sleep=self.fn_sleep)
+				self.d_write_buckets[dd_table.name] = bucket
+			elif bucket.max_rate != max(float(dd_table.write_units), bucket.MIN_RATE):
+				bucket.set_max_rate(dd_table.write_units)
+		return bucket
+
+	def get_write_backoff(self, retry):
+		""" Return the time to wait before retrying a throttled batch write.
+
+		Exponential backoff with full jitter: a random wait between 0 and
+		WRITE_BACKOFF_BASE * 2^retry, capped at WRITE_BACKOFF_MAX seconds.
+		@param retry: No. of retries so far for this batch.
+		"""
+		ceiling = min(self.WRITE_BACKOFF_MAX, self.WRITE_BACKOFF_BASE * (2 ** retry))
+		return random.uniform(0, ceiling)
+
+	def get_io_scheduler(self):
+		""" Return the store's IO scheduler, starting its workers on first use.
+		"""
+		with self.iosched_lock:
+			if self.iosched is None:
+				self.iosched = IOScheduler(self.num_threads, 
+											self.num_threads * self.WRITE_QUEUE_SIZE_PER_THREAD)
+				self.iosched.start_workers()
+			return self.iosched
+
+	def shutdown(self):
+		""" Stop the IO worker threads, after the queued writes are done.
+		"""
+		with self.iosched_lock:
+			iosched = self.iosched
+			self.iosched = None
+		if iosched is not None:
+			iosched.shutdown()
 
 	def put_records_multi(self, dd_table, ld_table_recs):
 		""" Write the given records to the given DynamoDB table.
@@ -366,24 +674,25 @@ class DDStore(AbstractDDStore):
 		try:
 			num_recs = len(ld_table_recs)
 
-			#num_threads = self.num_threads
-
-			# Set no. of threads to the number we need to match the rated
-			# write throughput for this table.
-			#log.debug("ddwrite=%d" % dd_table.write_units)
-			#log.debug("ddsingle=%d" % self.SINGLE_THREADED_WRITE_THROUGHPUT)
-			num_threads = (dd_table.write_units // self.SINGLE_THREADED_WRITE_THROUGHPUT) + 1
+			# All threads draw from the table's write token bucket, so the
+			# thread count only needs to be high enough to keep one batch
+			# per BATCH_WRITE_SIZE write units in flight.
+			num_threads = (dd_table.write_units // self.BATCH_WRITE_SIZE) + 1
+			num_threads = min(num_threads, self.num_threads)
+			num_threads = min(num_threads, (num_recs // self.BATCH_WRITE_SIZE) + 1)
 
 			# Use only a single thread in cases where the difference between
 			# single threaded throughput & rated throughput is not much.
 			if num_threads <= 1:
 				log.debug("using single thread")
-				self.put_records(self.connection, dd_table, ld_table_recs)
+				self.put_records(None, dd_table, ld_table_recs)
 			else:
-				iosched = IOScheduler(num_threads)
+				iosched = self.get_io_scheduler()
+				l_futures = []
 
-				ld_list_partitions = []
-				partition_size = num_recs // num_threads
+				# Partitions are whole batches, so only the last one is partial.
+				num_batches = (num_recs + self.BATCH_WRITE_SIZE - 1) // self.BATCH_WRITE_SIZE
+				partition_size = ((num_batches + num_threads - 1) // num_threads) * self.BATCH_WRITE_SIZE
 				num_partitions = (num_recs // partition_size) + 1
 				
 				#log.debug("num_threads: %d" % num_threads)
@@ -395,7 +704,7 @@ class DDStore(AbstractDDStore):
 					pstart = i * partition_size
 					pend = pstart + partition_size
 
-					if pstart == pend:
+					if pstart == pend or pstart >= num_recs:
 						break
 
 					if pend > num_recs:
@@ -404,18 +713,106 @@ class DDStore(AbstractDDStore):
 					#log.debug("pstart: %d" % pstart)
 					#log.debug("pend: %d" % pend)
 
-					iosched.queue_request(self.put_records, 
-										[self.connection, dd_table, ld_table_recs[pstart:pend]])
+					l_futures.append(iosched.queue_request(self.put_records, 
+										[None, dd_table, ld_table_recs[pstart:pend]]))
 
-				log.debug("Starting IO Workers")
-				iosched.start_workers()
-				iosched.wait_for_workers()
+				# Let every partition finish before reporting the first failure.
+				futures.wait(l_futures)
+				for future in l_futures:
+					future.result()
 				log.debug("Completed write.")
 		except:
 			raise
 		log.debug("Write successful.")
 		
 
+	def put_records_stream(self, dd_table, it_table_recs):
+		""" Write records to the given DynamoDB table as they are produced.
+
+		Records are sent in BATCH_WRITE_SIZE batches as soon as each batch is full,
+		so only the batches waiting in the bounded IO queue are held in memory,
+		and the IO queue holds back the producer when writes fall behind.
+		For duplicate keys the last record wins, as with ODF.to_dict: a batch
+		that rewrites a key still in flight waits for the pending writes first.
+		@param dd_table: Table to write to
+		@param it_table_recs: Iterable of records in dict form.
+		@return: No. of items written.
+		"""
+		bucket = self.get_write_bucket(dd_table)
+		num_threads = min((dd_table.write_units // self.BATCH_WRITE_SIZE) + 1, self.num_threads)
+
+		iosched = None
+		if num_threads > 1:
+			iosched = self.get_io_scheduler()
+
+		num_items = 0
+		# (future, set of keys) for each batch handed to the IO workers
+		l_pending = []
+		try:
+			for l_batch_items, s_keys in self.iter_batches(dd_table, it_table_recs):
+				num_items += len(l_batch_items)
+				if iosched is None:
+					self.write_batch(None, dd_table, l_batch_items, bucket)
+					continue
+
+				l_done = [t_pending for t_pending in l_pending if t_pending[0].done()]
+				for t_pending in l_done:
+					t_pending[0].result()
+					l_pending.remove(t_pending)
+
+				for future, s_pending_keys in l_pending:
+					if not s_keys.isdisjoint(s_pending_keys):
+						futures.wait([t_pending[0] for t_pending in l_pending])
+						break
+
+				future = iosched.queue_request(self.write_batch, 
+									[None, dd_table, l_batch_items, bucket])
+				l_pending.append((future, s_keys))
+		finally:
+			futures.wait([t_pending[0] for t_pending in l_pending])
+
+		for future, s_keys in l_pending:
+			future.result()
+
+		log.debug("Write successful. %d items written." % num_items)
+		return num_items
+
+	def iter_batches(self, dd_table, it_table_recs):
+		""" Group records into batches of Items with at most BATCH_WRITE_SIZE distinct keys.
+		A record with the same key as one earlier in the batch replaces it.
+		Yields (list of Items, set of (hash key, range key) tuples).
+		@param dd_table: Table the Items are for
+		@param it_table_recs: Iterable of records in dict form.
+		"""
+		s_hash_key_name = dd_table.schema.hash_key_name
+		s_range_key_name = dd_table.schema.range_key_name
+		d_batch = OrderedDict()
+		for d_table_rec in it_table_recs:
+			key = (d_table_rec[s_hash_key_name], d_table_rec[s_range_key_name])
+			d_batch[key] = self.new_item(dd_table, d_table_rec)
+			if len(d_batch) == self.BATCH_WRITE_SIZE:
+				yield (list(d_batch.values()), set(d_batch.keys()))
+				d_batch = OrderedDict()
+		if d_batch:
+			yield (list(d_batch.values()), set(d_batch.keys()))
+
+	def new_item(self, dd_table, d_table_rec):
+		""" Create an Item for the given table from a record in dict form.
+		@param dd_table: Table the Item is for
+		@param d_table_rec: Record including the hash & range key fields.
+		"""
+		s_hash_key_name = dd_table.schema.hash_key_name
+		s_range_key_name = dd_table.schema.range_key_name
+
+		d_attrs = {}
+		for s_attr in d_table_rec:
+			if s_attr != s_hash_key_name and s_attr != s_range_key_name:
+				d_attrs[s_attr] = d_table_rec[s_attr]
+
+		return dd_table.new_item(hash_key=d_table_rec[s_hash_key_name], 
+									range_key=d_table_rec[s_range_key_name],
+									attrs=d_attrs)
+
 	def put_records(self, connection, dd_table, 
 					ld_table_recs):
 		""" Batch write the given ODF record items to the given ODF table
@@ -428,63 +825,111 @@ class DDStore(AbstractDDStore):
 		table's write throughput setting may be DROPPED. 
 		This implementation rate limits the writes deliberately to ensure we do not exceed
 		the write thrroughput within reasonable limits -- which in turn ensures AWS
-		won't drop any writes.
+		won't drop any writes. Every batch draws one token per item from the table's
+		shared write token bucket before it is sent.
 
+		@param connection: boto DynamoDB connection, None for the calling thread's own.
 		@param odf_table: Handle to the ODF table
 		@param: ld_odf_recs: List of ODF record items, represented as dictionary objects.
 		"""
+		if connection is None:
+			connection = self.get_thread_connection()
 		num_recs = len(ld_table_recs)
-		batch_list = connection.new_batch_write_list()
+		bucket = self.get_write_bucket(dd_table)
 		l_batch_items = []
 		debug_frequency = 100
-		s_hash_key_name = dd_table.schema.hash_key_name
-		s_range_key_name = dd_table.schema.range_key_name
 		for i, d_table_rec in enumerate(ld_table_recs):
 			# First create an Item type for this ODF record
-			ls_attrs = list(d_table_rec.keys())
-			ls_attrs.remove(s_hash_key_name)
-			ls_attrs.remove(s_range_key_name)
-
-			d_attrs = {}
-			for s_attr in ls_attrs:
-				d_attrs[s_attr] = d_table_rec[s_attr]
+			l_batch_items.append(self.new_item(dd_table, d_table_rec))
+			
+			# If we've added BATCH_WRITE_SIZE items, or this is the last record,
+			# flush the batch
+			if (i+1) % self.BATCH_WRITE_SIZE == 0 or (i+1) == num_recs:
+				self.write_batch(connection, dd_table, l_batch_items, bucket)
+				percent_complete = int(((i+1)/num_recs) * 100)
+				if percent_complete > 0 and percent_complete % debug_frequency == 0:
+					log.debug("%d records written. %d%% completed." % ((i+1),
+																		percent_complete))
+				l_batch_items = []
+
+	def write_batch(self, connection, dd_table, l_batch_items, bucket):
+		""" Send one batch of items, retrying unprocessed items until all are written.
+
+		Throttled retries back off exponentially with jitter, and lower the
+		rate of the shared token bucket so the other writer threads slow down too.
+		@param connection: boto DynamoDB connection, None for the calling thread's own.
+		@param dd_table: Table to write to
+		@param l_batch_items: List of at most BATCH_WRITE_SIZE Items
+		@param bucket: Write token bucket for dd_table
+		"""
+		if connection is None:
+			connection = self.get_thread_connection()
+		retry = 0
+		while l_batch_items:
+			bucket.acquire(len(l_batch_items))
+			batch_list = connection.new_batch_write_list()
+			batch_list.add_batch(dd_table, puts=l_batch_items)
+			response = connection.batch_write_item(batch_list)
+			unprocessed = response.get('UnprocessedItems', None)
+			if not unprocessed:
+				bucket.succeeded()
+				break
 
-			dd_item = Item(dd_table, 
-							hash_key=d_table_rec[s_hash_key_name], 
-							range_key=d_table_rec[s_range_key_name],
-							attrs=d_attrs)
+			# There were unprocessed items. retry only these items
+			bucket.throttled()
+			if retry >= self.WRITE_MAX_RETRIES:
+				raise ODFException("Failed to write %d items to %s after %d retries" % 
+									(len(unprocessed[dd_table.name]), dd_table.name, retry))
+			self.fn_sleep(self.get_write_backoff(retry))
+			retry += 1
 
-			l_batch_items.append(dd_item)
-			
-			# If we've added BATCH_WRITE_SIZE items, flush the batch_list
-			if (i+1) % self.BATCH_WRITE_SIZE == 0:
-				# Add Item to the current batch
-				batch_list.add_batch(dd_table, puts=l_batch_items)
-				while True:
-					response = connection.batch_write_item(batch_list)
-					unprocessed = response.get('UnprocessedItems', None)
-					if not unprocessed:
-						percent_complete = int(((i+1)/num_recs) * 100)
-						if percent_complete > 0 and percent_complete % debug_frequency == 0:
-							log.debug("%d records written. %d%% completed." % ((i+1),
-																				percent_complete))
-						batch_list = connection.new_batch_write_list()
-						l_batch_items = []
-						break
-					# There were unprocessed items. retry only these items
-					batch_list = connection.new_batch_write_list()
-					unprocessed_list = unprocessed[dd_table.name]
-					items = []
-					for u in unprocessed_list:
-						item_attr = u['PutRequest']['Item']
-						item = dd_table.new_item(attrs=item_attr)
-						items.append(item)
-						batch_list.add_batch(dd_table, puts=items)
+			l_batch_items = []
+			for u in unprocessed[dd_table.name]:
+				item_attr = u['PutRequest']['Item']
+				l_batch_items.append(dd_table.new_item(attrs=item_attr))
 
 	def list_exchanges(self):
-		ls_tables = self.connection.list_tables()
+		ls_tables = self.list_table_names()
 		return ls_tables		
 
+	def get_odf_stamp(self, s_exchange, s_odf_dd):
+		""" DynamoDB keeps no modification time, so the stamp is made of the
+		record count, the header records and the highest record. Appended,
+		backfilled or deleted records change the count; rewritten headers or
+		a rewritten newest record change their values. A body record rewritten
+		in place further back, with nothing else changing, is not noticed.
+		"""
+		odf_table = self.get_table(s_exchange,
+									'ODF_NAME',
+									str,
+									'ODF_RECNO',
+									int)
+		ls_fields = odf.ODFRecordArray.ls_fields
+
+		# Items are only counted, not returned. The count is complete once
+		# all pages have been read.
+		odf_count = odf_table.query(hash_key=s_odf_dd, count=True)
+		for odf_rec in odf_count:
+			pass
+		if odf_count.count == 0:
+			return None
+		l_stamp = [odf_count.count]
+
+		odf_recs = odf_table.query(hash_key=s_odf_dd,
+									range_key_condition=boto.dynamodb.condition.LE(
+										len(odf.ODF.ld_header_layout)))
+		for odf_rec in odf_recs:
+			l_stamp.append(tuple(odf_rec.get(s_field) for s_field in ls_fields))
+
+		odf_recs = odf_table.query(hash_key=s_odf_dd,
+									request_limit=1,
+									max_results=1,
+									scan_index_forward=False)
+		for odf_rec in odf_recs:
+			l_stamp.append(tuple(odf_rec.get(s_field) for s_field in ls_fields))
+
+		return tuple(l_stamp)
+
 	def list_odfs(self, s_exchange):
 
 		odf_table = self.get_table(s_exchange,
@@ -546,9 +991,12 @@ class DDStore(AbstractDDStore):
 
 class LocalDDStore(AbstractDDStore):
 
-	def __init__(self, s_local_dd_data_root):
+	def __init__(self, s_local_dd_data_root, b_odf_array_store=False):
 		self.s_root_dir = os.path.abspath(s_local_dd_data_root)
 		self.b_force_fifo_old  = False
+		self.b_odf_array_store = b_odf_array_store
+		# ODF stamps right after save_odf, see pop_saved_odf_stamp()
+		self.d_saved_odf_stamps = {}
 
 	def clear_state(self, s_exchange_basename, s_odf_basename):
 		s_fifo_dir = self.get_fifo_dir(s_exchange_basename, 
@@ -557,7 +1005,7 @@ class LocalDDStore(AbstractDDStore):
 		if os.path.exists(s_fifo_dir):
 			shutil.rmtree(s_fifo_dir)
 		s_txt_odf_name = self.get_text_odf(s_exchange_basename, s_odf_basename)
-		proc = odfproc.ODFProcessor(self)	
+		proc = odfproc.ODFProcessor(self, self.b_odf_array_store)
 		proc.convert_txt2bin(s_exchange_basename, s_txt_odf_name, True)
 
 	def list_exchanges(self):
@@ -597,15 +1045,37 @@ class LocalDDStore(AbstractDDStore):
 		return m.group(1)
 
 	def open_odf(self, s_exchange_basename, s_odf_dd):
-		odf_obj = odf.ODF()
-		fp_odf_bin = open(s_odf_dd, "rb")
-		odf_obj.read_bin_stream(fp_odf_bin)
-		fp_odf_bin.close()
+		if self.b_odf_array_store:
+			odf_obj = odf.ODFArray.open_mmap(s_odf_dd)
+		else:
+			odf_obj = odf.ODF()
+			fp_odf_bin = open(s_odf_dd, "rb")
+			odf_obj.read_bin_stream(fp_odf_bin)
+			fp_odf_bin.close()
+		odf_obj.set_store(self)
+		return odf_obj
+
+	def read_odf_headers(self, s_odf_dd):
+		return odf.read_odf_headers(s_odf_dd)
+
+	def open_odf_tail(self, s_exchange_basename, s_odf_dd, from_recno):
+		if not self.b_odf_array_store:
+			return self.open_odf(s_exchange_basename, s_odf_dd)
+		odf_obj = odf.ODFArray.open_tail(s_odf_dd, from_recno)
 		odf_obj.set_store(self)
 		return odf_obj
 
 	def save_odf(self, s_odf_dd, s_odf_basename, odf_obj):
+		# Partially loaded ODFs are written back in place.
 		odf_obj.to_bin_file(s_odf_dd)
+		self.d_saved_odf_stamps[s_odf_dd] = self.get_odf_stamp(None, s_odf_dd)
+
+	def get_odf_stamp(self, s_exchange, s_odf_dd):
+		st_odf = os.stat(s_odf_dd)
+		return (st_odf.st_mtime_ns, st_odf.st_size)
+
+	def pop_saved_odf_stamp(self, s_odf_dd):
+		return self.d_saved_odf_stamps.pop(s_odf_dd, None)
 
 	def get_fifo_dir(self, s_exchange_basename, s_odf_basename):
 		s_fifo_root_dir = os.path.dirname(self.s_root_dir)
@@ -663,7 +1133,7 @@ class LocalDDStore(AbstractDDStore):
 def get_dd_store(config):
 
 	#if config.b_test_mode:
-	return LocalDDStore(config.s_local_dd_data_root)
+	return LocalDDStore(config.s_local_dd_data_root, config.b_odf_array_store)
 
 	s_aws_access_key_id = config.s_dd_access_key
 	s_aws_secret_access_key = config.s_dd_secret_access_key
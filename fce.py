@@ -31,7 +31,7 @@ import os.path
 import re
 import decimal as dc
 
-from binary import BinaryStruct
+from binary import BinaryStruct, xor_crypt_records
 from odfexcept import *
 from collections import OrderedDict
 
@@ -240,31 +240,42 @@ class FCE(BinaryStruct):
 		""" Read and parse FCE from a binary stream. 
 		@param fp_bin_fce: Binary stream.
 		"""
-		# Parse headers.
-		# To do: store odf records as a list of dicts in internally instead of 
-		# storing the encoder/decoder binarystruct objects
-		for i in range(len(self.ld_header_layout)):
-			d_hdr_param = list(self.ld_header_layout[i].values())[0]
-			fce_header = FCEHeader(**d_hdr_param)
-			fce_header.read_bin_stream(fp_bin_fce, key)
-			if not (fce_header.get_size() == self.record_size):
+		# Read & decrypt all header records at once, then decode each
+		# with the compiled codec for its layout.
+		header_count = len(self.ld_header_layout)
+		s_buf = fp_bin_fce.read(header_count * self.record_size)
+		if len(s_buf) < header_count * self.record_size:
+			raise ODFEOF("Truncated FCE")
+		if key is not None:
+			s_buf = xor_crypt_records(s_buf, key, self.record_size)
+
+		offset = 0
+		for i in range(header_count):
+			s_hdr_name, d_hdr_param = list(self.ld_header_layout[i].items())[0]
+			st_struct = FCEHeader.get_struct(d_hdr_param['ld_fields'], d_hdr_param['padding'])
+			if not (st_struct.size == self.record_size):
 				raise ODFException("Failed Header Integrity Test.")
-			s_hdr_name = fce_header.get_header_name()
-			self.d_hdr_index[s_hdr_name] = fce_header.get_header_value(s_hdr_name)
+			hdr_value = st_struct.unpack_from(s_buf, offset)[0]
+			self.d_hdr_index[s_hdr_name] = dc.Decimal(str(hdr_value))
+			offset += self.record_size
 		
 	def to_bin(self, key=None):
 		""" Pack this FCE into its binary format.
 		"""
-		buf = b''
+		buf = bytearray(len(self.ld_header_layout) * self.record_size)
 
+		offset = 0
 		for i in range(len(self.ld_header_layout)):
-			d_hdr_param = list(self.ld_header_layout[i].values())[0]
-			fce_header = FCEHeader(**d_hdr_param)
-			s_hdr_name = fce_header.get_header_name()
+			s_hdr_name, d_hdr_param = list(self.ld_header_layout[i].items())[0]
+			(_, ls_fields, st_struct) = FCEHeader.get_codec(d_hdr_param['ld_fields'], d_hdr_param['padding'])
 			hdr_value = int(self.d_hdr_index[s_hdr_name])
-			fce_header.set_field(s_hdr_name, hdr_value)
-			#log.debug(type(hdr_value))
-			buf = buf + fce_header.to_bin(key)
+			# Header value, and zeros for the padding fields of its layout.
+			st_struct.pack_into(buf, offset, hdr_value, *([0] * (len(ls_fields) - 1)))
+			offset += self.record_size
+
+		buf = bytes(buf)
+		if key is not None:
+			buf = xor_crypt_records(buf, key, self.record_size)
 
 		return buf
 
@@ -316,41 +316,38 @@ class FIFO(BinaryStruct):
 		@param fp_bin_odf: Binary stream.
 		"""
 
+		# Check if record size is correct (34 bytes)
+		if not (FIFORecord.get_struct().size == self.record_size):
+			raise ODFException("Failed Record Integrity Test.")
+
+		# The header records trail the body.
+		s_buf = fp_bin_fifo.read()
+		header_offset = len(s_buf) - len(self.l_fifo_headers) * self.record_size
+		if header_offset < 0:
+			raise ODFEOF("Truncated FIFO")
+
 		# Parse body
+		ls_fields = FIFORecord.get_codec()[1]
 		d_dedup_dict = {}
-		try:
-			while True:
-				fifo_rec = FIFORecord()
-				fifo_rec.read_bin_stream(fp_bin_fifo)
-				# Check if record size is correct (42 bytes)
-				if not (fifo_rec.get_size() == self.record_size):
-					raise ODFException("Failed Record Integrity Test.")
-				recno = fifo_rec.get_recno()
-				if recno == 0:
-					log.debug("recno=0 encountered")
-					continue
-				self.d_recno_index[recno] = fifo_rec
-				self.dedup(d_dedup_dict, fifo_rec)
-				#log.debug(str(fifo_rec))
-				if recno == self.fifo_count:
-					break
-				#log.debug(odf_body.get_field('ODF_RECNO'))
-		except ODFEOF as err:
-			# EOF breaks the loop.
-			pass
-		except:
-			raise
+		for t_rec in FIFORecord.unpack_records(s_buf[:header_offset]):
+			recno = t_rec[0]
+			if recno == 0:
+				log.debug("recno=0 encountered")
+				continue
+			fifo_rec = FIFORecord(dict(zip(ls_fields, t_rec)))
+			self.d_recno_index[recno] = fifo_rec
+			self.dedup(d_dedup_dict, fifo_rec)
+			if recno == self.fifo_count:
+				break
 
 		self.l_fifo_records = self.get_dedup_objs(d_dedup_dict)	
-		#log.debug(self.l_fifo_records)
 		# Parse headers.
-		# To do: store odf records as a list of dicts in internally instead of 
-		# storing the encoder/decoder binarystruct objects
 		for fifo_header in self.l_fifo_headers:
-			fifo_header.read_bin_stream(fp_bin_fifo)
-			# Check if record size is correct (42 bytes)
 			if not (fifo_header.get_size() == self.record_size):
 				raise ODFException("Failed Header Integrity Test.")
+			l_values = fifo_header.parse_bin_buf(s_buf[header_offset:header_offset+self.record_size])
+			fifo_header.d_fields = dict(zip(fifo_header.get_field_names(), l_values))
+			header_offset += self.record_size
 			recno = fifo_header.get_recno()
 			self.d_recno_index[recno] = fifo_header
 
@@ -365,26 +362,22 @@ class FIFO(BinaryStruct):
 		last_recno = self.l_fifo_records[-1].get_recno()
 		fifo_index = 0
 		
-		null_fifo_rec = FIFORecord()
-		buf = b''
-		# Store each record at byte location ((ODF_RECNO-1) * 42)+1
+		ls_fields = FIFORecord.get_codec()[1]
+		t_null = (0,) * len(ls_fields)
+		l_records = []
+		# Store each record at byte location ((ODF_RECNO-1) * 34)+1
 		# Store missing records as null entries.
 		for recno in range(first_recno, last_recno+1):
 			current_valid_recno = self.l_fifo_records[fifo_index].get_recno()
-			fifo_rec = None
 			if recno == current_valid_recno:
 				fifo_rec = self.l_fifo_records[fifo_index]
+				l_records.append(tuple([fifo_rec.d_fields[s_field] for s_field in ls_fields]))
 				fifo_index += 1
 			else:
-				fifo_rec = null_fifo_rec
-			buf = buf + fifo_rec.to_bin()
-			#log.debug(str(fifo_rec))
-		header_recno = self.fifo_count + 1
-		# First hash all headers into the dup-detect dict
+				l_records.append(t_null)
+		buf = FIFORecord.pack_records(l_records)
 		for fifo_header in self.l_fifo_headers:
 			buf = buf + fifo_header.to_bin()
-			#log.debug(str(fifo_header))
-		#log.debug(len(buf))
 		return buf
 
 	def to_dict(self, s_odf_basename):
@@ -27,11 +27,17 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 '''
 
 # Required by ODF utilities
+import os
+import mmap
+from array import array
 import struct as st
 import decimal as dc
 from odfexcept import *
 from binary import BinaryStruct
 from collections import OrderedDict
+from collections.abc import MutableMapping
+from functools import lru_cache
+from bisect import bisect_right
 
 # Create logger
 import logging
@@ -211,6 +217,340 @@ class ODFBody(BinaryStruct):
 		return s_buf
 
 
+def parse_txt_body(ls_lines):
+	""" Parse the CSV body lines of a text ODF in bulk.
+	Returns the columns (recno, open, high, low, close, volume) as lists.
+	@param ls_lines: Body lines, without the leading header lines.
+	"""
+	ls_lines = [s_line for s_line in ls_lines if s_line.strip()]
+
+	for s_line in ls_lines:
+		if s_line.count(',') != 5:
+			raise ODFException("Malformed record in text file: %s" % s_line.strip())
+
+	ls_values = ','.join(ls_lines).split(',')
+
+	l_recnos = list(map(int, ls_values[0::6]))
+	l_open = list(map(float, ls_values[1::6]))
+	l_high = list(map(float, ls_values[2::6]))
+	l_low = list(map(float, ls_values[3::6]))
+	l_close = list(map(float, ls_values[4::6]))
+	l_volume = list(map(float, ls_values[5::6]))
+
+	return (l_recnos, l_open, l_high, l_low, l_close, l_volume)
+
+def to_fixed(value, ohlc_divider):
+	""" Convert a price (float, Decimal, int or numeric string) to an integer
+	scaled by ohlc_divider. Raises ODFOffGridPrice for prices that are not on the
+	1/ohlc_divider grid, rather than rounding them.
+	@param value: Price.
+	@param ohlc_divider: OHLC_DIVIDER of the ODF, e.g. 100.
+	"""
+	f_value = float(value)
+	fixed_value = int(round(f_value * ohlc_divider))
+	if from_fixed(fixed_value, ohlc_divider) != f_value:
+		raise ODFOffGridPrice("Price %r is not a multiple of 1/%d" % (f_value, ohlc_divider))
+	return fixed_value
+
+def from_fixed(fixed_value, ohlc_divider):
+	""" Convert a scaled integer price back to a float. Integer true division is
+	correctly rounded, so this gives the same float as float(Decimal(price)).
+	@param fixed_value: Price scaled by ohlc_divider.
+	@param ohlc_divider: OHLC_DIVIDER of the ODF, e.g. 100.
+	"""
+	return fixed_value / ohlc_divider
+
+# Distance in recnos between the starts of consecutive trading sessions,
+# as stepped by ODF.is_recno_out_of_limits.
+SESSION_RECNO_STEP = 1400
+
+@lru_cache(maxsize=None)
+def get_session_mask(trading_recs_perday):
+	""" Return the trading-session mask as bytes of length SESSION_RECNO_STEP:
+	byte i is 1 if recnos with (recno - trading_start_recno - 1) % SESSION_RECNO_STEP == i
+	are within trading limits, else 0. The mask is relative to the session start,
+	so it is the same for every TRADING_START_RECNO.
+	@param trading_recs_perday: TRADING_RECS_PERDAY of the ODF, as an int.
+	"""
+	width = max(0, min(trading_recs_perday - 1, SESSION_RECNO_STEP))
+	return b'\x01' * width + b'\x00' * (SESSION_RECNO_STEP - width)
+
+def is_recno_in_session(recno, trading_start_recno, trading_recs_perday):
+	""" Closed form of ODF.is_recno_out_of_limits (negated), using the cached
+	session mask. Assumes trading_start_recno >= 0.
+	@param recno: Record no.
+	@param trading_start_recno: TRADING_START_RECNO of the ODF.
+	@param trading_recs_perday: TRADING_RECS_PERDAY of the ODF.
+	"""
+	offset = int(recno) - int(trading_start_recno) - 1
+	if offset < 0:
+		return False
+	mask = get_session_mask(int(trading_recs_perday))
+	return mask[offset % SESSION_RECNO_STEP] == 1
+
+def get_session_recnos(first_recno, last_recno, trading_start_recno, trading_recs_perday):
+	""" Return the recnos in first_recno..last_recno that are within trading limits,
+	in ascending order. These are the recnos ODF.is_recno_out_of_limits accepts, but
+	worked out a session at a time: recno r is within limits if 
+	trading_start_recno < r - k*SESSION_RECNO_STEP < trading_start_recno + trading_recs_perday
+	for some k >= 0. Assumes trading_start_recno >= 0.
+	@param first_recno: First recno of the range.
+	@param last_recno: Last recno of the range (inclusive).
+	@param trading_start_recno: TRADING_START_RECNO of the ODF.
+	@param trading_recs_perday: TRADING_RECS_PERDAY of the ODF.
+	"""
+	trading_start_recno = int(trading_start_recno)
+	last_recno = int(last_recno)
+	first_recno = max(int(first_recno), trading_start_recno + 1)
+	# No. of in-limit recnos at the start of each session
+	width = min(int(trading_recs_perday) - 1, SESSION_RECNO_STEP)
+
+	l_recnos = []
+	if width <= 0:
+		return l_recnos
+
+	session_start = trading_start_recno + 1 + \
+		((first_recno - trading_start_recno - 1) // SESSION_RECNO_STEP) * SESSION_RECNO_STEP
+	while session_start <= last_recno:
+		l_recnos.extend(range(max(session_start, first_recno), min(session_start + width, last_recno + 1)))
+		session_start += SESSION_RECNO_STEP
+	return l_recnos
+
+
+class ODFRecordView(MutableMapping):
+	""" Dict-like view of one record in an ODFRecordArray.
+
+	Reads return the same values as the OrderedDict records of ODF (Decimals,
+	and the recno as an int). Writes to the OHLCV fields go straight back to
+	the packed buffer. The set of fields is fixed, and ODF_RECNO is read-only.
+	"""
+
+	def __init__(self, rec_array, recno):
+		self.rec_array = rec_array
+		self.recno = recno
+
+	def __getitem__(self, s_field_name):
+		if s_field_name == 'ODF_RECNO':
+			return self.recno
+		if s_field_name not in ODFRecordArray.d_field_offset:
+			raise KeyError(s_field_name)
+		return dc.Decimal(str(self.rec_array.get_value(self.recno, s_field_name)))
+
+	def __setitem__(self, s_field_name, value):
+		if s_field_name not in ODFRecordArray.d_field_offset:
+			raise ODFException("Cannot set field %s of a packed ODF record" % s_field_name)
+		self.rec_array.set_value(self.recno, s_field_name, value)
+
+	def __delitem__(self, s_field_name):
+		raise ODFException("Cannot delete field %s of a packed ODF record" % s_field_name)
+
+	def __iter__(self):
+		return iter(ODFRecordArray.ls_fields)
+
+	def __len__(self):
+		return len(ODFRecordArray.ls_fields)
+
+	def __repr__(self):
+		return repr(OrderedDict(self))
+
+
+class ODFRecordArray(object):
+	""" Packed array of ODF records, indexed directly by recno.
+
+	Records are laid out exactly as in a binary ODF: record n lives at byte
+	offset (n-1) * 42 as (recno, open, high, low, close, volume). Header records
+	use the same layout, with the header value in the ODF_OPEN slot. A slot whose
+	stored recno does not match its position is empty.
+
+	Implements enough of the mapping protocol (keys, in, [], []=) to stand in
+	for the dict of per-record OrderedDicts used by ODF. [] returns an
+	ODFRecordView, so field writes through it update the buffer.
+	"""
+
+	ls_fields = ['ODF_RECNO', 'ODF_OPEN', 'ODF_HIGH', 'ODF_LOW', 'ODF_CLOSE', 'ODF_VOLUME']
+
+	st_record = ODFBody.get_struct()
+
+	st_recno = st.Struct('<H')
+
+	st_value = st.Struct('<d')
+
+	# Byte offset of each field within a record
+	d_field_offset = {
+		'ODF_OPEN' : 2,
+		'ODF_HIGH' : 10,
+		'ODF_LOW' : 18,
+		'ODF_CLOSE' : 26,
+		'ODF_VOLUME' : 34,
+	}
+
+	def __init__(self, buf=None):
+		""" Constructor
+		@param buf: Binary ODF contents to adopt: a bytearray, or a copy-on-write
+		mmap of a binary ODF. (default: None, for an empty array)
+		"""
+		self.record_size = self.st_record.size
+		if buf is None:
+			buf = bytearray()
+		self.buf = buf
+		self.capacity = len(buf) // self.record_size
+		self.highest_recno = self.find_highest_recno()
+		# No. of stored records and their sorted recnos, worked out on first
+		# use by count_records(), then kept up to date as records are set.
+		self.num_records = None
+		self.l_keys = None
+
+	def is_mapped(self):
+		return isinstance(self.buf, mmap.mmap)
+
+	def materialise(self):
+		""" Copy a memory-mapped buffer into memory and release the mapping.
+		Needed before growing the array, or before the mapped file is rewritten.
+		"""
+		if not self.is_mapped():
+			return
+		mm = self.buf
+		self.buf = bytearray(mm[:self.capacity * self.record_size])
+		mm.close()
+
+	def close(self):
+		""" Release the memory mapping, if any. The array is empty afterwards.
+		"""
+		if self.is_mapped():
+			self.buf.close()
+			self.buf = bytearray()
+			self.capacity = 0
+			self.highest_recno = 0
+			self.num_records = 0
+			self.l_keys = []
+
+	def find_highest_recno(self):
+		""" Scan backwards from the end of the buffer for the last stored record.
+		"""
+		recno = self.capacity
+		while recno > 0 and not self.has_recno(recno):
+			recno -= 1
+		return recno
+
+	def count_records(self):
+		""" Scan the buffer once for the stored recnos.
+		"""
+		if self.l_keys is None:
+			self.l_keys = [recno for recno in range(1, self.highest_recno + 1) 
+							if self.has_recno(recno)]
+			self.num_records = len(self.l_keys)
+
+	def grow(self, recno):
+		""" Make sure the buffer has a slot for recno. Grows geometrically.
+		"""
+		if recno <= self.capacity:
+			return
+		self.materialise()
+		capacity = max(recno, 2 * self.capacity)
+		self.buf.extend(b'\x00' * ((capacity - self.capacity) * self.record_size))
+		self.capacity = capacity
+
+	def get_offset(self, recno):
+		return (recno - 1) * self.record_size
+
+	def has_recno(self, recno):
+		if recno < 1 or recno > self.capacity:
+			return False
+		return self.st_recno.unpack_from(self.buf, self.get_offset(recno))[0] == recno
+
+	def get_value(self, recno, s_field_name):
+		""" Return a single field of a stored record as a float (recno as an int).
+		Caller must check has_recno() first.
+		"""
+		offset = self.get_offset(recno)
+		if s_field_name == 'ODF_RECNO':
+			return self.st_recno.unpack_from(self.buf, offset)[0]
+		return self.st_value.unpack_from(self.buf, offset + self.d_field_offset[s_field_name])[0]
+
+	def set_value(self, recno, s_field_name, value):
+		""" Overwrite a single (non-recno) field of a stored record.
+		"""
+		offset = self.get_offset(recno) + self.d_field_offset[s_field_name]
+		self.st_value.pack_into(self.buf, offset, float(value))
+
+	def get_record(self, recno):
+		""" Return the raw (recno, open, high, low, close, volume) tuple for recno.
+		"""
+		return self.st_record.unpack_from(self.buf, self.get_offset(recno))
+
+	def set_record(self, recno, f_open, f_high, f_low, f_close, f_volume):
+		""" Store a record at its slot, overwriting any previous record.
+		"""
+		self.grow(recno)
+		if self.l_keys is not None and not self.has_recno(recno):
+			self.num_records += 1
+			if recno > self.highest_recno:
+				self.l_keys.append(recno)
+			else:
+				self.l_keys = None
+				self.num_records = None
+		self.st_record.pack_into(self.buf, self.get_offset(recno), int(recno),
+								float(f_open), float(f_high), float(f_low),
+								float(f_close), float(f_volume))
+		if recno > self.highest_recno:
+			self.highest_recno = recno
+
+	def set_records(self, l_recnos, l_open, l_high, l_low, l_close, l_volume):
+		""" Store a batch of records given as columns. Later records override
+		earlier ones with the same recno.
+		"""
+		if not l_recnos:
+			return
+		highest_recno = max(l_recnos)
+		self.grow(highest_recno)
+		buf = self.buf
+		record_size = self.record_size
+		pack_into = self.st_record.pack_into
+		if self.l_keys is not None and not all(map(self.has_recno, l_recnos)):
+			# New recnos: recounted on next use
+			self.l_keys = None
+			self.num_records = None
+		for t_rec in zip(l_recnos, l_open, l_high, l_low, l_close, l_volume):
+			pack_into(buf, (t_rec[0] - 1) * record_size, *t_rec)
+		if highest_recno > self.highest_recno:
+			self.highest_recno = highest_recno
+
+	def to_bin(self):
+		""" Return the packed records up to (and including) the highest recno.
+		"""
+		return bytes(self.buf[:self.highest_recno * self.record_size])
+
+	def keys(self):
+		""" Return all stored recnos in ascending order.
+		"""
+		self.count_records()
+		return list(self.l_keys)
+
+	def __iter__(self):
+		return iter(self.keys())
+
+	def __len__(self):
+		self.count_records()
+		return self.num_records
+
+	def __contains__(self, recno):
+		return self.has_recno(int(recno))
+
+	def __getitem__(self, recno):
+		recno = int(recno)
+		if not self.has_recno(recno):
+			raise KeyError(recno)
+		return ODFRecordView(self, recno)
+
+	def __setitem__(self, recno, d_odf_rec):
+		self.set_record(int(recno),
+						d_odf_rec['ODF_OPEN'],
+						d_odf_rec['ODF_HIGH'],
+						d_odf_rec['ODF_LOW'],
+						d_odf_rec['ODF_CLOSE'],
+						d_odf_rec['ODF_VOLUME'])
+
+
 class ODF(BinaryStruct):
 	""" ODF File converter, and in-memory representation.
 	"""
@@ -404,6 +744,11 @@ class ODF(BinaryStruct):
 		#self.l_odf_body = []
 		self.d_recno_index = {}
 
+		# Ascending array of all recnos in d_recno_index, see get_sorted_recnos().
+		self.a_sorted_recnos = None
+		# The d_recno_index that a_sorted_recnos was built from.
+		self.sorted_recnos_source = None
+
 		# Each binary ODF record is 42 bytes long.
 		self.record_size = 42
 
@@ -440,51 +785,38 @@ class ODF(BinaryStruct):
 		For duplicates, the most recently seen record overrides previous ones.
 		@param fp_bin_odf: Binary stream.
 		"""
-		# Parse headers.
-		# To do: store odf records as a list of dicts in internally instead of 
-		# storing the encoder/decoder binarystruct objects
-
-		for i in range(len(self.ld_header_layout)):
-			d_header = self.ld_header_layout[i]
-			s_hdr_name = list(d_header.keys())[0]
-			d_hdr_param = list(d_header.values())[0]
-
-			#if not d_hdr_param['b_text'] and not self.b_fill_missing_headers:
-			#	continue
+		# Header and body records share the same 42-byte layout, so the whole
+		# file is decoded in one pass with the ODFBody codec.
+		if not (ODFBody.get_struct().size == self.record_size):
+			raise ODFException("Failed ODF Record Integrity Test.")
+
+		header_count = len(self.ld_header_layout)
+		s_buf = fp_bin_odf.read()
+		if len(s_buf) < header_count * self.record_size:
+			raise ODFEOF("Truncated ODF header")
+		l_records = ODFBody.unpack_records(s_buf)
+
+		# Parse headers. The header value is stored in the ODF_OPEN slot.
+		for i in range(header_count):
+			d_hdr_param = list(self.ld_header_layout[i].values())[0]
+			recno = d_hdr_param['storloc']
+			d_odf_hdr_rec = OrderedDict()
+			d_odf_hdr_rec['ODF_RECNO'] = recno
+			d_odf_hdr_rec['ODF_OPEN'] = l_records[i][1]
+			d_odf_hdr_rec['ODF_HIGH'] = dc.Decimal('0')
+			d_odf_hdr_rec['ODF_LOW'] = dc.Decimal('0')
+			d_odf_hdr_rec['ODF_CLOSE'] = dc.Decimal('0')
+			d_odf_hdr_rec['ODF_VOLUME'] = dc.Decimal('0')
+			self.d_recno_index[recno] = d_odf_hdr_rec
 
-			odf_header = ODFHeader(**d_hdr_param)
-			odf_header.read_bin_stream(fp_bin_odf)
-			
-			if not (odf_header.get_size() == self.record_size):
-				raise ODFException("Failed Header Integrity Test.")
-
-			recno = odf_header.get_recno()
-			
-			# check if the header record we read was stored.
+		# Parse body
+		ls_fields = ODFRecordArray.ls_fields
+		for t_rec in l_records[header_count:]:
+			# Skip null records.
+			recno = t_rec[0]
 			if recno == 0:
 				continue
-
-			self.d_recno_index[recno] = odf_header.to_dict()
-			#log.debug(odf_header.d_fields)
-		# Parse body
-		try:
-			while True:
-				odf_body = ODFBody()
-				odf_body.read_bin_stream(fp_bin_odf)
-				# Check if record size is correct (42 bytes)
-				if not (odf_body.get_size() == self.record_size):
-					raise ODFException("Failed ODF Record Integrity Test.")
-				# Skip null records.
-				recno = odf_body.get_recno()
-				if recno == 0:
-					continue
-				self.d_recno_index[recno] = odf_body.to_dict()
-		except ODFEOF as err:
-			# EOF breaks the loop
-			log.debug("EOF detected")
-			pass
-		except:
-			raise
+			self.d_recno_index[recno] = OrderedDict(zip(ls_fields, t_rec))
 
 
 	def read_text_stream(self, fp_txt_odf):
@@ -492,6 +824,15 @@ class ODF(BinaryStruct):
 		For duplicates, the most recently seen record overrides previous ones.
 		@param fp_txt_odf: Text stream
 		"""
+		for d_odf_rec in self.iter_text_stream(fp_txt_odf):
+			self.d_recno_index[d_odf_rec['ODF_RECNO']] = d_odf_rec
+
+	def iter_text_stream(self, fp_txt_odf, s_odf_basename=None):
+		""" Parse records from a text stream one at a time, headers first, in file order.
+		Yields each record in the dict form used by to_dict. Duplicates are not removed.
+		@param fp_txt_odf: Text stream
+		@param s_odf_basename: If given, set as the ODF_NAME of each record.
+		"""
 
 		# Parse headers
 		# To do: store odf records as a list of dicts in internally instead of 
@@ -518,7 +859,10 @@ class ODF(BinaryStruct):
 			if recno == 0:
 				continue
 
-			self.d_recno_index[recno] = odf_header.to_dict()
+			d_odf_rec = odf_header.to_dict()
+			if s_odf_basename is not None:
+				d_odf_rec['ODF_NAME'] = s_odf_basename
+			yield d_odf_rec
 
 		try:
 			# Parse body
@@ -533,7 +877,10 @@ class ODF(BinaryStruct):
 				if recno == 0:
 					log.debug("Null record in text file")
 					raise ODFException("Null record in text file")
-				self.d_recno_index[recno] = odf_body.to_dict()
+				d_odf_rec = odf_body.to_dict()
+				if s_odf_basename is not None:
+					d_odf_rec['ODF_NAME'] = s_odf_basename
+				yield d_odf_rec
 		except ODFEOF as err:
 			# EOF breaks the loop
 			pass
@@ -542,40 +889,35 @@ class ODF(BinaryStruct):
 
 	def to_bin(self):
 		""" Pack this ODF into its binary format.
+
+		Records are packed straight into a buffer preallocated for every recno up
+		to the final one. Missing records are left zeroed, which is exactly what
+		a null ODFBody packs to.
 		"""
-		
-		buf = b''
-		null_odf_rec = ODFBody()
-		l_recnos = sorted(list(self.d_recno_index.keys()))
+		l_recnos = self.get_sorted_recnos()
 		final_recno = l_recnos[-1]
-		expected_buf_len = final_recno * self.record_size
-		for current_recno in range(1, final_recno+1):
-
-			if current_recno in self.d_recno_index:
-				d_odf_rec = self.d_recno_index[current_recno]
-				if self.is_header_recno(current_recno):
-					d_hdr_param = list(self.ld_header_layout[current_recno-1].values())[0]
-					hdr_value = d_odf_rec['ODF_OPEN']
-					odf_header = ODFHeader(value=float(hdr_value), **d_hdr_param)
-					buf = buf + odf_header.to_bin()
-				else:
-					d_bin_rec = {}
-					d_bin_rec['ODF_RECNO'] = int(d_odf_rec['ODF_RECNO'])
-					d_bin_rec['ODF_OPEN'] = float(d_odf_rec['ODF_OPEN'])
-					d_bin_rec['ODF_HIGH'] = float(d_odf_rec['ODF_HIGH'])
-					d_bin_rec['ODF_LOW'] = float(d_odf_rec['ODF_LOW'])
-					d_bin_rec['ODF_CLOSE'] = float(d_odf_rec['ODF_CLOSE'])
-					d_bin_rec['ODF_VOLUME'] = float(d_odf_rec['ODF_VOLUME'])
-
-					odf_body = ODFBody(d_fields=d_bin_rec)
-					buf = buf + odf_body.to_bin()
+		record_size = self.record_size
+		# Header records pack to the same layout as body records: storloc, the
+		# header value and 32 bytes of zero padding.
+		pack_into = ODFRecordArray.st_record.pack_into
+
+		buf = bytearray(final_recno * record_size)
+
+		for current_recno in l_recnos:
+			d_odf_rec = self.d_recno_index[current_recno]
+			offset = (current_recno - 1) * record_size
+			if self.is_header_recno(current_recno):
+				pack_into(buf, offset, current_recno,
+							float(d_odf_rec['ODF_OPEN']), 0.0, 0.0, 0.0, 0.0)
 			else:
-				buf = buf + null_odf_rec.to_bin()
+				pack_into(buf, offset, int(d_odf_rec['ODF_RECNO']),
+							float(d_odf_rec['ODF_OPEN']),
+							float(d_odf_rec['ODF_HIGH']),
+							float(d_odf_rec['ODF_LOW']),
+							float(d_odf_rec['ODF_CLOSE']),
+							float(d_odf_rec['ODF_VOLUME']))
 
-		if not len(buf) == expected_buf_len:
-			raise ODFException("Error encoding Odf to binary")
-
-		return buf
+		return bytes(buf)
 
 	def to_bin_file(self, s_odf_bin):
 		fp_odf_bin = open(s_odf_bin, "wb")
@@ -583,20 +925,71 @@ class ODF(BinaryStruct):
 		fp_odf_bin.write(buf)
 		fp_odf_bin.close()
 
+	def is_partial(self):
+		""" Is only part of this ODF loaded? See ODFArray.open_tail()
+		"""
+		return False
+
+	def close(self):
+		""" Release the resources held by this ODF. Nothing to release for an
+		ODF read into memory; see ODFArray.close().
+		"""
+		pass
+
 	def is_header_recno(self, recno):
 		return (recno <= len(self.ld_header_layout))
 
+	def is_recno_index_stale(self):
+		""" Has d_recno_index been replaced, or added to behind the back of the
+		sorted recno index?
+		"""
+		return self.sorted_recnos_source is not self.d_recno_index or \
+			len(self.a_sorted_recnos) != len(self.d_recno_index)
+
+	def get_sorted_recnos(self):
+		""" Return the recnos of all records (headers and body) as an ascending array.
+		The index is built on first use and kept up to date by add_missing_record
+		and add_missing_header; it is rebuilt if it has gone stale.
+		"""
+		if self.a_sorted_recnos is None or self.is_recno_index_stale():
+			self.a_sorted_recnos = array('l', sorted(self.d_recno_index.keys()))
+			self.sorted_recnos_source = self.d_recno_index
+		return self.a_sorted_recnos
+
+	def index_recno(self, recno):
+		""" Update the sorted recno index for a record about to be stored at recno.
+		New highest recnos are appended; a recno inserted lower down drops the index,
+		to be rebuilt in one go by the next get_sorted_recnos().
+		"""
+		a_recnos = self.a_sorted_recnos
+		if a_recnos is None or self.is_recno_index_stale():
+			return
+		if not a_recnos or recno > a_recnos[-1]:
+			a_recnos.append(recno)
+		elif not self.recno_exists(recno):
+			self.a_sorted_recnos = None
+
+	def get_lowest_body_recno(self):
+		""" Return the lowest non-header recno, or 0 if there are no body records.
+		"""
+		l_recnos = self.get_sorted_recnos()
+		i = bisect_right(l_recnos, len(self.ld_header_layout))
+		if i < len(l_recnos):
+			return l_recnos[i]
+		return 0
+
 	def to_dict(self, s_odf_basename):
 		""" Create a list of dicts to write to DD. Does deduplication along the fly.
 		"""
 		ld_odf_recs = []
-		l_recnos = sorted(list(self.d_recno_index.keys()))
+		l_recnos = self.get_sorted_recnos()
 
 		for recno in l_recnos:
-			d_odf_rec = self.d_recno_index[recno]
+			d_odf_rec = OrderedDict(self.d_recno_index[recno])
 			if self.is_header_recno(recno):
 				hdr_value = list(d_odf_rec.values())[1]
-				d_hdr_param = list(self.ld_header_layout[recno].values())[0]
+				# Header storlocs start at 1
+				d_hdr_param = list(self.ld_header_layout[recno - 1].values())[0]
 				odf_header = ODFHeader(value=hdr_value, **d_hdr_param)
 				d_odf_rec = odf_header.to_dict()
 			d_odf_rec['ODF_NAME'] = s_odf_basename
@@ -608,7 +1001,7 @@ class ODF(BinaryStruct):
 		""" Return a text representation of the ODF.
 		"""
 		buf = ""
-		l_recnos = sorted(list(self.d_recno_index.keys()))
+		l_recnos = self.get_sorted_recnos()
 		for recno in l_recnos:
 			d_odf_rec = self.d_recno_index[recno]
 			if self.is_header_recno(recno):
@@ -629,8 +1022,7 @@ class ODF(BinaryStruct):
 
 
 	def get_highest_recno(self):
-		l_recnos = sorted(list(self.d_recno_index.keys()))
-		return l_recnos[-1]
+		return self.get_sorted_recnos()[-1]
 
 
 	def recno_exists(self, recno):
@@ -701,6 +1093,28 @@ class ODF(BinaryStruct):
 		else:
 			return dc.Decimal("0")
 
+	def get_fixed_values(self, l_recnos, ohlc_divider):
+		""" Return the prices of the given recnos as integers scaled by ohlc_divider.
+		Returns columns (open, high, low, close) as array('q'), and volume as array('d').
+		Missing records read as zeros. Raises ODFOffGridPrice, see to_fixed().
+		@param l_recnos: List of record nos.
+		@param ohlc_divider: OHLC_DIVIDER of the ODF, e.g. 100.
+		"""
+		a_open = array('q')
+		a_high = array('q')
+		a_low = array('q')
+		a_close = array('q')
+		a_volume = array('d')
+
+		for recno in l_recnos:
+			a_open.append(to_fixed(self.get_value(recno, 'ODF_OPEN'), ohlc_divider))
+			a_high.append(to_fixed(self.get_value(recno, 'ODF_HIGH'), ohlc_divider))
+			a_low.append(to_fixed(self.get_value(recno, 'ODF_LOW'), ohlc_divider))
+			a_close.append(to_fixed(self.get_value(recno, 'ODF_CLOSE'), ohlc_divider))
+			a_volume.append(float(self.get_value(recno, 'ODF_VOLUME')))
+
+		return (a_open, a_high, a_low, a_close, a_volume)
+
 	def add_missing_record(self, recno, dc_open, dc_high, dc_low, dc_close, dc_volume=dc.Decimal('0')):
 
 		d_rec = {
@@ -714,10 +1128,29 @@ class ODF(BinaryStruct):
 
 		if recno in self.d_recno_index:
 			log.warning("Record at %d already exists. Overwriting." % recno)
+		self.index_recno(recno)
 		self.d_recno_index[recno] = d_rec
 
 		#self.l_odf_body.append(odf_record)
 
+	def fill_missing_records(self, l_recnos, dc_close):
+		""" Forward-fill the records at l_recnos that are missing, or have a zero
+		price, with the close of the last complete record before them.
+		Returns the no. of records filled.
+		@param l_recnos: Recnos to check, in ascending order.
+		@param dc_close: Close to fill with until a complete record is seen.
+		"""
+		num_filled = 0
+		for recno in l_recnos:
+			d_rec = self.d_recno_index.get(recno)
+			if d_rec is None or d_rec['ODF_OPEN'] == 0 or d_rec['ODF_HIGH'] == 0 or \
+				d_rec['ODF_LOW'] == 0 or d_rec['ODF_CLOSE'] == 0:
+				self.add_missing_record(recno, dc_close, dc_close, dc_close, dc_close)
+				num_filled += 1
+			else:
+				dc_close = d_rec['ODF_CLOSE']
+		return num_filled
+
 	def add_missing_header(self, header_storloc, dc_header_value):
 		d_header_layout = self.ld_header_layout[int(header_storloc)-1]
 		d_header_kwargs = list(d_header_layout.values())[0]
@@ -727,6 +1160,7 @@ class ODF(BinaryStruct):
 		odf_hdr_rec = ODFHeader(value=dc_header_value, **d_header_kwargs)
 
 		#self.l_odf_headers.append(odf_hdr_rec)
+		self.index_recno(int(header_storloc))
 		self.d_recno_index[int(header_storloc)] = odf_hdr_rec.to_dict()
 
 
@@ -735,35 +1169,19 @@ class ODF(BinaryStruct):
 	"""
 
 	def get_recnos_within_limits(self, config):
-		
-		for recno in range(int(config.last_fced_recno), int(config.highest_recno) + 1):
-			if self.is_recno_out_of_limits(recno, config.trading_start_recno, config.trading_recs_perday):
-				continue
-			yield recno
-		
+		""" Return the in-session recnos from LAST_FCED_RECNO to HIGHEST_RECNO as an array.
+		"""
+		return array('l', get_session_recnos(config.last_fced_recno, config.highest_recno, 
+											config.trading_start_recno, config.trading_recs_perday))
 			
 	def is_recno_out_of_limits(self, recno, trading_start_recno, trading_recs_perday):
-		n = recno
-
-		while n > 0:
-			if n > trading_start_recno and n < (trading_recs_perday + trading_start_recno):
-				return False
-			n -= 1400
-
-		return True
+		return not is_recno_in_session(recno, trading_start_recno, trading_recs_perday)
 
 	def find_highest_recno(self, trading_start_recno, trading_recs_perday):
 		# highest record no. in the odf
 		#r = self.l_odf_body[-1].get_recno()
-		l_recnos = sorted(list(self.d_recno_index.keys()))
-		
-		lowest_recno = 0
-		for recno in l_recnos:
-			if self.is_header_recno(recno):
-				continue
-			lowest_recno = recno
-			break
-		r = l_recnos[-1]
+		lowest_recno = self.get_lowest_body_recno()
+		r = self.get_highest_recno()
 
 		log.debug("Finding highest_recno starting from: %d with (%d, %d)" % (r, trading_start_recno, trading_recs_perday))
 		log.debug("lowest_recno=%d" % lowest_recno)
@@ -817,7 +1235,7 @@ class ODF(BinaryStruct):
 
 		vol_tick = dc.Decimal('1.0')
 		prev_vol = dc.Decimal('0')
-		l_recnos = sorted(list(self.d_recno_index.keys()))
+		l_recnos = self.get_sorted_recnos()
 		max_recno = l_recnos[-1]
 
 		for recno in l_recnos:
@@ -833,6 +1251,291 @@ class ODF(BinaryStruct):
 		return vol_tick
 
 
+class ODFArray(ODF):
+	""" ODF backed by a single packed ODFRecordArray instead of a dict of dicts.
+
+	Values are still handed out as Decimals, so callers see the same API as ODF.
+	"""
+
+	def __init__(self, b_fill_missing_headers=False):
+		""" Constructor
+		"""
+		super(ODFArray, self).__init__(b_fill_missing_headers)
+		self.d_recno_index = ODFRecordArray()
+		# First recno loaded by open_tail(), or None if the whole ODF is loaded.
+		self.tail_recno = None
+
+	def get_field(self, recno, s_field_name):
+		return self.get_value(recno, s_field_name)
+
+	def get_value(self, recno, s_field_name):
+		recno = int(recno)
+		rec_array = self.d_recno_index
+		if not rec_array.has_recno(recno):
+			return dc.Decimal('0')
+		value = rec_array.get_value(recno, s_field_name)
+		if s_field_name == 'ODF_RECNO':
+			return value
+		return dc.Decimal(str(value))
+
+	def get_header_value(self, header_storloc):
+		return self.get_value(header_storloc, 'ODF_OPEN')
+
+	def set_header_value(self, header_storloc, value):
+		header_storloc = int(header_storloc)
+		if not self.d_recno_index.has_recno(header_storloc):
+			raise KeyError(header_storloc)
+		self.d_recno_index.set_value(header_storloc, 'ODF_OPEN', value)
+
+	def recno_exists(self, recno):
+		return self.d_recno_index.has_recno(recno)
+
+	def get_fixed_values(self, l_recnos, ohlc_divider):
+		""" Same as ODF.get_fixed_values, but reads the packed doubles directly
+		without going through Decimal.
+		"""
+		ohlc_divider = int(ohlc_divider)
+		a_open = array('q')
+		a_high = array('q')
+		a_low = array('q')
+		a_close = array('q')
+		a_volume = array('d')
+
+		rec_array = self.d_recno_index
+		for recno in l_recnos:
+			recno = int(recno)
+			if rec_array.has_recno(recno):
+				(_, f_open, f_high, f_low, f_close, f_volume) = rec_array.get_record(recno)
+			else:
+				(f_open, f_high, f_low, f_close, f_volume) = (0.0, 0.0, 0.0, 0.0, 0.0)
+			a_open.append(to_fixed(f_open, ohlc_divider))
+			a_high.append(to_fixed(f_high, ohlc_divider))
+			a_low.append(to_fixed(f_low, ohlc_divider))
+			a_close.append(to_fixed(f_close, ohlc_divider))
+			a_volume.append(f_volume)
+
+		return (a_open, a_high, a_low, a_close, a_volume)
+
+	def get_highest_recno(self):
+		return self.d_recno_index.highest_recno
+
+	def fill_missing_records(self, l_recnos, dc_close):
+		""" Same as ODF.fill_missing_records, but reads and writes the packed
+		records directly.
+		"""
+		rec_array = self.d_recno_index
+		f_close = float(dc_close)
+		num_filled = 0
+		for recno in l_recnos:
+			if rec_array.has_recno(recno):
+				(_, f_open, f_high, f_low, f_rec_close, _) = rec_array.get_record(recno)
+				if f_open != 0 and f_high != 0 and f_low != 0 and f_rec_close != 0:
+					f_close = f_rec_close
+					continue
+				log.warning("Record at %d already exists. Overwriting." % recno)
+			else:
+				self.index_recno(recno)
+			rec_array.set_record(recno, f_close, f_close, f_close, f_close, 0.0)
+			num_filled += 1
+		return num_filled
+
+	def read_bin_stream(self, fp_bin_odf):
+		""" Read a binary ODF in one go and adopt it as the record array.
+		Records stored out of position are moved to their own slots; for
+		duplicates, the most recently seen record overrides previous ones.
+		@param fp_bin_odf: Binary stream.
+		"""
+		buf = bytearray(fp_bin_odf.read())
+		record_size = self.record_size
+
+		if len(buf) % record_size:
+			raise ODFException("Failed ODF Record Integrity Test.")
+
+		num_headers = len(self.ld_header_layout)
+
+		rec_array = ODFRecordArray(buf)
+
+		num_misplaced = self.count_misplaced_records(rec_array)
+		if num_misplaced:
+			log.debug("Relocating %d misplaced records" % num_misplaced)
+			rec_array = ODFRecordArray(bytearray(buf[:num_headers * record_size]))
+			for slot in range(num_headers + 1, len(buf) // record_size + 1):
+				l_values = ODFRecordArray.st_record.unpack_from(buf, (slot - 1) * record_size)
+				if l_values[0] == 0:
+					continue
+				rec_array.set_record(*l_values)
+
+		self.set_header_slots(rec_array)
+
+		self.d_recno_index = rec_array
+
+	def count_misplaced_records(self, rec_array):
+		""" Count the body records not stored in the slot of their own recno.
+		@param rec_array: ODFRecordArray over the raw file contents.
+		"""
+		buf = rec_array.buf
+		num_misplaced = 0
+		for slot in range(len(self.ld_header_layout) + 1, rec_array.capacity + 1):
+			recno = rec_array.st_recno.unpack_from(buf, rec_array.get_offset(slot))[0]
+			if recno != 0 and recno != slot:
+				num_misplaced += 1
+		return num_misplaced
+
+	def read_text_stream(self, fp_txt_odf):
+		""" Read and parse a text ODF in a single pass. For duplicates, the most
+		recently seen record overrides previous ones.
+		@param fp_txt_odf: Text stream
+		"""
+		ls_lines = fp_txt_odf.read().splitlines()
+
+		ld_text_headers = []
+		for d_header in self.ld_header_layout:
+			d_hdr_param = list(d_header.values())[0]
+			# Skip over header records that are not in text file.
+			if d_hdr_param['b_text']:
+				ld_text_headers.append(d_hdr_param)
+
+		num_headers = len(ld_text_headers)
+		if len(ls_lines) < num_headers:
+			raise ODFIOError("Empty file")
+
+		rec_array = ODFRecordArray()
+
+		for s_line, d_hdr_param in zip(ls_lines, ld_text_headers):
+			hdr_value = d_hdr_param['fn_parse'](s_line.strip())
+			rec_array.set_record(d_hdr_param['storloc'], hdr_value, 0.0, 0.0, 0.0, 0.0)
+
+		t_columns = parse_txt_body(ls_lines[num_headers:])
+
+		if 0 in t_columns[0]:
+			log.debug("Null record in text file")
+			raise ODFException("Null record in text file")
+
+		rec_array.set_records(*t_columns)
+
+		self.d_recno_index = rec_array
+
+	def set_header_slots(self, rec_array):
+		""" Header records are positional, like in ODF.read_bin_stream: the slot
+		number is the storloc, even if the stored storloc is zero.
+		"""
+		for storloc in range(1, len(self.ld_header_layout) + 1):
+			hdr_value = 0.0
+			if storloc <= rec_array.capacity:
+				hdr_value = rec_array.get_value(storloc, 'ODF_OPEN')
+			rec_array.set_record(storloc, hdr_value, 0.0, 0.0, 0.0, 0.0)
+
+	@classmethod
+	def open_mmap(cls, s_odf_bin):
+		""" Open a binary ODF without reading it: the file is mapped copy-on-write
+		and records are only decoded when they are asked for. If any record is
+		stored out of position, the file is read with read_bin_stream instead,
+		which relocates it. Call close() when done with the ODF.
+		@param s_odf_bin: Path to the binary ODF.
+		"""
+		odf_obj = cls()
+
+		fp_odf_bin = open(s_odf_bin, "rb")
+		try:
+			size = os.fstat(fp_odf_bin.fileno()).st_size
+			if size % odf_obj.record_size:
+				raise ODFException("Failed ODF Record Integrity Test.")
+			if size == 0:
+				# Empty files cannot be mapped.
+				rec_array = ODFRecordArray()
+			else:
+				mm = mmap.mmap(fp_odf_bin.fileno(), 0, access=mmap.ACCESS_COPY)
+				rec_array = ODFRecordArray(mm)
+				if odf_obj.count_misplaced_records(rec_array):
+					rec_array.close()
+					fp_odf_bin.seek(0)
+					odf_obj.read_bin_stream(fp_odf_bin)
+					return odf_obj
+		finally:
+			fp_odf_bin.close()
+
+		odf_obj.set_header_slots(rec_array)
+		odf_obj.d_recno_index = rec_array
+		return odf_obj
+
+	@classmethod
+	def open_tail(cls, s_odf_bin, from_recno):
+		""" Open a binary ODF reading only the header block and the records from
+		from_recno onwards. Earlier records read as missing. The ODF is partial:
+		to_bin_file() writes back the same regions in place, and to_bin() refuses.
+		@param s_odf_bin: Path to the binary ODF.
+		@param from_recno: First body record to load.
+		"""
+		odf_obj = cls()
+		record_size = odf_obj.record_size
+		header_size = len(cls.ld_header_layout) * record_size
+
+		fp_odf_bin = open(s_odf_bin, "rb")
+		try:
+			size = os.fstat(fp_odf_bin.fileno()).st_size
+			if size % record_size:
+				raise ODFException("Failed ODF Record Integrity Test.")
+			if size < header_size:
+				raise ODFEOF("Truncated ODF header")
+			tail_offset = max((int(from_recno) - 1) * record_size, header_size)
+
+			buf = bytearray(size)
+			buf[:header_size] = fp_odf_bin.read(header_size)
+			if tail_offset < size:
+				fp_odf_bin.seek(tail_offset)
+				buf[tail_offset:] = fp_odf_bin.read(size - tail_offset)
+		finally:
+			fp_odf_bin.close()
+
+		rec_array = ODFRecordArray(buf)
+		odf_obj.set_header_slots(rec_array)
+		odf_obj.d_recno_index = rec_array
+		odf_obj.tail_recno = tail_offset // record_size + 1
+		return odf_obj
+
+	def is_partial(self):
+		return self.tail_recno is not None
+
+	def close(self):
+		""" Release the file mapping of an ODF opened with open_mmap().
+		"""
+		self.d_recno_index.close()
+
+	def to_bin(self):
+		""" Pack this ODF into its binary format. The record array already is.
+		"""
+		if self.is_partial():
+			raise ODFException("Cannot pack a partially loaded ODF")
+		return self.d_recno_index.to_bin()
+
+	def to_bin_file(self, s_odf_bin):
+		if self.is_partial():
+			self.save_tail(s_odf_bin)
+			return
+		# Detach from the mapped file first: it may be the one we overwrite.
+		self.d_recno_index.materialise()
+		super(ODFArray, self).to_bin_file(s_odf_bin)
+
+	def save_tail(self, s_odf_bin):
+		""" Write back the header block and the loaded tail of an ODF opened with
+		open_tail(), in place. The rest of the file is left untouched.
+		@param s_odf_bin: Path to the binary ODF.
+		"""
+		rec_array = self.d_recno_index
+		header_size = len(self.ld_header_layout) * self.record_size
+		tail_offset = (self.tail_recno - 1) * self.record_size
+		tail_end = rec_array.highest_recno * self.record_size
+
+		fp_odf_bin = open(s_odf_bin, "r+b")
+		try:
+			fp_odf_bin.write(rec_array.buf[:header_size])
+			if tail_end > tail_offset:
+				fp_odf_bin.seek(tail_offset)
+				fp_odf_bin.write(rec_array.buf[tail_offset:tail_end])
+		finally:
+			fp_odf_bin.close()
+
+
 def open_odf_bin(s_odf_bin):
 	odf_obj = ODF()
 	fp_odf_bin = open(s_odf_bin, "rb")
@@ -840,6 +1543,28 @@ def open_odf_bin(s_odf_bin):
 	fp_odf_bin.close()
 	return odf_obj
 
+def read_odf_headers(s_odf_bin):
+	""" Read only the header block of a binary ODF. Returns a dict of
+	header values (Decimals) by storloc.
+	@param s_odf_bin: Path to the binary ODF.
+	"""
+	header_count = len(ODF.ld_header_layout)
+	fp_odf_bin = open(s_odf_bin, "rb")
+	try:
+		s_buf = fp_odf_bin.read(header_count * ODFBody.get_struct().size)
+	finally:
+		fp_odf_bin.close()
+	if len(s_buf) < header_count * ODFBody.get_struct().size:
+		raise ODFEOF("Truncated ODF header")
+
+	d_headers = {}
+	for (storloc, t_rec) in enumerate(ODFBody.unpack_records(s_buf), 1):
+		d_headers[storloc] = t_rec[1]
+	return d_headers
+
+def open_odf_mmap(s_odf_bin):
+	return ODFArray.open_mmap(s_odf_bin)
+
 def open_odf_text(s_odf_txt):
 	odf_obj = ODF()
 	fp_odf_txt = open(s_odf_txt, "r")
@@ -34,6 +34,11 @@ import argparse
 import sys
 import glob
 import math
+import time
+import itertools
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from odfexcept import *
 import config
@@ -49,6 +54,19 @@ import logging
 import logging.handlers
 log = logging.getLogger(__name__)
 
+""" Our own modules, which log at DEBUG. Boto & other libraries stay at the root level.
+"""
+LS_LOG_MODULES = ['binary', 'fifo', 'odf', 'fce', 'odfproc', 'odfexcept',
+				'dd', 'odf2fce', 's3', 'config', 'chunk', '__main__']
+
+def set_log_levels(logger):
+	""" Set the levels of the root logger and of our own modules' loggers.
+	@param logger: Root logger.
+	"""
+	logger.setLevel(logging.ERROR)
+	for s_module in LS_LOG_MODULES:
+		logging.getLogger(s_module).setLevel(logging.DEBUG)
+
 
 def rounddown(n):
 	return math.floor(n)
@@ -59,6 +77,56 @@ def roundup(n):
 		return 1
 	return n
 
+""" Per-process application object used by pool workers in --workers mode.
+"""
+worker_app = None
+
+def init_worker_logging(log_queue):
+	""" Send all of this worker's log records to the parent process through
+	log_queue, in place of the handlers inherited from the parent. Only the
+	parent writes to, and rotates, the log file.
+	@param log_queue: Queue read by the parent's QueueListener.
+	"""
+	logger = logging.getLogger()
+	for handler in list(logger.handlers):
+		logger.removeHandler(handler)
+	logger.addHandler(logging.handlers.QueueHandler(log_queue))
+	set_log_levels(logger)
+
+def init_worker(s_settings_file, b_show, b_daemon=False, log_queue=None):
+	""" Process pool initializer. Builds the worker's own config & stores,
+	which are then reused for every ODF handed to this worker.
+	@param s_settings_file: Path to the settings file.
+	@param b_show: Show the name of each ODF as it is being processed.
+	@param b_daemon: Running in daemon mode, so return ODF stamps.
+	@param log_queue: If given, log through the parent via this queue. (default: None)
+	"""
+	if log_queue is not None:
+		init_worker_logging(log_queue)
+
+	global worker_app
+	worker_app = Odf2Fce()
+	worker_app.config = config.Config()
+	worker_app.config.read_settings(s_settings_file)
+	worker_app.b_show = b_show
+	worker_app.b_daemon = b_daemon
+	worker_app.dd_store = dd.get_dd_store(worker_app.config)
+	worker_app.s3_store = s3.get_s3_store(worker_app.config)
+	worker_app.s_app_dir = worker_app.get_working_dir()
+
+def odf2fce_worker(s_exchange, s_odf_dd):
+	""" Process a single ODF in a pool worker. Returns (s_exchange, s_odf_dd, odf_stamp, s_error),
+	where odf_stamp is as returned by Odf2Fce.odf2fce_stamped, and s_error is None
+	on success or the formatted traceback on failure.
+	@param s_exchange: Exchange name.
+	@param s_odf_dd: ODF path on DD.
+	"""
+	try:
+		odf_stamp = worker_app.odf2fce_stamped(worker_app.config, s_exchange, s_odf_dd)
+	except:
+		return (s_exchange, s_odf_dd, None, traceback.format_exc())
+	return (s_exchange, s_odf_dd, odf_stamp, None)
+
 class Odf2Fce(object):
 	""" Application class for ODF to FCE conversion
 	"""
@@ -69,6 +137,18 @@ class Odf2Fce(object):
 		""" Constructor
 		"""
 		self.parser = argparse.ArgumentParser(description='ODF to FCE Processor.')
+		self.workers = 1
+		self.b_daemon = False
+		self.interval = 300
+		# Stores & worker pool are created once, and kept between daemon cycles.
+		self.dd_store = None
+		self.s3_store = None
+		self.executor = None
+		# Writes the pool workers' log records to our own handlers.
+		self.log_listener = None
+		# (ODF stamp, current jsunnoon) as of the last successful processing of
+		# each ODF in this process, by ODF path. See AbstractDDStore.get_odf_stamp.
+		self.d_odf_stamps = {}
 
 	def arg_parse(self):
 		""" Specify command line args, and parse the command line
@@ -87,6 +167,22 @@ class Odf2Fce(object):
 							action='store_true',
 	                   		help='Only print contents of each fifo to the log.')
 		
+		parser.add_argument('-w', '--workers',
+							type=int,
+							default=1,
+	                   		help='Number of worker processes to convert ODFs in parallel. (default: 1)')
+		
+		parser.add_argument('-d', '--daemon',
+							action='store_true',
+	                   		help='Keep running, starting a new cycle every --interval seconds. ' 
+	                   			'Only ODFs that changed since the previous cycle are processed. '
+	                   			'settings.txt is read once, at start up.')
+		
+		parser.add_argument('-i', '--interval',
+							type=int,
+							default=300,
+	                   		help='Seconds between the starts of daemon cycles. (default: 300)')
+		
 		return parser.parse_args()
 
 	def set_args(self, args):
@@ -105,6 +201,20 @@ class Odf2Fce(object):
 		
 		if hasattr(args, "print_fifo") and args.print_fifo is not None:
 			self.b_print_mode = args.print_fifo
+
+		self.workers = 1
+
+		if hasattr(args, "workers") and args.workers is not None:
+			self.workers = max(1, args.workers)
+
+		self.b_daemon = False
+		self.interval = 300
+
+		if hasattr(args, "daemon") and args.daemon is not None:
+			self.b_daemon = args.daemon
+
+		if hasattr(args, "interval") and args.interval is not None:
+			self.interval = max(0, args.interval)
 		
 	def prompt_interactive(self):
 		""" Prompt the user on stdin to continue with the program.
@@ -269,37 +379,10 @@ class Odf2Fce(object):
 
 		log.debug("Filling missing ODF records starting at %d" % r)
 
-		while True:
-
-			r = r + 1
-			
-			if r > config.highest_recno:
-				return True
-			
-			if odf_obj.is_recno_out_of_limits(r, config.trading_start_recno, config.trading_recs_perday):
-				continue
-
-			dc_odf_open = odf_obj.get_field(r, 'ODF_OPEN')
-			dc_odf_high = odf_obj.get_field(r, 'ODF_HIGH')
-			dc_odf_low = odf_obj.get_field(r, 'ODF_LOW')
-			dc_odf_close = odf_obj.get_field(r, 'ODF_CLOSE')
-			dc_odf_volume = odf_obj.get_field(r, 'ODF_VOLUME')
-
-			if dc_odf_open == 0 or dc_odf_high == 0 or \
-				dc_odf_low == 0 or dc_odf_close == 0:
-				''' Fill the missing record
-				''' 
-				odf_obj.add_missing_record(r, 
-											c, 
-											c, 
-											c, 
-											c, 
-											c)
-				break
-			else:
-				''' Use this record's Close value to forward fill the next record.
-				'''
-				c = dc_odf_close
+		l_recnos = odf.get_session_recnos(r + 1, config.highest_recno, 
+										config.trading_start_recno, config.trading_recs_perday)
+		num_filled = odf_obj.fill_missing_records(l_recnos, c)
+		log.debug("Filled %d missing ODF records" % num_filled)
 
 		return True
 
@@ -383,6 +466,7 @@ class Odf2Fce(object):
 		s3_store = ctx.s3_store
 		config = ctx.config
 		
+		num_written = 0
 		for i in range(chunk_arr_short_list.length()):
 			chunk_arr_short = chunk_arr_short_list.get_chunk_arr_at(i)
 			s_chunk_arr_short_name = chunk_arr_short.get_name()
@@ -390,73 +474,17 @@ class Odf2Fce(object):
 			(L_no, fce_jsunnoon, chunk_no) = chunk.get_components_from_chunk_name(s_chunk_arr_short_name)
 
 			#log.debug("Writing chunk & CSV to TMP & S3: %s..." % s_chunk_file_name_tmp)
-			s3_store.save_chunk_file(ctx, L_no, fce_jsunnoon, chunk_arr_short, config.encr_key, config.b_do_csv_chunk)
-
-
-	def find_first_nonzero_chunk_open(self, ctx, chunk_arr):
-		n = 0
-		chunk_open = 0
-		while True:
-			
-			n = n + 1
-			
-			chunk_open = chunk_arr.get_field(n, 'OPEN')
-
-			if chunk_open > 0:
-				break
-
-			if n == ctx.config.chunk_size:
-				return (ctx.config.chunk_size, 0)
-
+			if s3_store.save_chunk_file(ctx, L_no, fce_jsunnoon, chunk_arr_short, config.encr_key, config.b_do_csv_chunk):
+				num_written += 1
 
-		return (n, chunk_open)
-
-
-	def find_last_nonzero_chunk_close(self, ctx, chunk_arr):
-		n = ctx.config.chunk_size + 1
-		chunk_close = 0
-		while True:
-			
-			n = n -1
-			
-			chunk_close = chunk_arr.get_field(n, 'CLOSE')
-
-			if chunk_close > 0:
-				break
-
-			if n == 1:
-				return (1, 0)
-				
-		return (n, chunk_close)
+		log.debug("Wrote %d of %d chunk files (others unchanged)" % (num_written, chunk_arr_short_list.length()))
 
 
 	def fill_empty_chunk_records(self, ctx, chunk_arr):
 		
-		(first_nonzero_chunk_recno, first_nonzero_chunk_open) = self.find_first_nonzero_chunk_open(ctx, chunk_arr)
-
-		m = first_nonzero_chunk_recno
-
 		# First try back-fill, then fall back to forward-fill
-		while True:
-			m = m - 1		
-
-			if m < 1:
-				(last_nonzero_chunk_recno, last_nonzero_chunk_close) = self.find_last_nonzero_chunk_close(ctx, chunk_arr)
-				m = last_nonzero_chunk_recno
-				while True:
-					m = m + 1
-					if m > ctx.config.chunk_size:
-						return chunk_arr
-					else:
-						chunk_arr.set_field(m, 'OPEN', last_nonzero_chunk_close)
-						chunk_arr.set_field(m, 'HIGH', last_nonzero_chunk_close)
-						chunk_arr.set_field(m, 'LOW', last_nonzero_chunk_close)
-						chunk_arr.set_field(m, 'CLOSE', last_nonzero_chunk_close)
-			else:
-				chunk_arr.set_field(m, 'OPEN', first_nonzero_chunk_open)
-				chunk_arr.set_field(m, 'HIGH', first_nonzero_chunk_open)
-				chunk_arr.set_field(m, 'LOW', first_nonzero_chunk_open)
-				chunk_arr.set_field(m, 'CLOSE', first_nonzero_chunk_open)
+		chunk_arr.fill_empty_records()
+		return chunk_arr
 
 
 	def get_chunk_arr_short_list(self, ctx, chunk_arr_list):
@@ -482,22 +510,26 @@ class Odf2Fce(object):
 
 		return chunk_arr_short_list
 
+	def new_chunk_arr(self, ctx, s_chunk_file_name, debug_id=0, typecode='d'):
+		""" Create an empty chunk array, dense if DENSE_CHUNK_ARRAY is set.
+		@param typecode: Column typecode of the dense array, 'd' for long chunks,
+						'q' for short chunks. (default: 'd')
+		"""
+		if ctx.config.b_dense_chunk_array:
+			return chunk.DenseChunkArray(s_chunk_file_name, ctx.config.chunk_size, debug_id=debug_id, typecode=typecode)
+		return chunk.ChunkArray(s_chunk_file_name, ctx.config.chunk_size, debug_id=debug_id)
+
 	def get_chunk_arr_short(self, ctx, chunk_arr):
 
-		chunk_arr_short = chunk.ChunkArray(chunk_arr.get_name(), ctx.config.chunk_size, debug_id=2)
+		chunk_arr_short = self.new_chunk_arr(ctx, chunk_arr.get_name(), debug_id=2, typecode='q')
 
-		for i in range(ctx.config.chunk_size):
-			vol_val = rounddown(chunk_arr.get_field(i+1, 'VOLUME') / chunk_arr.get_header_field('VOLUME_TICK'))
-			open_val = rounddown(chunk_arr.get_field(i+1, 'OPEN') / float(ctx.config.tick))
-			high_val = rounddown(chunk_arr.get_field(i+1, 'HIGH') / float(ctx.config.tick))
-			low_val = rounddown(chunk_arr.get_field(i+1, 'LOW') / float(ctx.config.tick))
-			close_val = rounddown(chunk_arr.get_field(i+1, 'CLOSE') / float(ctx.config.tick))
-
-			chunk_arr_short.set_field(i+1, 'VOLUME', int(vol_val))
-			chunk_arr_short.set_field(i+1, 'OPEN', int(open_val))
-			chunk_arr_short.set_field(i+1, 'HIGH', int(high_val))
-			chunk_arr_short.set_field(i+1, 'LOW', int(low_val))
-			chunk_arr_short.set_field(i+1, 'CLOSE', int(close_val))
+		try:
+			l_records = chunk.quantise_records(chunk_arr.iter_records(chunk.Chunk), ctx.config.tick, 
+											chunk_arr.get_header_field('VOLUME_TICK'))
+		except ODFException:
+			log.error("Failed to quantise chunk %s" % chunk_arr.get_name())
+			raise
+		chunk_arr_short.set_records(l_records, chunk.ShortChunk)
 
 		d_chunk_header = {
 			'LOWEST_LOW' : int(chunk_arr.get_header_field('LOWEST_LOW')),
@@ -513,19 +545,10 @@ class Odf2Fce(object):
 
 	def get_chunk_arr(self, ctx, chunk_arr_short):
 		
-		chunk_arr = chunk.ChunkArray(chunk_arr_short.get_name(), ctx.config.chunk_size, debug_id=3)
-		for i in range(ctx.config.chunk_size):
-			f_vol_val = chunk_arr_short.get_field(i+1, 'VOLUME') * chunk_arr_short.get_header_field('VOLUME_TICK')
-			f_open_val = chunk_arr_short.get_field(i+1, 'OPEN') * float(ctx.config.tick)
-			f_high_val = chunk_arr_short.get_field(i+1, 'HIGH') * float(ctx.config.tick)
-			f_low_val = chunk_arr_short.get_field(i+1, 'LOW') * float(ctx.config.tick)
-			f_close_val = chunk_arr_short.get_field(i+1, 'CLOSE') * float(ctx.config.tick)
-
-			chunk_arr.set_field(i+1, 'VOLUME', f_vol_val)
-			chunk_arr.set_field(i+1, 'OPEN', f_open_val)
-			chunk_arr.set_field(i+1, 'HIGH', f_high_val)
-			chunk_arr.set_field(i+1, 'LOW', f_low_val)
-			chunk_arr.set_field(i+1, 'CLOSE', f_close_val)
+		chunk_arr = self.new_chunk_arr(ctx, chunk_arr_short.get_name(), debug_id=3)
+		l_records = chunk.dequantise_records(chunk_arr_short.iter_records(chunk.ShortChunk), ctx.config.tick, 
+											chunk_arr_short.get_header_field('VOLUME_TICK'))
+		chunk_arr.set_records(l_records, chunk.Chunk)
 
 		d_chunk_header = {
 			'LOWEST_LOW' : chunk_arr_short.get_header_field('LOWEST_LOW') / float(ctx.config.ohlc_divider),
@@ -576,7 +599,7 @@ class Odf2Fce(object):
 			else:
 				# The chunk array does not exist, Create a new chunk array
 				#log.debug("Creating new chunk array: %s" % s_chunk_file_name)
-				chunk_arr = chunk.ChunkArray(s_chunk_file_name, chunk_size, debug_id=4)
+				chunk_arr = self.new_chunk_arr(ctx, s_chunk_file_name, debug_id=4)
 				chunk_arr = self.store_zeros_in_chunk_arr(ctx, chunk_arr)
 			# Add the newly opened chunk array to the list
 			chunk_arr_list.add_chunk_arr(chunk_arr)
@@ -586,16 +609,87 @@ class Odf2Fce(object):
 				
 		return chunk_arr
 
-	def write_chunk_arr(self, ctx, odf_recno, chunk_arr_list, l_array_fce_intervals):
-		
+	def get_adjusted_odf_values(self, ctx, odf_recno):
+		""" Read the ODF values for odf_recno, and apply the OHLCV adjustment if enabled.
+		Returns (open, high, low, close, volume, raw high, raw low).
+		@param ctx: FCEContext
+		@param odf_recno: ODF record no.
+		"""
 		config = ctx.config
-		s_odf_basename = ctx.s_odf_basename
 		odf_obj = ctx.odf_obj
-		odf_jsunnoon = ctx.odf_jsunnoon
 
-		#log.debug("odf_recno=%d" % odf_recno)
-		for l_fce_interval in l_array_fce_intervals:
-			adjust_ohlc_by = dc.Decimal("0.0")
+		adjust_ohlc_by = dc.Decimal("0.0")
+		adjust_volume_by = 0
+
+		m = -1
+		
+		if odf_recno % 2 == 0:
+			m = 1
+
+		odf_open = odf_obj.get_value(odf_recno, 'ODF_OPEN')
+		odf_high = odf_obj.get_value(odf_recno, 'ODF_HIGH')
+		odf_low = odf_obj.get_value(odf_recno, 'ODF_LOW')
+		odf_close = odf_obj.get_value(odf_recno, 'ODF_CLOSE')
+		odf_volume = odf_obj.get_value(odf_recno, 'ODF_VOLUME')
+
+		odf_recno_high = odf_high
+		odf_recno_low = odf_low
+
+		if config.b_modify_ohlcv_flag:
+			adjust_ohlc_by = (config.tick / config.ohlc_divider) * m
+			adjust_volume_by = int(odf_volume +  odf_volume * dc.Decimal('0.02'))
+
+		if odf_open + adjust_ohlc_by > 0:
+			odf_open = odf_open + adjust_ohlc_by
+		if odf_high + adjust_ohlc_by > 0:
+			odf_high = odf_high + adjust_ohlc_by
+		if odf_low + adjust_ohlc_by > 0:
+			odf_low = odf_low + adjust_ohlc_by
+		if odf_close + adjust_ohlc_by > 0:
+			odf_close = odf_close + adjust_ohlc_by
+		if odf_volume + adjust_volume_by > 0:
+			odf_volume = odf_volume + adjust_volume_by
+
+		if odf_open < 0  or odf_close < 0:
+			log.error(odf_open)
+			log.error(odf_high)
+			log.error(odf_low)
+			log.error(odf_close)
+			log.error(odf_volume)
+			log.error(adjust_ohlc_by)
+			log.error(adjust_volume_by)
+			raise ODFException("Invalid values for ODFOPEN & ODF_CLOSE: %f, %f" % (odf_open, odf_close))
+
+		return (odf_open, odf_high, odf_low, odf_close, odf_volume, odf_recno_high, odf_recno_low)
+
+	def get_adjusted_fixed_values(self, ctx, l_odf_recnos):
+		""" Fixed-point counterpart of get_adjusted_odf_values, for a run of recnos.
+		Prices are read as integers scaled by OHLC_DIVIDER and adjusted with integer
+		arithmetic, then converted to float once. Returns the columns 
+		(open, high, low, close, volume, raw high, raw low) as lists of floats.
+		Raises ODFOffGridPrice if a price, or the adjustment, is not on the
+		1/OHLC_DIVIDER grid.
+		@param ctx: FCEContext
+		@param l_odf_recnos: List of ODF record nos.
+		"""
+		config = ctx.config
+		ohlc_divider = int(config.ohlc_divider)
+
+		(a_open, a_high, a_low, a_close, a_volume) = ctx.odf_obj.get_fixed_values(l_odf_recnos, ohlc_divider)
+
+		fixed_tick = 0
+		if config.b_modify_ohlcv_flag:
+			fixed_tick = odf.to_fixed(config.tick / config.ohlc_divider, ohlc_divider)
+
+		l_open = []
+		l_high = []
+		l_low = []
+		l_close = []
+		l_volume = []
+		l_raw_high = []
+		l_raw_low = []
+		for (i, odf_recno) in enumerate(l_odf_recnos):
+			adjust_ohlc_by = 0
 			adjust_volume_by = 0
 
 			m = -1
@@ -603,15 +697,21 @@ class Odf2Fce(object):
 			if odf_recno % 2 == 0:
 				m = 1
 
-			odf_open = odf_obj.get_value(odf_recno, 'ODF_OPEN')
-			odf_high = odf_obj.get_value(odf_recno, 'ODF_HIGH')
-			odf_low = odf_obj.get_value(odf_recno, 'ODF_LOW')
-			odf_close = odf_obj.get_value(odf_recno, 'ODF_CLOSE')
-			odf_volume = odf_obj.get_value(odf_recno, 'ODF_VOLUME')
+			odf_open = a_open[i]
+			odf_high = a_high[i]
+			odf_low = a_low[i]
+			odf_close = a_close[i]
+			odf_volume = a_volume[i]
 
 			if config.b_modify_ohlcv_flag:
-				adjust_ohlc_by = (config.tick / config.ohlc_divider) * m
-				adjust_volume_by = int(odf_volume +  odf_volume * dc.Decimal('0.02'))
+				adjust_ohlc_by = fixed_tick * m
+				if odf_volume.is_integer():
+					# int(v + v * 0.02), truncated towards zero
+					volume = int(odf_volume)
+					adjust_volume_by = (abs(volume) * 102 // 100) * (1 if volume >= 0 else -1)
+				else:
+					dc_volume = dc.Decimal(str(odf_volume))
+					adjust_volume_by = int(dc_volume + dc_volume * dc.Decimal('0.02'))
 
 			if odf_open + adjust_ohlc_by > 0:
 				odf_open = odf_open + adjust_ohlc_by
@@ -626,14 +726,33 @@ class Odf2Fce(object):
 
 			if odf_open < 0  or odf_close < 0:
 				log.error(odf_open)
-				log.error(odf_high)
-				log.error(odf_low)
 				log.error(odf_close)
-				log.error(odf_volume)
 				log.error(adjust_ohlc_by)
-				log.error(adjust_volume_by)
-				raise ODFException("Invalid values for ODFOPEN & ODF_CLOSE: %f, %f" % (odf_open, odf_close))
+				raise ODFException("Invalid values for ODFOPEN & ODF_CLOSE: %f, %f" % (
+									odf.from_fixed(odf_open, ohlc_divider), odf.from_fixed(odf_close, ohlc_divider)))
+
+			l_open.append(odf.from_fixed(odf_open, ohlc_divider))
+			l_high.append(odf.from_fixed(odf_high, ohlc_divider))
+			l_low.append(odf.from_fixed(odf_low, ohlc_divider))
+			l_close.append(odf.from_fixed(odf_close, ohlc_divider))
+			l_volume.append(float(odf_volume))
+			l_raw_high.append(odf.from_fixed(a_high[i], ohlc_divider))
+			l_raw_low.append(odf.from_fixed(a_low[i], ohlc_divider))
+
+		return (l_open, l_high, l_low, l_close, l_volume, l_raw_high, l_raw_low)
+
+	def write_chunk_arr(self, ctx, odf_recno, chunk_arr_list, l_array_fce_intervals):
+		
+		config = ctx.config
+		s_odf_basename = ctx.s_odf_basename
+		odf_obj = ctx.odf_obj
+		odf_jsunnoon = ctx.odf_jsunnoon
 
+		(odf_open, odf_high, odf_low, odf_close, odf_volume,
+			odf_recno_high, odf_recno_low) = self.get_adjusted_odf_values(ctx, odf_recno)
+
+		#log.debug("odf_recno=%d" % odf_recno)
+		for l_fce_interval in l_array_fce_intervals:
 			L_no = l_fce_interval[0]
 			bar_int = l_fce_interval[1]
 			weeks_in_fce = l_fce_interval[2]
@@ -701,9 +820,6 @@ class Odf2Fce(object):
 					chunk_arr.set_header_field('CHUNK_CLOSE_RECNO', int(odf_recno))
 
 
-				odf_recno_high = odf_obj.get_value(odf_recno, 'ODF_HIGH')
-				odf_recno_low = odf_obj.get_value(odf_recno, 'ODF_LOW')
-
 				#log.debug("odf_recno HIGH: %f, LOW: %f" % (odf_recno_high, odf_recno_low))
 				chunk_recno_high = chunk_arr.get_field(chunk_recno, 'HIGH')
 				chunk_recno_low = chunk_arr.get_field(chunk_recno, 'LOW')
@@ -722,6 +838,155 @@ class Odf2Fce(object):
 
 		return chunk_arr_list
 
+	def write_chunk_arrs(self, ctx, l_odf_recnos, chunk_arr_list, l_array_fce_intervals):
+		""" Aggregate a run of ODF records into the chunk arrays of every FCE interval.
+		Gives the same result as calling write_chunk_arr for each recno in turn, but
+		reads each ODF record once and updates each chunk bar once: per interval, the
+		bar of every recno is computed up front, and consecutive recnos falling in the
+		same bar are reduced together.
+		@param ctx: FCEContext
+		@param l_odf_recnos: ODF record nos. in ascending order.
+		@param chunk_arr_list: ChunkArrayList
+		@param l_array_fce_intervals: FCE intervals, as returned by fill_fce_intervals_array
+		"""
+		config = ctx.config
+		s_odf_basename = ctx.s_odf_basename
+		odf_jsunnoon = ctx.odf_jsunnoon
+		chunk_size = config.chunk_size
+
+		l_odf_recnos = list(l_odf_recnos)
+		if len(l_odf_recnos) == 0:
+			return chunk_arr_list
+
+		# Read & adjust every ODF record once.
+		t_columns = None
+		if config.b_fixed_point:
+			try:
+				t_columns = self.get_adjusted_fixed_values(ctx, l_odf_recnos)
+			except ODFOffGridPrice as err:
+				# Fixed point would round the prices. Decimals keep them as they are.
+				log.warning("%s: %s. Using Decimal prices." % (s_odf_basename, err))
+		if t_columns is not None:
+			(l_open, l_high, l_low, l_close, l_volume, 
+				l_raw_high, l_raw_low) = t_columns
+		else:
+			(l_open, l_high, l_low, l_close, l_volume, 
+				l_raw_high, l_raw_low) = zip(*[self.get_adjusted_odf_values(ctx, odf_recno) for odf_recno in l_odf_recnos])
+			l_open = [float(x) for x in l_open]
+			l_high = [float(x) for x in l_high]
+			l_low = [float(x) for x in l_low]
+			l_close = [float(x) for x in l_close]
+			l_volume = [float(x) for x in l_volume]
+
+		# Whether a 4-week bar begins this ODF week is the same for every recno.
+		begin_week_of_4_week_bar_orig = (1 + (odf_jsunnoon - config.first_jsunnoon) / 7) /4
+		begin_week_of_4_week_bar = rounddown(begin_week_of_4_week_bar_orig)
+
+		four_wk_bar_begins_this_odf_week = False
+		if begin_week_of_4_week_bar == begin_week_of_4_week_bar_orig:
+			four_wk_bar_begins_this_odf_week = True
+
+		# Split each interval into bars: (first index, interval index, fce_jsunnoon, 
+		# chunk file name, chunk_recno, indexes of the recnos in the bar)
+		l_bars = []
+		for (interval_index, l_fce_interval) in enumerate(l_array_fce_intervals):
+			L_no = l_fce_interval[0]
+			bar_int = l_fce_interval[1]
+			weeks_in_fce = l_fce_interval[2]
+			time_shift = l_fce_interval[3]
+
+			fce_jsunnoon = config.first_jsunnoon +int((odf_jsunnoon - config.first_jsunnoon) / ( 7 * weeks_in_fce )) * 7 * weeks_in_fce
+
+			odf_week_no_in_fce = 1 + (odf_jsunnoon - fce_jsunnoon) // 7
+
+			offset = rounddown((10080/bar_int) * (odf_week_no_in_fce - 1))
+
+			l_fce_recnos = [rounddown((odf_recno + bar_int - time_shift) / bar_int) + offset for odf_recno in l_odf_recnos]
+
+			for (fce_recno, it_index) in itertools.groupby(range(len(l_odf_recnos)), key=l_fce_recnos.__getitem__):
+				l_index = list(it_index)
+
+				chunk_no = roundup(fce_recno / chunk_size)
+
+				chunk_recno = fce_recno - (chunk_no -1 ) * chunk_size
+
+				if chunk_recno <= 0:
+					log.info(l_fce_interval)
+					log.info(chunk_recno)
+					log.info(fce_recno)
+					log.info(l_odf_recnos[l_index[0]])
+					log.info(bar_int)
+					log.info(time_shift)
+					log.info(offset)
+					log.info(chunk_size)
+					log.info(fce_jsunnoon)
+					log.info(odf_week_no_in_fce)
+					raise ODFException("Chunk_recno cannot be negative")
+
+				s_chunk_file_name = chunk.make_chunk_file_name(L_no, fce_jsunnoon, chunk_no, s_odf_basename)
+				l_bars.append((l_index[0], interval_index, fce_jsunnoon, s_chunk_file_name, chunk_recno, l_index))
+
+		# Visit bars in the order the per-recno path first touches them, so chunk
+		# arrays are opened and listed in the same order.
+		l_bars.sort(key=lambda t_bar: (t_bar[0], t_bar[1]))
+
+		for (first_index, interval_index, fce_jsunnoon, s_chunk_file_name, chunk_recno, l_index) in l_bars:
+			l_fce_interval = l_array_fce_intervals[interval_index]
+			L_no = l_fce_interval[0]
+			bar_int = l_fce_interval[1]
+			four_wk_bar_flag = l_fce_interval[4]
+
+			odf_has_no_bar_open = four_wk_bar_begins_this_odf_week * four_wk_bar_flag
+
+			first_odf_recno = l_odf_recnos[l_index[0]]
+			last_odf_recno = l_odf_recnos[l_index[-1]]
+
+			try:
+				chunk_arr = self.get_chunk_arr_ready(ctx, s_chunk_file_name, chunk_arr_list, L_no, fce_jsunnoon)
+
+				if not odf_has_no_bar_open:
+					# Open of the last recno that opens a bar (in practice, the first recno in the bar)
+					l_open_index = [i for i in l_index 
+									if (l_odf_recnos[i] - 1) % bar_int == 0 or l_odf_recnos[i] == config.trading_start_recno]
+					if l_open_index:
+						chunk_arr.set_field(chunk_recno, 'OPEN', l_open[l_open_index[-1]])
+					if first_odf_recno < chunk_arr.get_header_field('CHUNK_OPEN_RECNO'):
+						chunk_arr.set_header_field('CHUNK_OPEN_RECNO', int(first_odf_recno))
+
+				if not four_wk_bar_flag:
+					# Close of the last recno that closes a bar
+					l_close_index = [i for i in l_index 
+									if l_odf_recnos[i] % bar_int == 0 or l_odf_recnos[i] == config.highest_recno]
+					if l_close_index:
+						chunk_arr.set_field(chunk_recno, 'CLOSE', l_close[l_close_index[-1]])
+					if last_odf_recno > chunk_arr.get_header_field('CHUNK_CLOSE_RECNO'):
+						chunk_arr.set_header_field('CHUNK_CLOSE_RECNO', int(last_odf_recno))
+				else:
+					chunk_arr.set_field(chunk_recno, 'CLOSE', l_close[l_index[-1]])
+					chunk_arr.set_header_field('CHUNK_CLOSE_RECNO', int(last_odf_recno))
+
+				# Running max/min/sum over the bar. High & low compare the unadjusted
+				# ODF value against the bar, but store the adjusted one.
+				chunk_recno_high = chunk_arr.get_field(chunk_recno, 'HIGH')
+				chunk_recno_low = chunk_arr.get_field(chunk_recno, 'LOW')
+				chunk_recno_volume = chunk_arr.get_field(chunk_recno, 'VOLUME')
+
+				for i in l_index:
+					if l_raw_high[i] > chunk_recno_high:
+						chunk_recno_high = l_high[i]
+					if l_raw_low[i] < chunk_recno_low:
+						chunk_recno_low = l_low[i]
+					chunk_recno_volume = float(chunk_recno_volume + l_volume[i])
+
+				chunk_arr.set_field(chunk_recno, 'HIGH', chunk_recno_high)
+				chunk_arr.set_field(chunk_recno, 'LOW', chunk_recno_low)
+				chunk_arr.set_field(chunk_recno, 'VOLUME', chunk_recno_volume)
+			except:
+				log.exception("Error processing chunk_recno=%d" % chunk_recno)
+				raise
+
+		return chunk_arr_list
+
 	def process_fce(self, ctx, l_array_fce_intervals):
 		
 		odf_jsunnoon = ctx.odf_jsunnoon
@@ -744,6 +1009,8 @@ class Odf2Fce(object):
 
 		if config.last_fced_recno == config.highest_recno and not odf_jsunnoon == current_jsunnoon:
 			# Load the entire ODF from DD and copy it to S3
+			if odf_obj.is_partial():
+				odf_obj = ctx.reload_odf()
 			log.debug("Saving ODF %s to S3" % s_odf_basename)
 			s3_store.save_odf(s_exchange_basename, s_odf_basename, odf_obj)
 			return
@@ -756,16 +1023,10 @@ class Odf2Fce(object):
 
 		log.debug("Generating chunk files... %d:%d" % (int(config.last_fced_recno), int(config.highest_recno)))
 		
-		debug_freq = 500
-		loop_count = 1
-		for odf_recno in odf_obj.get_recnos_within_limits(config):
-			if loop_count % debug_freq == 0:
-				log.debug("write_chunk_arr:odf_recno=%d" % odf_recno)
-			chunk_arr_list = self.write_chunk_arr(ctx,  
-													odf_recno,  
-													chunk_arr_list, 
-													l_array_fce_intervals)
-			loop_count += 1
+		chunk_arr_list = self.write_chunk_arrs(ctx,
+												odf_obj.get_recnos_within_limits(config),
+												chunk_arr_list,
+												l_array_fce_intervals)
 			
 		log.debug("Preparing ShortChunk List from %d chunk arrays..." % chunk_arr_list.length())
 
@@ -782,10 +1043,12 @@ class Odf2Fce(object):
 	def initialize_environment(self):
 		config = self.config
 
-		''' Get the DD & S3 store objects
+		''' Get the DD & S3 store objects, unless kept from a previous cycle
 		'''
-		self.dd_store = dd.get_dd_store(config)
-		self.s3_store = s3.get_s3_store(config)
+		if self.dd_store is None:
+			self.dd_store = dd.get_dd_store(config)
+		if self.s3_store is None:
+			self.s3_store = s3.get_s3_store(config)
 
 		''' Get current working directory
 		'''		
@@ -800,6 +1063,13 @@ class Odf2Fce(object):
 	
 	def odf2fce_all(self, ls_exchanges):
 		config = self.config
+
+		if self.workers > 1:
+			return self.odf2fce_all_parallel(ls_exchanges)
+
+		# Taken before processing, so a week that rolls over during the cycle
+		# is seen by the next one.
+		current_jsunnoon = self.get_current_jsunnoon()
 		
 		for s_exchange in ls_exchanges:
 			
@@ -813,8 +1083,139 @@ class Odf2Fce(object):
 			ls_odf_names = self.dd_store.list_odfs(s_exchange)
 	
 			for s_odf_dd in ls_odf_names:
-				self.odf2fce_single(config, s_exchange, s_odf_dd)
+				if self.is_odf_unchanged(s_exchange, s_odf_dd, current_jsunnoon):
+					continue
+				odf_stamp = self.odf2fce_stamped(config, s_exchange, s_odf_dd)
+				self.save_odf_stamp(s_odf_dd, odf_stamp, current_jsunnoon)
+
+	def is_odf_unchanged(self, s_exchange, s_odf_dd, current_jsunnoon):
+		""" In daemon mode, has this ODF been left untouched since we last processed it,
+		in the same week? Processing also depends on the week: once it rolls over,
+		process_fce copies finished ODFs to S3, and refresh_fifo checks the FIFO age.
+		@param s_exchange: Exchange name.
+		@param s_odf_dd: ODF path on DD.
+		@param current_jsunnoon: Current jsunnoon, see get_current_jsunnoon.
+		"""
+		if not self.b_daemon or s_odf_dd not in self.d_odf_stamps:
+			return False
+		(saved_odf_stamp, saved_jsunnoon) = self.d_odf_stamps[s_odf_dd]
+		if saved_jsunnoon != current_jsunnoon:
+			return False
+		odf_stamp = self.dd_store.get_odf_stamp(s_exchange, s_odf_dd)
+		return odf_stamp is not None and odf_stamp == saved_odf_stamp
+
+	def save_odf_stamp(self, s_odf_dd, odf_stamp, current_jsunnoon):
+		""" Remember the stamp of a successfully processed ODF.
+		@param s_odf_dd: ODF path on DD.
+		@param odf_stamp: Stamp returned by odf2fce_stamped. None to process the ODF next cycle.
+		@param current_jsunnoon: Current jsunnoon as of the start of processing.
+		"""
+		if not self.b_daemon:
+			return
+		if odf_stamp is None:
+			self.d_odf_stamps.pop(s_odf_dd, None)
+		else:
+			self.d_odf_stamps[s_odf_dd] = (odf_stamp, current_jsunnoon)
+
+	def odf2fce_stamped(self, config, s_exchange, s_odf_dd):
+		""" Process a single ODF. In daemon mode, return its stamp as of the end of
+		processing, or None if the source changed while it was being processed
+		(or outside daemon mode).
+
+		Processing may write the ODF back itself. The stamp the store saw right
+		after that write then stands in for the stamp taken before processing.
+		@param config: Config object.
+		@param s_exchange: Exchange name.
+		@param s_odf_dd: ODF path on DD.
+		"""
+		if not self.b_daemon:
+			self.odf2fce_single(config, s_exchange, s_odf_dd)
+			return None
+
+		dd_store = self.dd_store
+		odf_stamp = dd_store.get_odf_stamp(s_exchange, s_odf_dd)
+		dd_store.pop_saved_odf_stamp(s_odf_dd)
+
+		self.odf2fce_single(config, s_exchange, s_odf_dd)
+
+		saved_odf_stamp = dd_store.pop_saved_odf_stamp(s_odf_dd)
+		if saved_odf_stamp is not None:
+			odf_stamp = saved_odf_stamp
+
+		if odf_stamp is None:
+			return None
+		if dd_store.get_odf_stamp(s_exchange, s_odf_dd) != odf_stamp:
+			log.info("%s changed while being processed" % s_odf_dd)
+			return None
+		return odf_stamp
 		
+	def odf2fce_all_parallel(self, ls_exchanges):
+		""" Fan the ODFs of all exchanges out to a pool of self.workers processes.
+		Each ODF writes to its own symbol's chunk directory, so ODFs are independent.
+		Errors are collected from the workers and logged here.
+		@param ls_exchanges: List of exchanges to process.
+		"""
+		config = self.config
+
+		if not config.b_process_data:
+			return
+
+		current_jsunnoon = self.get_current_jsunnoon()
+
+		l_jobs = []
+		for s_exchange in ls_exchanges:
+			for s_odf_dd in self.dd_store.list_odfs(s_exchange):
+				if self.is_odf_unchanged(s_exchange, s_odf_dd, current_jsunnoon):
+					continue
+				l_jobs.append((s_exchange, s_odf_dd))
+
+		log.info("Processing %d ODFs with %d workers" % (len(l_jobs), self.workers))
+
+		# In daemon mode the pool, and so the workers' stores & caches, outlive the cycle.
+		if self.executor is None:
+			log_queue = self.start_log_listener()
+			self.executor = ProcessPoolExecutor(max_workers=self.workers,
+												initializer=init_worker,
+												initargs=(config.s_settings_file, self.b_show,
+														self.b_daemon, log_queue))
+		l_failed = []
+		try:
+			l_futures = [self.executor.submit(odf2fce_worker, s_exchange, s_odf_dd)
+							for (s_exchange, s_odf_dd) in l_jobs]
+			for future in as_completed(l_futures):
+				(s_exchange, s_odf_dd, odf_stamp, s_error) = future.result()
+				if s_error is not None:
+					log.error("%s: %s failed:\n%s" % (s_exchange, s_odf_dd, s_error))
+					l_failed.append(s_odf_dd)
+				else:
+					self.save_odf_stamp(s_odf_dd, odf_stamp, current_jsunnoon)
+		finally:
+			if not self.b_daemon:
+				self.shutdown_executor()
+
+		if l_failed:
+			raise ODFException("%d of %d ODFs failed" % (len(l_failed), len(l_jobs)))
+
+	def start_log_listener(self):
+		""" Start passing log records sent by pool workers to the root logger's
+		handlers. Returns the queue the workers send them to.
+		"""
+		log_queue = multiprocessing.Queue()
+		self.log_listener = logging.handlers.QueueListener(log_queue,
+														*logging.getLogger().handlers,
+														respect_handler_level=True)
+		self.log_listener.start()
+		return log_queue
+
+	def shutdown_executor(self):
+		if self.executor is not None:
+			self.executor.shutdown()
+			self.executor = None
+		# After the workers have exited, so that their last records are written.
+		if self.log_listener is not None:
+			self.log_listener.stop()
+			self.log_listener = None
+
 	def odf2fce_single(self, config, s_exchange, s_odf_dd):
 		
 		ctx= context.FCEContext(config.s_settings_file, 
@@ -822,9 +1223,13 @@ class Odf2Fce(object):
 								self.s3_store, 
 								self.s_app_dir, 
 								s_exchange, 
-								s_odf_dd)
+								s_odf_dd,
+								base_config=config)
 		
-		self.process_odf2fce(ctx)
+		try:
+			self.process_odf2fce(ctx)
+		finally:
+			ctx.close()
 		
 	def process_odf2fce(self, ctx):
 
@@ -870,7 +1275,27 @@ class Odf2Fce(object):
 
 			self.prompt_interactive()
 
-		self.odf2fce()
+		if self.b_daemon:
+			self.run_daemon()
+		else:
+			self.odf2fce()
+
+	def run_daemon(self):
+		""" Run a cycle every self.interval seconds until interrupted. A failed
+		cycle is logged, and the next one is run as usual.
+		"""
+		log.info("Running as daemon, cycle interval %d seconds" % self.interval)
+		try:
+			while True:
+				f_cycle_start = time.time()
+				try:
+					self.odf2fce()
+				except Exception:
+					log.exception("Cycle failed")
+				f_elapsed = time.time() - f_cycle_start
+				time.sleep(max(0, self.interval - f_elapsed))
+		finally:
+			self.shutdown_executor()
 
 
 	def initialize_logging(self, s_name):
@@ -892,8 +1317,6 @@ class Odf2Fce(object):
 
 		# Get the root logger
 		logger = logging.getLogger()
-		logger.setLevel(logging.ERROR)
-
 
 		s_logdir = os.path.dirname(s_logfile)
 		if not os.path.exists(s_logdir):
@@ -931,14 +1354,9 @@ class Odf2Fce(object):
 		logger.addHandler(fh)
 		logger.addHandler(ch)
 
-		ls_modules = ['binary', 'fifo', 'odf', 'fce', 'odfproc', 'odfexcept',
-						'dd', 'odf2fce', 's3', 'config', 'chunk', '__main__']
-
 		# Set debugging on for local modules.
 		# This ensures we don't get Boto & other library debug in our logs
-		for s_module in ls_modules:
-			mod_log = logging.getLogger(s_module)
-			mod_log.setLevel(logging.DEBUG)
+		set_log_levels(logger)
 
 
 	def main(self):
@@ -60,5 +60,10 @@ class ODFEOF(ODFException):
 	"""
 	pass
 
+class ODFOffGridPrice(ODFException):
+	""" A price has no exact fixed-point form: it is not on the 1/OHLC_DIVIDER grid.
+	"""
+	pass
+
 class ODFDBException(ODFException):
 	pass
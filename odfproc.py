@@ -31,7 +31,7 @@ import sys
 import os.path
 import re
 import glob
-from odf import ODF
+from odf import ODF, ODFArray
 
 # Create logger
 import logging
@@ -40,12 +40,20 @@ log = logging.getLogger(__name__)
 
 class ODFProcessor:
 
-	def __init__(self, ddstore=None):
+	def __init__(self, ddstore=None, b_odf_array_store=False):
 		self.ddstore = ddstore
+		self.b_odf_array_store = b_odf_array_store
+
+	def new_odf(self):
+		""" Create an empty ODF using the configured in-memory backend.
+		"""
+		if self.b_odf_array_store:
+			return ODFArray()
+		return ODF()
 
 	def txt2bin(self, s_txt_src, s_bin_dst):
 
-		odf = ODF()
+		odf = self.new_odf()
 
 		fp_txt_odf = open(s_txt_src, "r")
 
@@ -62,7 +70,7 @@ class ODFProcessor:
 		fp_bin_odf.close()
 
 	def print_bin(self, s_bin_src):
-		odf = ODF()
+		odf = self.new_odf()
 
 		fp_bin_odf = open(s_bin_src, "rb")
 
@@ -85,7 +93,7 @@ class ODFProcessor:
 		self.txt2bin(s_txt_src, s_bin_dst)
 
 	def load_odf_txt(self, s_txt_src):
-		odf = ODF()
+		odf = self.new_odf()
 
 		fp_txt_odf = open(s_txt_src, "r")
 
@@ -96,7 +104,10 @@ class ODFProcessor:
 		return odf
 
 	def load_odf_bin(self, s_bin_src):
-		odf = ODF()
+		if self.b_odf_array_store:
+			return ODFArray.open_mmap(s_bin_src)
+
+		odf = self.new_odf()
 
 		fp_bin_odf = open(s_bin_src, "rb")
 
@@ -107,24 +118,23 @@ class ODFProcessor:
 		return odf
 
 	def convert_txt2dd(self, s_exchange, odf_table, s_txt_src, b_show=False):
-
-		odf = self.load_odf_txt(s_txt_src)
-
+		""" Upload a text ODF to its DD table, writing records as they are parsed.
+		"""
 		s_odf_basename = os.path.basename(s_txt_src)
 		s_odf_basename = re.sub(r'\.rs4', '', s_odf_basename)
 		
-		log.debug("Converting ODF to table records")
-		ld_odf_recs = odf.to_dict(s_odf_basename)
-
-		#log.debug(str(ld_odf_recs) + "\n\n")
-		
 		if b_show:
 			log.info("%s" % s_txt_src)
 			
 
 		log.debug("Loading table from file: %s" % s_txt_src)
-		self.ddstore.put_records_multi(odf_table, ld_odf_recs)
-		log.debug("Moved file: %s" % s_txt_src)
+		fp_txt_odf = open(s_txt_src, "r")
+		try:
+			it_odf_recs = self.new_odf().iter_text_stream(fp_txt_odf, s_odf_basename)
+			num_recs = self.ddstore.put_records_stream(odf_table, it_odf_recs)
+		finally:
+			fp_txt_odf.close()
+		log.debug("Moved file: %s (%d records)" % (s_txt_src, num_recs))
 
 	def convert_bin2dd(self, s_exchange, odf_table, s_bin_src, b_show=False):
 
@@ -134,7 +144,10 @@ class ODFProcessor:
 		s_odf_basename = re.sub(r'\.rs3', '', s_odf_basename)
 		
 		log.debug("Converting ODF to table records")
-		ld_odf_recs = odf.to_dict(s_odf_basename)
+		try:
+			ld_odf_recs = odf.to_dict(s_odf_basename)
+		finally:
+			odf.close()
 
 		#log.debug(ld_odf_recs)
 
@@ -49,7 +49,11 @@ class AbstractFileStore(object):
 	lsep = os.sep
 	
 	def __init__(self):
-		pass
+		# Disabled until set_chunk_cache() is called.
+		self.chunk_cache = chunk.ChunkCache()
+
+	def set_chunk_cache(self, chunk_cache):
+		self.chunk_cache = chunk_cache
 
 	def local_abspath(self, s_path):
 		return os.path.abspath(s_path)
@@ -248,6 +252,12 @@ class AbstractFileStore(object):
 			if not self.local_path_exists(s_chunk_file_local_dir):
 				self.local_make_dirs(s_chunk_file_local_dir)
 			self.download_file(s_chunk_file_bucket, s_chunk_file_remote_path, s_chunk_file_local_path)
+			if self.chunk_cache.max_entries > 0:
+				# A fresh download matches the remote copy, so it is clean.
+				fp_chunk = open(s_chunk_file_local_path, "rb")
+				s_buf = fp_chunk.read()
+				fp_chunk.close()
+				self.chunk_cache.put(s_chunk_file_local_path, s_buf, b_clean=True)
 			return True
 
 		return False
@@ -256,21 +266,39 @@ class AbstractFileStore(object):
 		
 		(s_chunk_file_local_dir, s_chunk_file_local_path) = self.get_chunk_file_local_path(ctx, L_no, fce_jsunnoon, s_chunk_file_name)
 		
-		chunk_arr_short = chunk.read_short_chunk_array(s_chunk_file_local_path, s_chunk_file_name, chunk_size, key)
+		s_buf = self.chunk_cache.get(s_chunk_file_local_path)
+		if s_buf is None:
+			fp_chunk = open(s_chunk_file_local_path, "rb")
+			s_buf = fp_chunk.read()
+			fp_chunk.close()
+			self.chunk_cache.put(s_chunk_file_local_path, s_buf)
+
+		chunk_arr_short = chunk.read_short_chunk_buf(s_buf, s_chunk_file_name, chunk_size, key,
+													b_dense=ctx.config.b_dense_chunk_array)
 		
 		return chunk_arr_short
 	
 	def save_chunk_file(self, ctx, L_no, fce_jsunnoon, chunk_array, key=None, b_do_csv_chunk=False):
+		""" Write the chunk file to the tmp directory & the remote store, unless the
+		chunk cache knows both already hold these contents.
+		Returns True if the chunk file was written.
+		"""
 		
 		s_chunk_file_name = chunk_array.get_name()
 		
 		# First save the fce in the tmp directory
 		(s_chunk_file_local_dir, s_chunk_file_local_path) = self.get_chunk_file_local_path(ctx, L_no, fce_jsunnoon, s_chunk_file_name)
 
+		s_buf = chunk_array.to_bin_short(key)
+		if not self.chunk_cache.is_dirty(s_chunk_file_local_path, s_buf):
+			return False
+
 		if not self.local_path_exists(s_chunk_file_local_dir):
 			self.local_make_dirs(s_chunk_file_local_dir)
 
-		chunk_array.to_bin_file_short(s_chunk_file_local_path, key)
+		fp_chunk = open(s_chunk_file_local_path, "wb")
+		fp_chunk.write(s_buf)
+		fp_chunk.close()
 		
 		if b_do_csv_chunk:
 			s_chunk_csv_local_path = '.'.join([s_chunk_file_local_path, "csv"])
@@ -281,6 +309,10 @@ class AbstractFileStore(object):
 		(s_chunk_file_bucket, s_chunk_file_remote_path) = self.get_chunk_file_remote_path(ctx, L_no, fce_jsunnoon, s_chunk_file_name)
 		
 		self.upload_file(s_chunk_file_local_path, s_chunk_file_bucket, s_chunk_file_remote_path)
+
+		self.chunk_cache.put(s_chunk_file_local_path, s_buf, b_clean=True)
+
+		return True
 		
 	def download_file(self, s_bucket, s_remote_file_path, s_local_file_path):
 		
@@ -412,7 +444,8 @@ def get_s3_store(config):
 
 	if config.b_test_mode:
 		s3store = LocalS3Store(config.s_local_s3_data_root)
-		return s3store
+	else:
+		s3store = S3Store(config.s_s3_data_root, config.s_s3_access_key, config.s_s3_secret_access_key, config.s_dd_region)
 
-	s3store = S3Store(config.s_s3_data_root, config.s_s3_access_key, config.s_s3_secret_access_key, config.s_dd_region)
+	s3store.set_chunk_cache(chunk.ChunkCache(config.chunk_cache_size))
 	return s3store
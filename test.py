@@ -26,6 +26,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 '''
 import re
+import os
 import os.path
 import shutil
 import decimal as dc
@@ -49,6 +50,254 @@ class BasicTests(unittest.TestCase):
 		# Put value here for most recent sunday using http://www.nr.com/julian.html
 		self.assertEqual(jsn, 56467)
 
+	def test_session_mask(self):
+
+		import odf
+		odf_obj = odf.ODF()
+		l_in_session = [recno for recno in range(0, 3000) 
+						if not odf_obj.is_recno_out_of_limits(recno, dc.Decimal('840'), dc.Decimal('390'))]
+		self.assertEqual(l_in_session, list(range(841, 1230)) + list(range(2241, 2630)))
+		self.assertEqual(l_in_session, odf.get_session_recnos(0, 2999, 840, 390))
+
+		# One mask serves every TRADING_START_RECNO.
+		for trading_start_recno in [0, 500]:
+			self.assertEqual([recno for recno in range(0, 3000) 
+								if odf.is_recno_in_session(recno, trading_start_recno, 390)],
+							odf.get_session_recnos(0, 2999, trading_start_recno, 390))
+		self.assertIs(odf.get_session_mask(390), odf.get_session_mask(390))
+
+	def test_config_clone(self):
+
+		import config
+		base_config = config.Config()
+		base_config.read_settings("settings.txt")
+		odf_config = base_config.clone()
+		odf_config.tick = dc.Decimal('0.25')
+
+		self.assertFalse(hasattr(base_config, "tick"))
+		self.assertEqual(odf_config.chunk_size, base_config.chunk_size)
+		self.assertIs(odf_config.encr_key, base_config.encr_key)
+
+	def test_daemon_skips_unchanged_odfs(self):
+
+		import tempfile
+		import dd
+		import odf2fce
+		import odf
+
+		def write_odf(s_odf_dd, num_recs):
+			fp_odf = open(s_odf_dd, "wb")
+			fp_odf.write(b'\x00' * (42 * num_recs))
+			fp_odf.close()
+
+		class FakeOdf2Fce(odf2fce.Odf2Fce):
+			# Processing writes the ODF back, and the source may change meanwhile.
+			b_source_update = False
+			def odf2fce_single(self, config, s_exchange, s_odf_dd):
+				self.dd_store.save_odf(s_odf_dd, None, odf_obj)
+				if self.b_source_update:
+					write_odf(s_odf_dd, 3)
+
+		import io
+		odf_obj = odf.ODF()
+		odf_obj.read_text_stream(io.StringIO(TEST_ODF_TEXT))
+		o2f = FakeOdf2Fce()
+		o2f.dd_store = dd.LocalDDStore(tempfile.gettempdir())
+		(fd, s_odf_dd) = tempfile.mkstemp(suffix='.rs3')
+		os.close(fd)
+		try:
+			o2f.save_odf_stamp(s_odf_dd, o2f.odf2fce_stamped(None, 'X', s_odf_dd), 56028)
+			self.assertFalse(o2f.is_odf_unchanged('X', s_odf_dd, 56028))
+
+			o2f.b_daemon = True
+			o2f.save_odf_stamp(s_odf_dd, o2f.odf2fce_stamped(None, 'X', s_odf_dd), 56028)
+			self.assertTrue(o2f.is_odf_unchanged('X', s_odf_dd, 56028))
+
+			write_odf(s_odf_dd, 1)
+			self.assertFalse(o2f.is_odf_unchanged('X', s_odf_dd, 56028))
+
+			# An update landing during processing is picked up next cycle.
+			o2f.b_source_update = True
+			o2f.save_odf_stamp(s_odf_dd, o2f.odf2fce_stamped(None, 'X', s_odf_dd), 56028)
+			self.assertFalse(o2f.is_odf_unchanged('X', s_odf_dd, 56028))
+		finally:
+			os.remove(s_odf_dd)
+
+	class FakeWorkersDDStore(object):
+		# Fixed ODF listing; ODF stamps are not tracked.
+		d_odfs = {'X': ['X/A-1.rs3', 'X/B-1.rs3', 'X/C-1.rs3'], 'Y': ['Y/D-1.rs3']}
+		def list_odfs(self, s_exchange):
+			return self.d_odfs[s_exchange]
+		def get_odf_stamp(self, s_exchange, s_odf_dd):
+			return None
+		def pop_saved_odf_stamp(self, s_odf_dd):
+			return None
+
+	def new_workers_app(self, ls_failing):
+		""" Odf2Fce with a fake DD store, whose odf2fce_single records each ODF
+		and raises for those in ls_failing.
+		"""
+		import config
+		import odf2fce
+
+		class FakeOdf2Fce(odf2fce.Odf2Fce):
+			def odf2fce_single(self, config, s_exchange, s_odf_dd):
+				self.l_processed.append(s_odf_dd)
+				if s_odf_dd in ls_failing:
+					raise odf2fce.ODFException("Bad ODF %s" % s_odf_dd)
+
+		o2f = FakeOdf2Fce()
+		o2f.l_processed = []
+		o2f.b_show = False
+		o2f.config = config.Config()
+		o2f.config.read_settings("settings.txt")
+		o2f.config.b_process_data = True
+		o2f.dd_store = self.FakeWorkersDDStore()
+		return o2f
+
+	def test_daemon_revisits_odfs_next_week(self):
+
+		import types
+		import odf
+		import odf2fce
+
+		class FakeS3Store(object):
+			def __init__(self):
+				self.l_saved_odfs = []
+			def fce_exists(self, ctx, s_fce_header_file_name):
+				return True
+			def save_odf(self, s_exchange_basename, s_odf_basename, odf_obj):
+				self.l_saved_odfs.append(s_odf_basename)
+
+		class FakeStampedDDStore(self.FakeWorkersDDStore):
+			d_odfs = {'X': ['X/A-1856028.rs3']}
+			def get_odf_stamp(self, s_exchange, s_odf_dd):
+				return (1, 42)
+
+		class FakeOdf2Fce(odf2fce.Odf2Fce):
+			# The ODF's week, fully processed.
+			current_jsunnoon = 56028
+			def get_current_jsunnoon(self):
+				return self.current_jsunnoon
+			def odf2fce_single(self, config, s_exchange, s_odf_dd):
+				self.l_processed.append(s_odf_dd)
+				ctx = types.SimpleNamespace(config=types.SimpleNamespace(last_fced_recno=900, highest_recno=900),
+								odf_jsunnoon=56028, s3_store=self.s3_store, dd_store=self.dd_store,
+								s_odf_dd=s_odf_dd, s_exchange_basename=s_exchange, 
+								s_odf_basename='A-1856028', odf_obj=odf.ODF(), 
+								s_fce_header_file_name='A-1856028.fce')
+				self.process_fce(ctx, [])
+
+		o2f = FakeOdf2Fce()
+		o2f.l_processed = []
+		o2f.b_daemon = True
+		o2f.config = types.SimpleNamespace(b_process_data=True)
+		o2f.dd_store = FakeStampedDDStore()
+		o2f.s3_store = FakeS3Store()
+
+		o2f.odf2fce_all(['X'])
+		o2f.odf2fce_all(['X'])
+		self.assertEqual(o2f.l_processed, ['X/A-1856028.rs3'])
+		self.assertEqual(o2f.s3_store.l_saved_odfs, [])
+
+		# Past the week boundary, the unchanged ODF is revisited and copied to S3.
+		o2f.current_jsunnoon = 56035
+		o2f.odf2fce_all(['X'])
+		self.assertEqual(o2f.l_processed, ['X/A-1856028.rs3', 'X/A-1856028.rs3'])
+		self.assertEqual(o2f.s3_store.l_saved_odfs, ['A-1856028'])
+
+	def test_worker_returns_traceback(self):
+
+		import odf2fce
+		o2f = self.new_workers_app(['X/B-1.rs3'])
+		odf2fce.worker_app = o2f
+		try:
+			self.assertEqual(odf2fce.odf2fce_worker('X', 'X/A-1.rs3'), ('X', 'X/A-1.rs3', None, None))
+
+			(s_exchange, s_odf_dd, odf_stamp, s_error) = odf2fce.odf2fce_worker('X', 'X/B-1.rs3')
+			self.assertEqual((s_exchange, s_odf_dd, odf_stamp), ('X', 'X/B-1.rs3', None))
+			self.assertTrue(s_error.startswith("Traceback"))
+			self.assertIn("Bad ODF X/B-1.rs3", s_error)
+		finally:
+			odf2fce.worker_app = None
+
+	def test_workers_collect_failures(self):
+
+		from concurrent.futures import ThreadPoolExecutor
+		import odf2fce
+		o2f = self.new_workers_app(['X/A-1.rs3', 'X/C-1.rs3'])
+		o2f.workers = 2
+		# Threads stand in for the process pool; they share worker_app with this process.
+		o2f.executor = ThreadPoolExecutor(max_workers=2)
+		odf2fce.worker_app = o2f
+		try:
+			with self.assertLogs('odf2fce', level='ERROR') as logs:
+				with self.assertRaises(odf2fce.ODFException) as cm:
+					o2f.odf2fce_all(['X', 'Y'])
+		finally:
+			odf2fce.worker_app = None
+
+		self.assertEqual(str(cm.exception), "2 of 4 ODFs failed")
+		self.assertEqual(sorted(o2f.l_processed), ['X/A-1.rs3', 'X/B-1.rs3', 'X/C-1.rs3', 'Y/D-1.rs3'])
+		self.assertEqual(len(logs.records), 2)
+		self.assertEqual(sorted(record.getMessage().split(" failed:")[0] for record in logs.records),
+						['X: X/A-1.rs3', 'X: X/C-1.rs3'])
+		self.assertIn("Bad ODF X/A-1.rs3", logs.output[0] + logs.output[1])
+		self.assertIsNone(o2f.executor)
+
+	def test_worker_logging(self):
+
+		import odf2fce
+
+		class ListHandler(logging.Handler):
+			def __init__(self, level):
+				super(ListHandler, self).__init__(level)
+				self.l_records = []
+			def emit(self, record):
+				self.l_records.append(record)
+
+		logger = logging.getLogger()
+		l_handlers = list(logger.handlers)
+		level = logger.level
+		parent_handler = ListHandler(logging.INFO)
+		logger.handlers = [parent_handler]
+		o2f = odf2fce.Odf2Fce()
+		try:
+			log_queue = o2f.start_log_listener()
+			# As done in each pool worker: only the queue is left as a handler.
+			odf2fce.init_worker_logging(log_queue)
+			self.assertEqual([type(handler) for handler in logger.handlers],
+							[logging.handlers.QueueHandler])
+			logging.getLogger('odf2fce').info("From a worker")
+			logging.getLogger('odf2fce').debug("Below the parent handler's level")
+			o2f.shutdown_executor()
+		finally:
+			logger.handlers = l_handlers
+			logger.setLevel(level)
+
+		self.assertIsNone(o2f.log_listener)
+		self.assertEqual([record.getMessage() for record in parent_handler.l_records], ["From a worker"])
+
+	def test_one_worker_runs_serially(self):
+
+		import sys
+		o2f = self.new_workers_app([])
+		s_argv = sys.argv
+		sys.argv = ['odf2fce.py', '-w', '1']
+		try:
+			o2f.set_args(o2f.arg_parse())
+		finally:
+			sys.argv = s_argv
+		self.assertEqual(o2f.workers, 1)
+
+		def odf2fce_all_parallel(ls_exchanges):
+			self.fail("-w 1 must not use the worker pool")
+		o2f.odf2fce_all_parallel = odf2fce_all_parallel
+
+		o2f.odf2fce_all(['X', 'Y'])
+		self.assertEqual(o2f.l_processed, ['X/A-1.rs3', 'X/B-1.rs3', 'X/C-1.rs3', 'Y/D-1.rs3'])
+		self.assertIsNone(o2f.executor)
+
 class ODFFIFOTests(unittest.TestCase):
 	""" ODF and FIFO unit tests.
 	"""
@@ -388,5 +637,887 @@ class ODFFIFOTests(unittest.TestCase):
 		log.info("test_process_fce: complete")
 
 
+# Small in-memory text ODF: 7 header lines, a gap at 843 and a duplicate 842.
+TEST_ODF_TEXT = "\n".join([
+	"-5", "840", "390", "1", "2", "1", "1",
+	"841,100.5,101.25,99.75,100.25,1200",
+	"842,100.25,100.5,99.5,99.75,800",
+	"842,100.25,100.75,99.5,100.0,900",
+	"844,100.0,100.0,100.0,100.0,0",
+	"845,100.0,102.0,99.0,101.5,3000",
+]) + "\n"
+
+class ODFArrayTests(unittest.TestCase):
+	""" Checks the packed-array ODF backend against the dict-backed ODF.
+	"""
+
+	def load(self, odf_class):
+		import io
+		odf_obj = odf_class()
+		odf_obj.read_text_stream(io.StringIO(TEST_ODF_TEXT))
+		return odf_obj
+
+	def test_same_values(self):
+		import odf
+		odf_dict = self.load(odf.ODF)
+		odf_arr = self.load(odf.ODFArray)
+
+		self.assertEqual(odf_arr.get_highest_recno(), odf_dict.get_highest_recno())
+		self.assertEqual(odf_arr.get_header_value(2), odf_dict.get_header_value(2))
+		self.assertEqual(odf_arr.get_header_value(9), dc.Decimal('0'))
+
+		for recno in range(841, 847):
+			self.assertEqual(odf_arr.recno_exists(recno), odf_dict.recno_exists(recno))
+			for s_field in ['ODF_OPEN', 'ODF_HIGH', 'ODF_LOW', 'ODF_CLOSE', 'ODF_VOLUME']:
+				self.assertEqual(odf_arr.get_value(recno, s_field),
+								odf_dict.get_value(recno, s_field))
+
+		# Last duplicate wins
+		self.assertEqual(odf_arr.get_value(842, 'ODF_CLOSE'), dc.Decimal('100.0'))
+
+	def test_record_array_mapping(self):
+		import odf
+		odf_dict = self.load(odf.ODF)
+		odf_arr = self.load(odf.ODFArray)
+		rec_array = odf_arr.d_recno_index
+
+		self.assertEqual(len(rec_array), len(odf_dict.d_recno_index))
+		self.assertEqual(rec_array.keys(), sorted(odf_dict.d_recno_index.keys()))
+		self.assertEqual(dict(rec_array[842]), dict(odf_dict.d_recno_index[842]))
+		self.assertEqual(odf_arr.to_dict('A'), odf_dict.to_dict('A'))
+
+		# Writes through a record go back to the buffer.
+		rec_array[842]['ODF_CLOSE'] = dc.Decimal('99.5')
+		self.assertEqual(odf_arr.get_value(842, 'ODF_CLOSE'), dc.Decimal('99.5'))
+		self.assertRaises(odf.ODFException, rec_array[842].__setitem__, 'ODF_RECNO', 1)
+		self.assertRaises(odf.ODFException, rec_array[842].__setitem__, 'ODF_NAME', 'A')
+
+		# The count & keys follow new records, appended or not.
+		num_records = len(rec_array)
+		rec_array.set_record(900, 1, 1, 1, 1, 1)
+		rec_array.set_record(843, 1, 1, 1, 1, 1)
+		rec_array.set_record(843, 2, 2, 2, 2, 2)
+		rec_array.set_records([846, 900], [1, 1], [1, 1], [1, 1], [1, 1], [1, 1])
+		self.assertEqual(len(rec_array), num_records + 3)
+		self.assertEqual(rec_array.keys()[-5:], [843, 844, 845, 846, 900])
+
+	def test_bin_round_trip(self):
+		import io
+		import odf
+		buf = self.load(odf.ODF).to_bin()
+
+		odf_dict = odf.ODF()
+		odf_dict.read_bin_stream(io.BytesIO(buf))
+
+		odf_arr = odf.ODFArray()
+		odf_arr.read_bin_stream(io.BytesIO(buf))
+
+		self.assertEqual(odf_arr.to_bin(), odf_dict.to_bin())
+
+	def test_fixed_values(self):
+		import odf
+		l_recnos = [841, 842, 843, 845]
+		l_expected = self.load(odf.ODF).get_fixed_values(l_recnos, 100)
+
+		self.assertEqual(self.load(odf.ODFArray).get_fixed_values(l_recnos, 100), l_expected)
+		self.assertEqual(list(l_expected[0]), [10050, 10025, 0, 10000])
+		self.assertEqual(odf.from_fixed(10025, 100), float(dc.Decimal('100.25')))
+
+	def test_fill_missing_records(self):
+		import odf
+		l_recnos = odf.get_session_recnos(838, 2245, 840, 4)
+		self.assertEqual(l_recnos, [841, 842, 843, 2241, 2242, 2243])
+
+		for odf_class in [odf.ODF, odf.ODFArray]:
+			odf_obj = self.load(odf_class)
+			odf_obj.add_missing_record(842, 0, 0, 0, 0)
+			self.assertEqual(odf_obj.fill_missing_records(l_recnos, dc.Decimal('99')), 5)
+			self.assertEqual(odf_obj.get_value(842, 'ODF_CLOSE'), dc.Decimal('100.25'))
+			self.assertEqual(odf_obj.get_value(843, 'ODF_OPEN'), dc.Decimal('100.25'))
+			self.assertEqual(odf_obj.get_value(2243, 'ODF_LOW'), dc.Decimal('100.25'))
+			self.assertEqual(odf_obj.get_value(2243, 'ODF_VOLUME'), dc.Decimal('0'))
+
+	def test_sorted_recnos(self):
+		import odf
+		for odf_class in [odf.ODF, odf.ODFArray]:
+			odf_obj = self.load(odf_class)
+			self.assertEqual(list(odf_obj.get_sorted_recnos()), [1, 2, 3, 4, 5, 6, 7, 841, 842, 844, 845])
+			self.assertEqual(odf_obj.get_lowest_body_recno(), 841)
+
+			odf_obj.add_missing_record(900, 1, 1, 1, 1)
+			odf_obj.add_missing_record(843, 1, 1, 1, 1)
+			odf_obj.add_missing_header(9, 100)
+			self.assertEqual(list(odf_obj.get_sorted_recnos()), [1, 2, 3, 4, 5, 6, 7, 9, 841, 842, 843, 844, 845, 900])
+			self.assertEqual(odf_obj.get_highest_recno(), 900)
+			self.assertEqual(odf_obj.find_highest_recno(840, 390), 900)
+
+	def test_open_mmap(self):
+		import tempfile
+		import odf
+		odf_dict = self.load(odf.ODF)
+
+		(fd, s_odf_bin) = tempfile.mkstemp(suffix='.rs3')
+		os.close(fd)
+		try:
+			odf_dict.to_bin_file(s_odf_bin)
+
+			odf_arr = odf.ODFArray.open_mmap(s_odf_bin)
+			self.assertEqual(odf_arr.get_value(845, 'ODF_HIGH'), dc.Decimal('102.0'))
+			self.assertFalse(odf_arr.recno_exists(843))
+
+			# Rewriting the mapped file must not disturb the loaded ODF.
+			odf_arr.to_bin_file(s_odf_bin)
+			self.assertEqual(odf_arr.get_value(845, 'ODF_HIGH'), dc.Decimal('102.0'))
+			odf_arr.close()
+		finally:
+			os.remove(s_odf_bin)
+
+	def test_open_mmap_misplaced(self):
+		import io
+		import tempfile
+		import odf
+		buf = self.load(odf.ODF).to_bin()
+
+		(fd, s_odf_bin) = tempfile.mkstemp(suffix='.rs3')
+		os.close(fd)
+		try:
+			fp_odf_bin = open(s_odf_bin, "wb")
+			fp_odf_bin.write(buf)
+			fp_odf_bin.close()
+			odf_arr = odf.ODFArray.open_mmap(s_odf_bin)
+			self.assertTrue(odf_arr.d_recno_index.is_mapped())
+			odf_arr.close()
+			self.assertFalse(odf_arr.d_recno_index.is_mapped())
+
+			# A record past its own slot: loaded the same way as read_bin_stream.
+			buf += odf.ODFRecordArray.st_record.pack(850, 1, 2, 3, 4, 5)
+			fp_odf_bin = open(s_odf_bin, "wb")
+			fp_odf_bin.write(buf)
+			fp_odf_bin.close()
+			odf_arr = odf.ODFArray.open_mmap(s_odf_bin)
+			self.assertFalse(odf_arr.d_recno_index.is_mapped())
+
+			odf_expected = odf.ODFArray()
+			odf_expected.read_bin_stream(io.BytesIO(buf))
+			self.assertEqual(odf_arr.to_bin(), odf_expected.to_bin())
+			self.assertEqual(odf_arr.get_value(850, 'ODF_CLOSE'), dc.Decimal('4.0'))
+		finally:
+			os.remove(s_odf_bin)
+
+	def test_open_tail(self):
+		import tempfile
+		import odf
+		odf_dict = self.load(odf.ODF)
+
+		(fd, s_odf_bin) = tempfile.mkstemp(suffix='.rs3')
+		os.close(fd)
+		try:
+			odf_dict.to_bin_file(s_odf_bin)
+			self.assertEqual(odf.read_odf_headers(s_odf_bin)[2], dc.Decimal('840.0'))
+
+			odf_tail = odf.ODFArray.open_tail(s_odf_bin, 844)
+			self.assertTrue(odf_tail.is_partial())
+			self.assertFalse(odf_tail.recno_exists(841))
+			self.assertEqual(odf_tail.get_value(845, 'ODF_HIGH'), dc.Decimal('102.0'))
+			self.assertRaises(odf.ODFException, odf_tail.to_bin)
+
+			# Only the header block & the tail are written back.
+			odf_tail.set_header_value(2, 900)
+			odf_tail.add_missing_record(846, 1, 2, 3, 4, 5)
+			odf_tail.to_bin_file(s_odf_bin)
+
+			odf_arr = odf.ODFArray()
+			fp_odf_bin = open(s_odf_bin, "rb")
+			odf_arr.read_bin_stream(fp_odf_bin)
+			fp_odf_bin.close()
+			self.assertEqual(odf_arr.get_header_value(2), dc.Decimal('900.0'))
+			self.assertEqual(odf_arr.get_value(841, 'ODF_OPEN'), dc.Decimal('100.5'))
+			self.assertEqual(odf_arr.get_value(846, 'ODF_CLOSE'), dc.Decimal('4.0'))
+		finally:
+			os.remove(s_odf_bin)
+
+
+class BinaryCodecTests(unittest.TestCase):
+	""" Checks the bulk record codecs against per-record packing.
+	"""
+
+	key = b'\xb6\x02'
+
+	def test_pack_records(self):
+		import chunk
+		l_records = [(i, i+1, i+2, i+3, i*100) for i in range(25)]
+		buf = b''.join([chunk.ShortChunk(dict(zip(['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME'], t_rec))).to_bin(self.key)
+						for t_rec in l_records])
+
+		self.assertEqual(chunk.ShortChunk.pack_records(l_records, key=self.key), buf)
+		self.assertEqual(chunk.ShortChunk.unpack_records(buf, key=self.key), l_records)
+
+	def test_xor_crypt_records(self):
+		import binary
+		from itertools import cycle
+		s_buf = bytes(range(256)) * 3
+		key = b'\x01\x02\x03'
+		# Reference: encrypt each 10-byte record separately, byte by byte.
+		s_expected = b''.join([bytes([x^y for (x, y) in zip(s_buf[i:i+10], cycle(key))])
+								for i in range(0, len(s_buf), 10)])
+
+		self.assertEqual(binary.xor_crypt_records(s_buf, key, 10), s_expected)
+		self.assertEqual(binary.xor_crypt_records(s_expected, key, 10), s_buf)
+		self.assertEqual(binary.xor_crypt(s_buf[:10], key), s_expected[:10])
+
+	def test_short_chunk_file(self):
+		import chunk
+		l_records = [(i, i+1, i+2, i+3, i*100) for i in range(25)]
+		d_header = {'LOWEST_LOW' : 70000, 'VOLUME_TICK' : 3, 'CHUNK_OPEN_RECNO' : 840, 'CHUNK_CLOSE_RECNO' : 864}
+		buf = chunk.ShortChunk.pack_records(l_records, key=self.key) + chunk.ShortChunkHeader(d_header).to_bin(self.key)
+
+		self.assertEqual(chunk.encode_short_chunk_file(l_records, d_header, self.key), buf)
+		self.assertEqual(chunk.decode_short_chunk_file(buf, 25, self.key), (l_records, d_header))
+		self.assertRaises(chunk.ODFEOF, chunk.decode_short_chunk_file, buf[:-1], 25, self.key)
+
+	def test_quantise_records(self):
+		import chunk
+		l_records = [(100.25, 101.0, 99.5, 100.75, 1000.0), (0.0, 0.0, 0.0, 0.0, 0.0)]
+		l_short = chunk.quantise_records(l_records, dc.Decimal('0.25'), 3)
+
+		self.assertEqual(l_short, [(401, 404, 398, 403, 333), (0, 0, 0, 0, 0)])
+		self.assertEqual(chunk.dequantise_records(l_short, dc.Decimal('0.25'), 3),
+						[(100.25, 101.0, 99.5, 100.75, 999), (0.0, 0.0, 0.0, 0.0, 0)])
+		self.assertRaises(chunk.ODFException, chunk.quantise_records, l_records, dc.Decimal('0.001'), 3)
+		self.assertRaises(chunk.ODFException, chunk.quantise_records, [(-1.0, 0, 0, 0, 0)], 1, 1)
+
+	def test_fce_round_trip(self):
+		import io
+		import fce
+		fce_obj = fce.FCE()
+		for i, d_hdr_lyt in enumerate(fce_obj.ld_header_layout):
+			fce_obj.d_hdr_index[list(d_hdr_lyt.keys())[0]] = i * 1000
+		fce_obj.d_hdr_index['GMT_OFFSET'] = -5
+
+		fce_read = fce.FCE()
+		fce_read.read_bin_stream(io.BytesIO(fce_obj.to_bin(self.key)), self.key)
+		self.assertEqual(str(fce_read), str(fce_obj))
+
+
+class DenseChunkArrayTests(unittest.TestCase):
+	""" Checks DenseChunkArray against the dict backed ChunkArray.
+	"""
+
+	key = b'\xb6\x02'
+
+	def fill(self, chunk_arr):
+		for recno in range(1, 11):
+			for (i, s_field) in enumerate(['OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME']):
+				chunk_arr.set_field(recno, s_field, 0 if recno == 4 else (recno * 7 + i) % 50)
+		chunk_arr.set_header({'LOWEST_LOW' : 1, 'VOLUME_TICK' : 2,
+							'CHUNK_OPEN_RECNO' : 840, 'CHUNK_CLOSE_RECNO' : 900})
+		return chunk_arr
+
+	def test_same_output(self):
+		import io
+		import chunk
+		chunk_arr = self.fill(chunk.ChunkArray('A', 10))
+		chunk_arr_dense = self.fill(chunk.DenseChunkArray('A', 10, typecode='q'))
+
+		self.assertEqual(chunk_arr_dense.highest_volume(), chunk_arr.highest_volume())
+		self.assertEqual(chunk_arr_dense.lowest_low(), chunk_arr.lowest_low())
+		self.assertEqual(chunk_arr_dense.to_csv(), chunk_arr.to_csv())
+		self.assertEqual(chunk_arr_dense.to_bin_long(self.key), chunk_arr.to_bin_long(self.key))
+		s_buf = chunk_arr.to_bin_short(self.key)
+		self.assertEqual(chunk_arr_dense.to_bin_short(self.key), s_buf)
+
+		chunk_arr_read = chunk.DenseChunkArray('A', 10, typecode='q')
+		chunk_arr_read.read_bin_short(io.BytesIO(s_buf), self.key)
+		self.assertEqual(list(chunk_arr_read.get_column('LOW')), list(chunk_arr_dense.get_column('LOW')))
+		self.assertEqual(chunk_arr_read.get_header_field('CHUNK_CLOSE_RECNO'), 900)
+		self.assertRaises(IndexError, chunk_arr_read.get_field, 0, 'OPEN')
+		self.assertRaises(chunk.ODFException, chunk_arr_read.set_column, 'OPEN', [1, 2])
+
+	def test_fill_empty_records(self):
+		import chunk
+		l_records = [(0, 0, 0, 0, 1), (5, 6, 4, 5, 2), (0, 0, 0, 0, 3), (7, 8, 6, 7, 4), (0, 0, 0, 0, 5)]
+		l_expected = [(5, 5, 5, 5, 1), (5, 6, 4, 5, 2), (0, 0, 0, 0, 3), (7, 8, 6, 7, 4), (7, 7, 7, 7, 5)]
+		for chunk_arr in [chunk.ChunkArray('A', 5), chunk.DenseChunkArray('A', 5, typecode='q')]:
+			chunk_arr.set_records(l_records, chunk.ShortChunk)
+			chunk_arr.fill_empty_records()
+			self.assertEqual(list(chunk_arr.iter_records(chunk.ShortChunk)), l_expected)
+
+
+class ChunkCacheTests(unittest.TestCase):
+	""" Checks the chunk file cache's stamps, dirty tracking & eviction.
+	"""
+
+	def write(self, s_path, s_buf):
+		fp = open(s_path, "wb")
+		fp.write(s_buf)
+		fp.close()
+
+	def test_chunk_cache(self):
+		import tempfile
+		import chunk
+		s_dir = tempfile.mkdtemp()
+		try:
+			s_path_a = os.path.join(s_dir, "a.fce")
+			s_path_b = os.path.join(s_dir, "b.fce")
+			self.write(s_path_a, b'aaaa')
+			self.write(s_path_b, b'bbbb')
+
+			chunk_cache = chunk.ChunkCache(max_entries=1)
+			chunk_cache.put(s_path_a, b'aaaa')
+			self.assertEqual(chunk_cache.get(s_path_a), b'aaaa')
+			# Read, but not known to be written remotely yet.
+			self.assertTrue(chunk_cache.is_dirty(s_path_a, b'aaaa'))
+
+			chunk_cache.put(s_path_a, b'aaaa', b_clean=True)
+			self.assertFalse(chunk_cache.is_dirty(s_path_a, b'aaaa'))
+			self.assertTrue(chunk_cache.is_dirty(s_path_a, b'aaab'))
+
+			# Changed behind the cache's back
+			self.write(s_path_a, b'aaaaa')
+			self.assertIsNone(chunk_cache.get(s_path_a))
+
+			chunk_cache.put(s_path_a, b'aaaaa')
+			chunk_cache.put(s_path_b, b'bbbb')
+			self.assertIsNone(chunk_cache.get(s_path_a))
+			self.assertEqual(chunk_cache.get(s_path_b), b'bbbb')
+
+			self.assertIsNone(chunk.ChunkCache().get(s_path_b))
+		finally:
+			shutil.rmtree(s_dir)
+
+	def test_rewrite_keeping_stamp(self):
+		import tempfile
+		import chunk
+		s_dir = tempfile.mkdtemp()
+		try:
+			s_path = os.path.join(s_dir, "a.fce")
+			self.write(s_path, b'aaaa')
+			chunk_cache = chunk.ChunkCache(max_entries=1)
+			chunk_cache.put(s_path, b'aaaa', b_clean=True)
+
+			# Same inode & size, and the mtime of a coarse-timestamp filesystem.
+			st_chunk = os.stat(s_path)
+			self.write(s_path, b'bbbb')
+			os.utime(s_path, ns=(st_chunk.st_atime_ns, st_chunk.st_mtime_ns))
+			self.assertTrue(chunk_cache.is_dirty(s_path, b'aaaa'))
+			self.assertIsNone(chunk_cache.get(s_path))
+
+			# Once the file is older than the mtime resolution, the stamp is enough.
+			chunk_cache.MTIME_RESOLUTION_NS = 0
+			chunk_cache.put(s_path, b'bbbb', b_clean=True)
+			self.assertFalse(chunk_cache.d_entries[s_path][3])
+			self.assertFalse(chunk_cache.is_dirty(s_path, b'bbbb'))
+		finally:
+			shutil.rmtree(s_dir)
+
+	def test_downloaded_chunk_is_clean(self):
+		import tempfile
+		import types
+		import chunk
+		import s3
+
+		class FakeChunkArray(object):
+			def __init__(self, s_buf):
+				self.s_buf = s_buf
+			def get_name(self):
+				return s_chunk_file_name
+			def to_bin_short(self, key):
+				return self.s_buf
+
+		class CountingS3Store(s3.LocalS3Store):
+			num_uploads = 0
+			def upload(self, *kargs):
+				self.num_uploads += 1
+				super(CountingS3Store, self).upload(*kargs)
+
+		s_dir = tempfile.mkdtemp()
+		try:
+			s3_store = CountingS3Store(os.path.join(s_dir, 'remote'))
+			s3_store.set_chunk_cache(chunk.ChunkCache(10))
+			ctx = types.SimpleNamespace(s_fce_local_dir=os.path.join(s_dir, 'local'),
+										s_fce_remote_prefix='fce',
+										config=types.SimpleNamespace(b_dense_chunk_array=False))
+			s_chunk_file_name = 'A_1_56000_1.fce'
+			l_records = [(i, i+1, i+2, i+3, i*100) for i in range(25)]
+			d_header = {'LOWEST_LOW' : 0, 'VOLUME_TICK' : 1, 'CHUNK_OPEN_RECNO' : 840, 'CHUNK_CLOSE_RECNO' : 864}
+			s_buf = chunk.encode_short_chunk_file(l_records, d_header)
+
+			# The remote store holds the chunk file from an earlier run.
+			(s_bucket, s_remote_path) = s3_store.get_chunk_file_remote_path(ctx, 1, 56000, s_chunk_file_name)
+			self.write(s_remote_path, s_buf)
+
+			self.assertTrue(s3_store.chunk_file_exists(ctx, 1, 56000, s_chunk_file_name))
+			chunk_arr = s3_store.open_chunk_file(ctx, 1, 56000, s_chunk_file_name, 25, None)
+			self.assertEqual(chunk_arr.get_header()['CHUNK_OPEN_RECNO'], 840)
+
+			self.assertFalse(s3_store.save_chunk_file(ctx, 1, 56000, FakeChunkArray(s_buf)))
+			self.assertEqual(s3_store.num_uploads, 0)
+			self.assertTrue(s3_store.save_chunk_file(ctx, 1, 56000, FakeChunkArray(s_buf + b'x')))
+			self.assertEqual(s3_store.num_uploads, 1)
+		finally:
+			shutil.rmtree(s_dir)
+
+
+class DDStoreWriteTests(unittest.TestCase):
+	""" Checks the rate limited batch writes against a fake DynamoDB.
+	"""
+
+	class FakeTable(object):
+		def __init__(self, name, write_units):
+			import types
+			self.name = name
+			self.write_units = write_units
+			self.schema = types.SimpleNamespace(hash_key_name='ODF_NAME',
+												range_key_name='ODF_RECNO')
+
+		def new_item(self, hash_key=None, range_key=None, attrs=None):
+			d_item = dict(attrs)
+			if hash_key is not None:
+				d_item['ODF_NAME'] = hash_key
+				d_item['ODF_RECNO'] = range_key
+			return d_item
+
+	class FakeBatchList(object):
+		def __init__(self):
+			self.l_puts = []
+
+		def add_batch(self, dd_table, puts):
+			self.l_puts.extend(puts)
+
+	class FakeConnection(object):
+		""" Leaves half of each batch unprocessed for the first num_throttled writes.
+		"""
+		def __init__(self, num_throttled):
+			self.num_throttled = num_throttled
+			self.l_batch_sizes = []
+			self.d_items = {}
+
+		def new_batch_write_list(self):
+			return DDStoreWriteTests.FakeBatchList()
+
+		def batch_write_item(self, batch_list):
+			l_puts = batch_list.l_puts
+			self.l_batch_sizes.append(len(l_puts))
+			if self.num_throttled > 0:
+				self.num_throttled -= 1
+				l_unprocessed = l_puts[len(l_puts)//2:]
+				l_puts = l_puts[:len(l_puts)//2]
+			else:
+				l_unprocessed = []
+			for d_item in l_puts:
+				self.d_items[(d_item['ODF_NAME'], d_item['ODF_RECNO'])] = d_item
+			if not l_unprocessed:
+				return {}
+			return {'UnprocessedItems': {'test': [{'PutRequest': {'Item': d_item}} 
+														for d_item in l_unprocessed]}}
+
+	def make_store(self, connection):
+		import dd
+		class FakeDDStore(dd.DDStore):
+			def get_connection(self, **kargs):
+				return connection
+		ddstore = FakeDDStore('key', 'secret', 'region')
+		# Fake clock, moved on by every sleep.
+		ddstore.l_sleeps = []
+		ddstore.fn_clock = lambda: sum(ddstore.l_sleeps)
+		ddstore.fn_sleep = ddstore.l_sleeps.append
+		return ddstore
+
+	def test_token_bucket(self):
+		import dd
+		l_now = [0.0]
+		l_sleeps = []
+		def fn_sleep(secs):
+			l_sleeps.append(secs)
+			l_now[0] += secs
+		bucket = dd.TokenBucket(10, fn_clock=lambda: l_now[0], fn_sleep=fn_sleep)
+
+		bucket.acquire(10)
+		self.assertEqual(l_sleeps, [])
+		# A 25 item batch is larger than the bucket: wait until the debt is paid.
+		bucket.acquire(25)
+		self.assertAlmostEqual(l_now[0], 2.5)
+		bucket.acquire(10)
+		self.assertAlmostEqual(l_now[0], 3.5)
+
+		bucket.throttled()
+		self.assertEqual(bucket.rate, 5)
+		bucket.succeeded()
+		self.assertEqual(bucket.rate, 6)
+		bucket.set_max_rate(4)
+		self.assertEqual(bucket.rate, 4)
+		for i in range(10):
+			bucket.throttled()
+		self.assertEqual(bucket.rate, bucket.MIN_RATE)
+
+	def test_put_records(self):
+		connection = self.FakeConnection(num_throttled=3)
+		ddstore = self.make_store(connection)
+		dd_table = self.FakeTable('test', 1000)
+		ld_recs = [{'ODF_NAME': 'A', 'ODF_RECNO': i, 'OPEN': i} for i in range(1, 61)]
+
+		ddstore.put_records_multi(dd_table, ld_recs)
+		self.assertEqual(len(connection.d_items), 60)
+		self.assertEqual(connection.d_items[('A', 60)]['OPEN'], 60)
+		self.assertTrue(max(connection.l_batch_sizes) <= ddstore.BATCH_WRITE_SIZE)
+		# Each throttled write backs off, and slows down the shared bucket.
+		self.assertEqual(len(ddstore.l_sleeps), 3)
+		self.assertTrue(ddstore.get_write_bucket(dd_table).rate < 1000)
+
+	def test_put_records_gives_up(self):
+		import dd
+		ddstore = self.make_store(self.FakeConnection(num_throttled=1000))
+		ddstore.WRITE_MAX_RETRIES = 2
+		dd_table = self.FakeTable('test', 100)
+		ld_recs = [{'ODF_NAME': 'A', 'ODF_RECNO': i, 'OPEN': i} for i in range(1, 11)]
+		self.assertRaises(dd.ODFException, ddstore.put_records, ddstore.connection, 
+							dd_table, ld_recs)
+		self.assertEqual(len(ddstore.l_sleeps), 2)
+
+	def test_put_records_multi_reuses_pool(self):
+		import dd
+		connection = self.FakeConnection(num_throttled=0)
+		ddstore = self.make_store(connection)
+		dd_table = self.FakeTable('test', 1000)
+		ld_recs = [{'ODF_NAME': 'A', 'ODF_RECNO': i, 'OPEN': i} for i in range(1, 101)]
+		try:
+			ddstore.put_records_multi(dd_table, ld_recs)
+			iosched = ddstore.iosched
+			ddstore.put_records_multi(dd_table, ld_recs)
+			self.assertIs(ddstore.iosched, iosched)
+			self.assertEqual(len(connection.d_items), 100)
+
+			# A failed partition is reported to the caller.
+			connection.num_throttled = 1000
+			ddstore.WRITE_MAX_RETRIES = 0
+			self.assertRaises(dd.ODFException, ddstore.put_records_multi, dd_table, ld_recs)
+		finally:
+			ddstore.shutdown()
+		self.assertIsNone(ddstore.iosched)
+		self.assertEqual(iosched.l_workers, [])
+
+	def test_thread_connections(self):
+		import dd
+		import threading
+		l_connections = []
+		class FakeDDStore(dd.DDStore):
+			def get_connection(self, **kargs):
+				connection = DDStoreWriteTests.FakeConnection(num_throttled=0)
+				connection.thread = threading.current_thread()
+				l_connections.append(connection)
+				return connection
+		ddstore = FakeDDStore('key', 'secret', 'region')
+		dd_table = self.FakeTable('test', 1000)
+		ld_recs = [{'ODF_NAME': 'A', 'ODF_RECNO': i, 'OPEN': i} for i in range(1, 201)]
+		try:
+			for i in range(5):
+				ddstore.put_records_multi(dd_table, ld_recs)
+				ddstore.put_records_stream(dd_table, iter(ld_recs))
+		finally:
+			ddstore.shutdown()
+
+		# One connection per thread, reused across writes
+		num_connections = ddstore.num_connections
+		self.assertEqual(len(l_connections), num_connections)
+		self.assertEqual(len(set(c.thread for c in l_connections)), num_connections)
+		self.assertTrue(num_connections <= ddstore.num_threads + 1)
+		# The workers write through their own connections only.
+		self.assertIs(ddstore.connection, l_connections[0])
+		self.assertEqual(ddstore.connection.l_batch_sizes, [])
+		d_items = {}
+		for connection in l_connections:
+			d_items.update(connection.d_items)
+		self.assertEqual(len(d_items), 200)
+
+	def test_put_records_stream(self):
+		import io
+		import odf
+		odf_obj = odf.ODF()
+		odf_obj.read_text_stream(io.StringIO(TEST_ODF_TEXT))
+		ld_odf_recs = odf_obj.to_dict('A')
+
+		for write_units in [10, 1000]:
+			connection = self.FakeConnection(num_throttled=2)
+			ddstore = self.make_store(connection)
+			dd_table = self.FakeTable('test', write_units)
+			try:
+				it_odf_recs = odf.ODF().iter_text_stream(io.StringIO(TEST_ODF_TEXT), 'A')
+				num_items = ddstore.put_records_stream(dd_table, it_odf_recs)
+			finally:
+				ddstore.shutdown()
+			self.assertEqual(num_items, len(ld_odf_recs))
+			self.assertEqual(len(connection.d_items), len(ld_odf_recs))
+			for d_odf_rec in ld_odf_recs:
+				self.assertEqual(connection.d_items[('A', d_odf_rec['ODF_RECNO'])], dict(d_odf_rec))
+
+	def test_put_records_stream_duplicates(self):
+		connection = self.FakeConnection(num_throttled=0)
+		ddstore = self.make_store(connection)
+		dd_table = self.FakeTable('test', 1000)
+		ld_recs = [{'ODF_NAME': 'A', 'ODF_RECNO': i % 40, 'OPEN': i} for i in range(200)]
+		try:
+			num_items = ddstore.put_records_stream(dd_table, iter(ld_recs))
+		finally:
+			ddstore.shutdown()
+		self.assertEqual(num_items, 200)
+		# Batches overlap in keys, the last record written for each key wins.
+		self.assertEqual(len(connection.d_items), 40)
+		for recno in range(40):
+			self.assertEqual(connection.d_items[('A', recno)]['OPEN'], 160 + recno)
+		self.assertTrue(max(connection.l_batch_sizes) <= ddstore.BATCH_WRITE_SIZE)
+
+
+class DDStoreTableCacheTests(unittest.TestCase):
+	""" Checks that table handles & the table list are cached between calls.
+	"""
+
+	class FakeCount(list):
+		""" Like boto's TableGenerator for a count query: no items, only a count.
+		"""
+		def __init__(self, count):
+			super(DDStoreTableCacheTests.FakeCount, self).__init__()
+			self.count = count
+
+	class FakeConnection(DDStoreWriteTests.FakeConnection):
+		""" Fake DynamoDB control plane, counting round trips.
+		"""
+		def __init__(self, ls_tables):
+			super(DDStoreTableCacheTests.FakeConnection, self).__init__(num_throttled=0)
+			self.ls_tables = ls_tables
+			self.num_list_tables = 0
+			self.num_refreshes = 0
+
+		def list_tables(self):
+			self.num_list_tables += 1
+			return list(self.ls_tables)
+
+		def create_schema(self, **kargs):
+			return kargs
+
+		def table_from_schema(self, name, schema):
+			connection = self
+			class FakeTable(DDStoreWriteTests.FakeTable):
+				def refresh(self):
+					connection.num_refreshes += 1
+					self.status = "ACTIVE" if self.name in connection.ls_tables else "DELETING"
+
+				def query(self, hash_key, range_key_condition=None, request_limit=None, 
+							max_results=None, scan_index_forward=True, count=False):
+					l_recnos = sorted(recno for (s_name, recno) in connection.d_items 
+										if s_name == hash_key)
+					if range_key_condition is not None:
+						# Only LE is used
+						l_recnos = [recno for recno in l_recnos if recno <= range_key_condition.v1]
+					if not scan_index_forward:
+						l_recnos.reverse()
+					if count:
+						return DDStoreTableCacheTests.FakeCount(len(l_recnos))
+					return [connection.d_items[(hash_key, recno)] 
+								for recno in l_recnos[:max_results]]
+			return FakeTable(name, 10)
+
+		def create_table(self, name, schema, read_units, write_units):
+			self.ls_tables.append(name)
+			return self.table_from_schema(name, schema)
+
+	def test_table_cache(self):
+		import dd
+		import odf
+		l_now = [0]
+		connection = self.FakeConnection(['NYSE'])
+		class FakeDDStore(dd.DDStore):
+			def get_connection(self, **kargs):
+				return connection
+		ddstore = FakeDDStore('key', 'secret', 'region')
+		ddstore.fn_clock = lambda: l_now[0]
+
+		dd_table = ddstore.get_table('NYSE', **odf.ODF.d_odf_dd_schema)
+		self.assertEqual((connection.num_list_tables, connection.num_refreshes), (1, 1))
+		for i in range(10):
+			self.assertIs(ddstore.get_table('NYSE', **odf.ODF.d_odf_dd_schema), dd_table)
+			self.assertEqual(ddstore.list_exchanges(), ['NYSE'])
+		self.assertEqual((connection.num_list_tables, connection.num_refreshes), (1, 1))
+
+		# A new table is looked up with a fresh list, then created.
+		ddstore.get_table('LSE', **odf.ODF.d_odf_dd_schema)
+		self.assertEqual(connection.num_list_tables, 2)
+		self.assertEqual(ddstore.list_exchanges(), ['NYSE', 'LSE'])
+
+		# After the TTL, the status is checked again, once.
+		l_now[0] += ddstore.TABLE_CACHE_TTL
+		self.assertIs(ddstore.get_table('NYSE', **odf.ODF.d_odf_dd_schema), dd_table)
+		self.assertIs(ddstore.get_table('NYSE', **odf.ODF.d_odf_dd_schema), dd_table)
+		self.assertEqual(connection.num_refreshes, 3)
+
+		# Tables that are no longer ACTIVE are dropped from the cache.
+		connection.ls_tables.remove('NYSE')
+		l_now[0] += ddstore.TABLE_CACHE_TTL
+		self.assertIsNone(ddstore.get_cached_table('NYSE'))
+		self.assertEqual(ddstore.list_exchanges(), ['LSE'])
+
+	def test_odf_stamp(self):
+		import dd
+		connection = self.FakeConnection(['NYSE'])
+		class FakeDDStore(dd.DDStore):
+			def get_connection(self, **kargs):
+				return connection
+		ddstore = FakeDDStore('key', 'secret', 'region')
+
+		self.assertIsNone(ddstore.get_odf_stamp('NYSE', 'A'))
+		connection.d_items[('A', 1)] = {'ODF_NAME': 'A', 'ODF_RECNO': 1, 'ODF_OPEN': 5}
+		connection.d_items[('A', 841)] = {'ODF_NAME': 'A', 'ODF_RECNO': 841, 'ODF_CLOSE': 100}
+		connection.d_items[('A', 842)] = {'ODF_NAME': 'A', 'ODF_RECNO': 842, 'ODF_CLOSE': 100}
+		odf_stamp = ddstore.get_odf_stamp('NYSE', 'A')
+		self.assertEqual(odf_stamp, (3, (1, 5, None, None, None, None), (842, None, None, None, 100, None)))
+
+		# The newest record is rewritten.
+		connection.d_items[('A', 842)]['ODF_CLOSE'] = 101
+		odf_stamp_new = ddstore.get_odf_stamp('NYSE', 'A')
+		self.assertNotEqual(odf_stamp_new, odf_stamp)
+
+		# An earlier record is backfilled, keeping the newest record.
+		odf_stamp = odf_stamp_new
+		connection.d_items[('A', 840)] = {'ODF_NAME': 'A', 'ODF_RECNO': 840, 'ODF_CLOSE': 99}
+		odf_stamp_new = ddstore.get_odf_stamp('NYSE', 'A')
+		self.assertNotEqual(odf_stamp_new, odf_stamp)
+
+		# A header is rewritten.
+		odf_stamp = odf_stamp_new
+		connection.d_items[('A', 1)]['ODF_OPEN'] = 6
+		self.assertNotEqual(ddstore.get_odf_stamp('NYSE', 'A'), odf_stamp)
+
+
+class IOSchedulerTests(unittest.TestCase):
+	""" Checks the IO worker pool's futures, backpressure and shutdown.
+	"""
+
+	def test_futures(self):
+		import dd
+		iosched = dd.IOScheduler(num_threads=2)
+		iosched.start_workers()
+		l_workers = list(iosched.l_workers)
+		try:
+			future = iosched.queue_request(pow, [2, 10])
+			self.assertEqual(future.result(timeout=5), 1024)
+			future = iosched.queue_request(int, ['x'])
+			self.assertRaises(ValueError, future.result, 5)
+			# Workers survive a failed task
+			self.assertEqual(iosched.queue_request(abs, [-3]).result(timeout=5), 3)
+		finally:
+			iosched.shutdown()
+		for t in l_workers:
+			self.assertFalse(t.is_alive())
+
+	def test_bounded_queue(self):
+		import dd
+		import queue
+		import threading
+		import time
+		event = threading.Event()
+		iosched = dd.IOScheduler(num_threads=1, max_queue_size=1)
+		iosched.start_workers()
+		try:
+			future_busy = iosched.queue_request(event.wait, [5])
+			# Wait for the worker to pick up the first request.
+			while not future_busy.running():
+				time.sleep(0.01)
+			iosched.queue_request(abs, [-1])
+			self.assertRaises(queue.Full, iosched.queue_request, abs, [-2], True, 0.05)
+			event.set()
+			self.assertTrue(future_busy.result(timeout=5))
+		finally:
+			event.set()
+			iosched.shutdown()
+
+
+class WriteChunkArrTests(unittest.TestCase):
+	""" Checks the vectorised chunk aggregation against the per-recno path.
+	"""
+
+	class FakeS3Store(object):
+		def chunk_file_exists(self, *kargs):
+			return False
+
+	def make_ctx(self, b_modify_ohlcv_flag, b_fixed_point=False, b_dense_chunk_array=False,
+				ohlc_divider=100):
+		import io
+		import types
+		import odf
+		odf_obj = odf.ODF()
+		odf_obj.read_text_stream(io.StringIO(TEST_ODF_TEXT))
+
+		config = types.SimpleNamespace(chunk_size=120, first_jsunnoon=56000,
+							trading_start_recno=840, trading_recs_perday=390,
+							tick=dc.Decimal(1), ohlc_divider=dc.Decimal(ohlc_divider),
+							b_modify_ohlcv_flag=b_modify_ohlcv_flag, last_fced_recno=1,
+							b_fixed_point=b_fixed_point, b_dense_chunk_array=b_dense_chunk_array,
+							highest_recno=odf_obj.get_highest_recno())
+		for L_no in [31, 32, 33, 34, 35, 36, 37, 38, 48, 58, 59, 68, 69]:
+			setattr(config, "b_process_L%d" % L_no, True)
+
+		return types.SimpleNamespace(config=config, odf_obj=odf_obj, odf_jsunnoon=56028,
+							s_odf_basename='TEST-1844608', s3_store=self.FakeS3Store())
+
+	def dump(self, chunk_arr_list):
+		return [(chunk_arr.get_name(), sorted(chunk_arr.d_chunk_arr.items())) 
+					for chunk_arr in chunk_arr_list.l_chunk_list]
+
+	def test_same_chunks(self):
+		import chunk
+		import odf2fce
+		app = odf2fce.Odf2Fce()
+		for b_modify_ohlcv_flag in [False, True]:
+			ctx = self.make_ctx(b_modify_ohlcv_flag)
+			l_array_fce_intervals = app.fill_fce_intervals_array(ctx)
+			l_recnos = list(ctx.odf_obj.get_recnos_within_limits(ctx.config))
+
+			chunk_arr_list = chunk.ChunkArrayList()
+			for odf_recno in l_recnos:
+				app.write_chunk_arr(ctx, odf_recno, chunk_arr_list, l_array_fce_intervals)
+
+			for b_fixed_point in [False, True]:
+				ctx = self.make_ctx(b_modify_ohlcv_flag, b_fixed_point)
+				chunk_arr_list_vec = app.write_chunk_arrs(ctx, l_recnos, chunk.ChunkArrayList(), l_array_fce_intervals)
+
+				self.assertEqual(self.dump(chunk_arr_list_vec), self.dump(chunk_arr_list))
+
+	def test_off_grid_prices(self):
+		import chunk
+		import odf
+		import odf2fce
+		app = odf2fce.Odf2Fce()
+		# Prices like 100.25 are not on the 1/10 grid.
+		self.assertRaises(odf.ODFOffGridPrice, odf.to_fixed, '100.25', 10)
+		self.assertEqual(odf.to_fixed('100.2', 10), 1002)
+
+		ctx = self.make_ctx(True, ohlc_divider=10)
+		l_array_fce_intervals = app.fill_fce_intervals_array(ctx)
+		l_recnos = list(ctx.odf_obj.get_recnos_within_limits(ctx.config))
+		chunk_arr_list = app.write_chunk_arrs(ctx, l_recnos, chunk.ChunkArrayList(), l_array_fce_intervals)
+
+		ctx = self.make_ctx(True, b_fixed_point=True, ohlc_divider=10)
+		with self.assertLogs('odf2fce', level='WARNING'):
+			chunk_arr_list_fixed = app.write_chunk_arrs(ctx, l_recnos, chunk.ChunkArrayList(), l_array_fce_intervals)
+		self.assertEqual(self.dump(chunk_arr_list_fixed), self.dump(chunk_arr_list))
+
+	def test_dense_short_chunks(self):
+		import chunk
+		import odf2fce
+		app = odf2fce.Odf2Fce()
+		key = b'\xb6\x02'
+		l_bufs = []
+		for b_dense_chunk_array in [False, True]:
+			ctx = self.make_ctx(True, b_dense_chunk_array=b_dense_chunk_array)
+			l_array_fce_intervals = app.fill_fce_intervals_array(ctx)
+			l_recnos = list(ctx.odf_obj.get_recnos_within_limits(ctx.config))
+			chunk_arr_list = app.write_chunk_arrs(ctx, l_recnos, chunk.ChunkArrayList(), l_array_fce_intervals)
+			chunk_arr_short_list = app.get_chunk_arr_short_list(ctx, chunk_arr_list)
+			l_bufs.append([(chunk_arr.get_name(), chunk_arr.to_bin_short(key), chunk_arr.to_csv())
+							for chunk_arr in chunk_arr_short_list.l_chunk_list])
+
+		self.assertTrue(l_bufs[0])
+		self.assertEqual(l_bufs[1], l_bufs[0])
+
+
 if __name__ == '__main__':
 	unittest.main()
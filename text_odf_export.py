@@ -146,7 +146,7 @@ class TextODFExporter(object):
 		""" Convert the text csv's in the root directory to binary ODFs on local storage.
 		"""
 		log.debug("Creating ODFProcessor")
-		proc = ODFProcessor(ddstore=None)
+		proc = ODFProcessor(ddstore=None, b_odf_array_store=self.config.b_odf_array_store)
 
 		proc.for_all_odfs_txt(s_root_dir=self.config.s_local_dd_data_root, 
 								fn_do=proc.convert_txt2bin,
@@ -174,12 +174,15 @@ class TextODFExporter(object):
 							write_units_opt)
 
 		log.debug("Creating ODFProcessor")
-		proc = ODFProcessor(ddstore)
+		proc = ODFProcessor(ddstore, self.config.b_odf_array_store)
 
-		proc.for_all_odfs_txt(s_root_dir=self.config.s_local_dd_data_root,
-								fn_do=proc.convert_txt2dd,
-								b_show=self.b_show,
-								b_dd_out=True)	
+		try:
+			proc.for_all_odfs_txt(s_root_dir=self.config.s_local_dd_data_root,
+									fn_do=proc.convert_txt2dd,
+									b_show=self.b_show,
+									b_dd_out=True)	
+		finally:
+			ddstore.shutdown()
 
 	def execute(self):
 		""" Execute the commands passed on the command line.